@@ -1,60 +1,93 @@
-import os
-from datetime import datetime
+import csv
+import hashlib
+import hmac
+import json
+import secrets
 from urllib.parse import urlencode
 
 from authlib.flask.client import OAuth
-from flask import Flask, redirect, session, url_for
-from flask_admin import Admin
+from flask import (Flask, Response, abort, current_app, has_request_context,
+                   jsonify, redirect, request, session, url_for)
+from flask_admin import Admin, BaseView, expose
 from flask_admin.base import MenuLink
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.contrib.sqla.filters import BaseSQLAFilter
 from flask_admin.model.widgets import XEditableWidget
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, inspect, or_, select
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.sql.functions import func
 from werkzeug.exceptions import BadRequestKeyError
+from wtforms.validators import ValidationError
+
+import api
+import bulk_actions
+import bulk_import
+import client_codes
+import config
+import database
+import filter_options
+import id_tokens
+import metrics
+import org_chart
+import search
+import sessions
+import table_versions
+import workload
+from bulk_actions import (BulkAction, BulkActionError, BulkActionsMixin,
+                          BulkField)
+from keyset_pagination import KeysetPaginationMixin
+from list_cache import ListCacheMixin
+from models import (Client, Employee, Office, Product,
+                    t_client_product_association)
+from query_budget import query_budget
+from row_counts import CountStrategyMixin
+from search import IndexedSearchMixin
+from streaming_export import StreamingExportMixin
+from typeahead import PrefixAjaxModelLoader, TypeaheadMixin
+
+
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy using the process-wide engine from database.py
+        instead of building its own pool
+    """
 
-from models import Client, Employee, Product
-
-
-def make_secret_key():
-    key = os.urandom(24).hex()
-    return (key)
+    def get_engine(self, app=None, bind=None):
+        return database.engine
 
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', make_secret_key())
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
-    'DATABASE_URL', ('postgres://account_admin_user@localhost:5454'
-                     '/account_admin'))
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+db = SharedEngineSQLAlchemy()
 
 
 """ Auth0 setup and methods
 """
-AUTH0_CALLBACK_URL = os.getenv('AUTH0_CALLBACK_URL')
-AUTH0_CLIENT_ID = os.getenv('AUTH0_CLIENT_ID')
-AUTH0_CLIENT_SECRET = os.getenv('AUTH0_CLIENT_SECRET')
-AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
-AUTH0_BASE_URL = 'https://' + AUTH0_DOMAIN
-AUTH0_AUDIENCE = os.getenv('AUTH0_AUDIENCE', AUTH0_BASE_URL + '/userinfo')
-
-oauth = OAuth(app)
-
-auth0 = oauth.register(
-    'auth0',
-    client_id=AUTH0_CLIENT_ID,
-    client_secret=AUTH0_CLIENT_SECRET,
-    api_base_url=AUTH0_BASE_URL,
-    access_token_url=AUTH0_BASE_URL + '/oauth/token',
-    authorize_url=AUTH0_BASE_URL + '/authorize',
-    client_kwargs={
-        'scope': 'openid email profile',
-    },
-)
-
-
-@app.route('/')
+
+
+def register_auth0(app):
+    """ Register the Auth0 OAuth client for `app`, and the key set its ID
+        tokens are verified with
+    """
+    base_url = app.config['AUTH0_BASE_URL']
+    oauth = OAuth(app)
+    app.extensions['auth0'] = oauth.register(
+        'auth0',
+        client_id=app.config['AUTH0_CLIENT_ID'],
+        client_secret=app.config['AUTH0_CLIENT_SECRET'],
+        api_base_url=base_url,
+        access_token_url=base_url + '/oauth/token',
+        authorize_url=base_url + '/authorize',
+        client_kwargs={
+            'scope': 'openid email profile',
+        },
+    )
+    app.extensions['auth0_keys'] = id_tokens.KeySet(
+        base_url + '/.well-known/jwks.json')
+
+
+def auth0():
+    return current_app.extensions['auth0']
+
+
 def index():
     if 'profile' in session:
         return redirect('/admin/client/?flt0_0=1')
@@ -62,40 +95,74 @@ def index():
         return redirect('/login')
 
 
-@app.route('/callback')
+ACCESS_DENIED = ('<h1>Access denied</h1>'
+                 '<p>Please <a href="/login">login</a> '
+                 'with a valid adops.com account</p>')
+LOGIN_UNAVAILABLE = ('<h1>Login unavailable</h1>'
+                     '<p>Please <a href="/login">try again</a> '
+                     'in a minute</p>')
+
+
 def callback_handling():
+    # without the nonce login() set the ID token could be a replayed one
+    nonce = session.pop('nonce', None)
+    if not nonce:
+        return ACCESS_DENIED, 400
     try:
-        auth0.authorize_access_token()
+        token = auth0().authorize_access_token()
     except BadRequestKeyError:
-        return ('<h1>Access denied</h1>'
-                '<p>Please <a href="/login">login</a> '
-                'with a valid adops.com account</p>'), 400
-    resp = auth0.get('userinfo')
-    userinfo = resp.json()
-
-    session['jwt_payload'] = userinfo
+        return ACCESS_DENIED, 400
+    try:
+        claims = id_tokens.verify(
+            token.get('id_token'),
+            current_app.extensions['auth0_keys'],
+            issuer=current_app.config['AUTH0_BASE_URL'] + '/',
+            audience=current_app.config['AUTH0_CLIENT_ID'],
+            nonce=nonce)
+    except id_tokens.InvalidIDToken:
+        return ACCESS_DENIED, 400
+    except id_tokens.KeysUnavailable:
+        return LOGIN_UNAVAILABLE, 503
+
+    sessions.rotate()
     session['profile'] = {
-        'user_id': userinfo['sub'],
-        'name': userinfo['name'],
-        'email': userinfo['email']
+        'user_id': claims['sub'],
+        'name': claims['name'],
+        'email': claims['email']
     }
     return redirect('/admin/client/?flt0_0=1')
 
 
-@app.route('/login')
 def login():
-    return auth0.authorize_redirect(
-        redirect_uri=AUTH0_CALLBACK_URL, audience=AUTH0_AUDIENCE)
+    session['nonce'] = secrets.token_urlsafe(16)
+    return auth0().authorize_redirect(
+        redirect_uri=current_app.config['AUTH0_CALLBACK_URL'],
+        audience=current_app.config['AUTH0_AUDIENCE'],
+        nonce=session['nonce'])
 
 
-@app.route('/logout')
 def logout():
     session.clear()
     params = {
         'returnTo': url_for('index', _external=True, _scheme='https'),
-        'client_id': AUTH0_CLIENT_ID
+        'client_id': current_app.config['AUTH0_CLIENT_ID']
     }
-    return redirect(auth0.api_base_url + '/v2/logout?' + urlencode(params))
+    return redirect(auth0().api_base_url + '/v2/logout?' + urlencode(params))
+
+
+def pool_stats():
+    if 'profile' not in session:
+        return redirect('/login')
+    return jsonify(database.pool_stats())
+
+
+ROUTES = [
+    ('/', index),
+    ('/callback', callback_handling),
+    ('/login', login),
+    ('/logout', logout),
+    ('/pool-stats', pool_stats),
+]
 
 
 class AuthMixin():
@@ -129,45 +196,202 @@ def get_products():
     return [(str(product), product) for product in products]
 
 
-def generate_code(client):
-    """ Generate OAO Standard Client code value from
-        - First 2 letters of assigned account name
-        - Start year
-        - sum of unicode values of org name, modulo 999, zero-padded
+def get_account_leads():
+    return [(mgr.person_id, str(mgr)) for mgr in client_managers()]
+
+
+def get_employee_managers():
+    return [(str(mgr.person_id), str(mgr)) for mgr in employee_managers()]
+
+
+def get_product_ids():
+    return [(str(product_id), name) for product_id, name in product_choices()]
+
+
+""" Helper functions for bulk action forms
+"""
+YES_NO = [('1', 'Yes'), ('0', 'No')]
+LEAD_ROLES = [('primary', 'Account Lead'), ('secondary', 'Secondary Lead')]
+
+
+def lead_choices():
+    return [('', 'None')] + account_lead_options()
+
+
+def product_choices():
+    products = db.session.query(Product.product_type_id,
+                                Product.product_type_name).order_by(
+                                    Product.product_type_name)
+    return list(products)
+
+
+def parse_id(value, required=None):
+    """ Integer id from a bulk action form value, None if blank unless
+        `required` names what is missing
     """
-    if client.client_organization_code:
-        # no-op if client already has a code
-        return client.client_organization_code
-    norm_name = client.assigned_account_name.upper().strip().replace(
-        'THE ', '')
-    abbrev_name = norm_name[:2]
+    if not value:
+        if required:
+            raise BulkActionError('Choose a {0}'.format(required))
+        return None
     try:
-        start_year = client.contract_start_date.year
-    except AttributeError:
-        start_year = datetime.now().year
-    suffix = str(
-        sum(bytearray(client.client_organization_name, 'utf-8')) %
-        999).zfill(3)
-    client_code = '{0}{1}-{2}'.format(abbrev_name, start_year, suffix)
-    return client_code
+        return int(value)
+    except ValueError:
+        raise BulkActionError('Invalid id: {0}'.format(value))
+
+
+def find_employee(email):
+    """ Current employee with `email`, ignoring case, or None if blank
+    """
+    if not email:
+        return None
+    employee = db.session.query(Employee).filter(
+        func.lower(Employee.email) == email.lower(),
+        Employee.current_employee_flag.is_(True)).first()
+    if employee is None:
+        raise BulkActionError('No current employee has email ' + email)
+    return employee
+
+
+""" Typeahead picker settings
+"""
+EMPLOYEE_FIELDS = ['email', 'first_name', 'last_name']
+CURRENT_LEADS = [
+    Employee.account_manager_flag.is_(True),
+    Employee.current_employee_flag.is_(True)
+]
+
+""" Filter option providers, loaded on first use and cached per process.
+    Invalidated from the Employee and Product on_model_change hooks.
+"""
+account_lead_options = filter_options.register('account_leads',
+                                               get_account_leads)
+product_options = filter_options.register('products', get_products)
+product_id_options = filter_options.register('product_ids', get_product_ids)
+# Keyed on the person table version, so edits in this process show up at once
+manager_options = filter_options.register(
+    'employee_managers',
+    get_employee_managers,
+    version=lambda: table_versions.get('person'))
+
+_manager_choices = {}
+
+
+def manager_choices():
+    """ JSON body and ETag for the x-editable manager choices,
+        re-serialized only when the cached options are reloaded
+    """
+    options = manager_options()
+    if _manager_choices.get('options') is not options:
+        choices = [dict(value='__None', text='')]
+        choices += [dict(value=value, text=text) for value, text in options]
+        body = json.dumps(choices)
+        _manager_choices.update(
+            options=options,
+            body=body,
+            etag=hashlib.md5(body.encode('utf-8')).hexdigest())
+    return _manager_choices['body'], _manager_choices['etag']
 
 
 """ Custom filter classes for ClientAdmin view
 """
 
 
-class ProductFilter(BaseSQLAFilter):
+class LazyOptionsFilter(BaseSQLAFilter):
+    """ Filter whose options are only resolved while handling a request,
+        so building the view at import time does not query the database
+    """
+
+    def get_options(self, view):
+        if not has_request_context():
+            return None
+        return super().get_options(view)
+
+
+class IdListFilter(LazyOptionsFilter):
+    """ Filter on a comma separated list of ids, picked from the filter's
+        options in a tags input, matching rows with any of them, or with
+        all of them if `match_all` is set
+    """
+
+    def __init__(self, column, name, options=None, match_all=False):
+        super().__init__(column, name, options, data_type='select2-tags')
+        self.match_all = match_all
+
+    def clean(self, value):
+        ids = sorted({int(part) for part in value.split(',') if part.strip()})
+        if not ids:
+            raise ValueError('No ids in filter value')
+        return ids
+
+
+def clients_with_products(product_ids, match_all=False):
+    """ Select of the ids of clients with any product in `product_ids`, a
+        list or a select of ids, or with every one if `match_all` is set,
+        as a single semi-join on the association table, grouped for
+        `match_all`
+    """
+    association = t_client_product_association
+    clients = select([association.c.client_organization_id]).where(
+        association.c.product_type_id.in_(product_ids))
+    if match_all:
+        # (product, client) is the primary key, so rows count products
+        clients = clients.group_by(
+            association.c.client_organization_id).having(
+                func.count() == len(product_ids))
+    return clients
+
+
+class ProductsFilter(IdListFilter):
+    def apply(self, query, value, alias=None):
+        return query.filter(
+            Client.client_organization_id.in_(
+                clients_with_products(value, self.match_all)))
+
+    def operation(self):
+        return 'includes all of' if self.match_all else 'includes any of'
+
+
+class AccountLeadsFilter(IdListFilter):
+    """ Clients with any of the people as primary or secondary lead, or
+        with each of them as one or the other
+    """
+
+    def apply(self, query, value, alias=None):
+        if self.match_all:
+            return query.filter(
+                and_(*[(Client.account_manager_id == person_id)
+                       | (Client.secondary_manager_id == person_id)
+                       for person_id in value]))
+        return query.filter(
+            or_(
+                Client.account_manager_id.in_(value),
+                Client.secondary_manager_id.in_(value)))
+
+    def operation(self):
+        return 'is all of' if self.match_all else 'is any of'
+
+
+class ProductFilter(LazyOptionsFilter):
+    """ A single product by name, kept so saved filter URLs still work
+    """
+
     def apply(self, query, value, alias=None):
-        return query.filter(Client.products.any(product_type_name=value))
+        product_ids = select([Product.product_type_id
+                              ]).where(Product.product_type_name == value)
+        return query.filter(
+            Client.client_organization_id.in_(
+                clients_with_products(product_ids)))
 
     def operation(self):
         return 'includes'
 
 
-class AccountLeadFilter(BaseSQLAFilter):
+class AccountLeadFilter(LazyOptionsFilter):
     def apply(self, query, value, alias=None):
-        return query.filter((Client.account_manager.has(person_id=value))
-                            | (Client.secondary_manager.has(person_id=value)))
+        # compare the foreign keys, which are indexed, rather than EXISTS
+        # subqueries on person run for every client
+        return query.filter((Client.account_manager_id == value)
+                            | (Client.secondary_manager_id == value))
 
     def operation(self):
         return 'equals'
@@ -177,7 +401,61 @@ class AccountLeadFilter(BaseSQLAFilter):
 """
 
 
-class ClientAdmin(AuthMixin, ModelView):
+class LazyFilterOptionsMixin():
+    """ Refresh LazyOptionsFilter options each time the filter groups
+        are rendered. Providers are cached, so this is cheap.
+    """
+
+    def _get_filter_groups(self):
+        if self._filter_groups:
+            for group in self._filter_groups.values():
+                for item in group:
+                    flt = self._filters[item['index']]
+                    if isinstance(flt, LazyOptionsFilter):
+                        item['options'] = flt.get_options(self) or None
+        return super()._get_filter_groups()
+
+
+EAGER_LOADERS = dict(joined=joinedload, selectin=selectinload)
+
+
+class EagerLoadMixin():
+    """ Eager-load the relationships in `column_eager_load`, a dict of
+        relationship name to 'joined' or 'selectin', on the view query.
+        Export goes through get_list too, so it loads the same way.
+    """
+    column_eager_load = {}
+
+    def get_query(self):
+        query = super().get_query()
+        for name, strategy in self.column_eager_load.items():
+            loader = EAGER_LOADERS[strategy]
+            query = query.options(loader(getattr(self.model, name)))
+        return query
+
+
+class QueryBudgetMixin():
+    """ Raise QueryBudgetExceeded when the list view runs more than
+        `list_query_budget` statements, if ENFORCE_QUERY_BUDGET is set
+        or the app is in testing mode
+    """
+    list_query_budget = None
+
+    @expose('/')
+    def index_view(self):
+        enforce = (current_app.config.get('ENFORCE_QUERY_BUDGET')
+                   or current_app.testing)
+        if self.list_query_budget is None or not enforce:
+            return super().index_view()
+        with query_budget(self.list_query_budget,
+                          '{0}.index_view'.format(type(self).__name__)):
+            return super().index_view()
+
+
+class ClientAdmin(AuthMixin, BulkActionsMixin, TypeaheadMixin, ListCacheMixin,
+                  LazyFilterOptionsMixin, EagerLoadMixin, QueryBudgetMixin,
+                  StreamingExportMixin, CountStrategyMixin,
+                  IndexedSearchMixin, KeysetPaginationMixin, ModelView):
     # Hide from menu, so we can replace with filtered view link
     def is_visible(self):
         return False
@@ -185,6 +463,16 @@ class ClientAdmin(AuthMixin, ModelView):
     can_export = True
     edit_modal = True
 
+    column_eager_load = dict(
+        account_manager='joined', secondary_manager='joined')
+    count_strategy = 'estimated'
+    # the list cache's version read, count and page, plus the document scan
+    # of the SQLite search fallback; filter options and table checks are
+    # cache loads, counted apart
+    list_query_budget = 4
+    # the page shows lead names and the product filter's options
+    cache_tables = ['client_organization', 'person', 'product_type']
+
     column_list = [
         'client_organization_name', 'client_organization_code',
         'dfp_network_code', 'account_manager', 'secondary_manager',
@@ -212,20 +500,57 @@ class ClientAdmin(AuthMixin, ModelView):
         AccountLeadFilter(
             column='account_manager',
             name='Account Lead',
-            options=[(mgr.person_id, str(mgr))
-                     for mgr in client_managers()]),
+            options=account_lead_options),
         ProductFilter(
             column='products',
             name='Product',
-            options=get_products())
+            options=product_options),
+        # appended, so the filter positions in saved URLs don't move
+        AccountLeadsFilter(
+            column='account_manager',
+            name='Account Lead',
+            options=account_lead_options),
+        AccountLeadsFilter(
+            column='account_manager',
+            name='Account Lead',
+            options=account_lead_options,
+            match_all=True),
+        ProductsFilter(
+            column='products',
+            name='Product',
+            options=product_id_options),
+        ProductsFilter(
+            column='products',
+            name='Product',
+            options=product_id_options,
+            match_all=True)
     ]
     # yapf: enable
 
-    # override WTForms query_factory with filtered manager results
-    # for account_manager
+    # typeahead pickers, so the form doesn't render every lead and product
+    form_ajax_refs = dict(
+        account_manager=PrefixAjaxModelLoader(
+            'account_manager',
+            db.session,
+            Employee,
+            fields=EMPLOYEE_FIELDS,
+            where=CURRENT_LEADS,
+            order_by=Employee.email),
+        secondary_manager=PrefixAjaxModelLoader(
+            'secondary_manager',
+            db.session,
+            Employee,
+            fields=EMPLOYEE_FIELDS,
+            where=CURRENT_LEADS,
+            order_by=Employee.email),
+        products=PrefixAjaxModelLoader(
+            'products',
+            db.session,
+            Product,
+            fields=['product_type_name', 'product_type_code'],
+            order_by=Product.product_type_name))
     form_args = dict(
-        account_manager=dict(
-            label='Account Lead', query_factory=client_managers),
+        account_manager=dict(label='Account Lead'),
         client_organization_code=dict(
             description=(
                 'OAO Standard Client Code: 1st two letters, start year, '
@@ -268,32 +593,96 @@ class ClientAdmin(AuthMixin, ModelView):
         """ Include user email in client created_by or modified_by field
             and calculate the client code
         """
+        # leads before and after the edit, read before generate_code's
+        # queries flush it
+        leads = workload.changed_leads(Client)
         if is_created:
             Client.created_by = session['profile']['email']
         else:
             Client.modified_by = session['profile']['email']
-        Client.client_organization_code = generate_code(Client)
+            # set even if only associations changed, for the change feed
+            Client.modified_datetime = func.now()
+        Client.client_organization_code = client_codes.generate_code(
+            self.session, Client)
+        table_versions.bump('client_organization')
+        # flush to assign an id to new clients before indexing them
+        self.session.flush()
+        search.refresh(self.session, self.model,
+                       [Client.client_organization_id])
+        workload.refresh(self.session, leads)
+
+    def on_model_delete(self, model):
+        table_versions.bump('client_organization')
+
+    bulk_actions = [
+        BulkAction('reassign_lead', 'Reassign lead', [
+            BulkField('role', 'Role', lambda: LEAD_ROLES),
+            BulkField('lead', 'Lead', lead_choices)
+        ]),
+        BulkAction('add_product', 'Add product',
+                   [BulkField('product', 'Product', product_choices)]),
+        BulkAction('remove_product', 'Remove product',
+                   [BulkField('product', 'Product', product_choices)]),
+        BulkAction('set_active', 'Set active',
+                   [BulkField('active', 'Active Client', lambda: YES_NO)]),
+    ]
+
+    def bulk_reassign_lead(self, ids, values):
+        updated = bulk_actions.reassign_lead(
+            self.session, ids, values['role'], parse_id(values['lead']),
+            session['profile']['email'])
+        return '{0} clients reassigned'.format(updated)
+
+    def bulk_add_product(self, ids, values):
+        added, updated = bulk_actions.add_product(
+            self.session, ids, parse_id(values['product'], 'product'),
+            session['profile']['email'])
+        return 'Product added to {0} of {1} clients'.format(added, updated)
+
+    def bulk_remove_product(self, ids, values):
+        removed, updated = bulk_actions.remove_product(
+            self.session, ids, parse_id(values['product'], 'product'),
+            session['profile']['email'])
+        return 'Product removed from {0} of {1} clients'.format(
+            removed, updated)
+
+    def bulk_set_active(self, ids, values):
+        updated = bulk_actions.set_active(self.session, ids,
+                                          values['active'] == '1',
+                                          session['profile']['email'])
+        return '{0} clients updated'.format(updated)
+
+    def after_model_delete(self, model):
+        workload.refresh(self.session, workload.changed_leads(model))
+        self.session.commit()
+        super().after_model_delete(model)
 
 
 class ManagerEditableWidget(XEditableWidget):
     """
     Custom widget for editable Manager field in list view
+
+    Choices are loaded once per page by x-editable from the view's
+    managers endpoint, rather than queried and rendered for every row.
     """
 
     def get_kwargs(self, subfield, kwargs):
-        kwargs = super().get_kwargs(subfield, kwargs)
-        kwargs['data-source'] = [
-            dict(value=e.person_id, text=str(e))
-            for e in list(employee_managers())
-        ]
+        kwargs['data-type'] = 'select2'
+        kwargs['data-source'] = './ajax/managers/'
+        manager = subfield.data
+        kwargs['data-value'] = (str(manager.person_id)
+                                if manager is not None else '__None')
 
         return kwargs
 
 
-class EmployeeAdmin(AuthMixin, ModelView):
+class EmployeeAdmin(AuthMixin, BulkActionsMixin, TypeaheadMixin,
+                    ListCacheMixin, EagerLoadMixin, QueryBudgetMixin,
+                    StreamingExportMixin, CountStrategyMixin,
+                    IndexedSearchMixin, KeysetPaginationMixin, ModelView):
     # override base view query to filter out former employees
     def get_query(self):
-        return self.session.query(self.model).filter(
+        return super().get_query().filter(
             self.model.current_employee_flag.is_(True))
 
     def get_count_query(self):
@@ -303,11 +692,42 @@ class EmployeeAdmin(AuthMixin, ModelView):
     def get_list_form(self):
         return self.scaffold_list_form(widget=ManagerEditableWidget())
 
+    @expose('/ajax/managers/')
+    def ajax_managers(self):
+        """ Manager choices for the editable manager column
+        """
+        body, etag = manager_choices()
+        response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    @expose('/org/<int:person_id>/reports/')
+    def org_reports(self, person_id):
+        return jsonify(org_chart.reports(self.session, person_id))
+
+    @expose('/org/<int:person_id>/chain/')
+    def org_chain(self, person_id):
+        return jsonify(org_chart.chain_of_command(self.session, person_id))
+
+    @expose('/org/<int:person_id>/span/')
+    def org_span(self, person_id):
+        return jsonify(org_chart.span_of_control(self.session, person_id))
+
     can_export = True
     can_delete = False
     can_create = False
     edit_modal = True
 
+    column_eager_load = dict(manager='joined', office='joined')
+    count_strategy = 'cached'
+    # the list cache's version read and page, plus the document scan of
+    # the SQLite search fallback; the cached count is a cache load and
+    # manager choices come from ajax_managers
+    list_query_budget = 3
+    cache_tables = ['person', 'office']
+
     column_list = ['first_name', 'last_name', 'email', 'manager', 'office']
     column_exclude_list = [
         'created_datetime',
@@ -321,7 +741,20 @@ class EmployeeAdmin(AuthMixin, ModelView):
     column_searchable_list = ('first_name', 'last_name', 'email',
                               'office.office_name')
 
-    form_args = dict(manager=dict(query_factory=employee_managers))
+    form_ajax_refs = dict(
+        manager=PrefixAjaxModelLoader(
+            'manager',
+            db.session,
+            Employee,
+            fields=EMPLOYEE_FIELDS,
+            where=[Employee.current_employee_flag.is_(True)],
+            order_by=Employee.email),
+        office=PrefixAjaxModelLoader(
+            'office',
+            db.session,
+            Office,
+            fields=['office_name'],
+            order_by=Office.office_name))
     form_excluded_columns = [
         'created_datetime', 'modified_datetime', 'created_by', 'modified_by',
         'gsuite_id'
@@ -333,11 +766,50 @@ class EmployeeAdmin(AuthMixin, ModelView):
     column_editable_list = ['manager']
     column_labels = dict(account_manager_flag='Account Lead')
 
+    bulk_actions = [
+        BulkAction('set_manager', 'Set manager', [
+            BulkField('manager', 'Manager email (blank for none)', None)
+        ]),
+        BulkAction('set_account_lead', 'Set account lead',
+                   [BulkField('flag', 'Account Lead', lambda: YES_NO)]),
+    ]
+
+    def bulk_set_manager(self, ids, values):
+        manager = find_employee(values['manager'])
+        updated = bulk_actions.set_manager(
+            self.session, ids, manager.person_id if manager else None,
+            session['profile']['email'])
+        return '{0} employees updated'.format(updated)
+
+    def bulk_set_account_lead(self, ids, values):
+        updated = bulk_actions.set_account_lead(self.session, ids,
+                                                values['flag'] == '1',
+                                                session['profile']['email'])
+        return '{0} employees updated'.format(updated)
+
     def on_model_change(self, form, Employee, is_created):
+        if inspect(Employee).attrs.manager.history.has_changes():
+            manager_id = (Employee.manager.person_id
+                          if Employee.manager else None)
+            if org_chart.would_create_cycle(self.session, Employee.person_id,
+                                            manager_id):
+                raise ValidationError(
+                    '{0} cannot report to someone in their own '
+                    'organization'.format(Employee))
+            org_chart.move(self.session, Employee.person_id, manager_id)
         if is_created:
             Employee.created_by = session['profile']['email']
         else:
             Employee.modified_by = session['profile']['email']
+            Employee.modified_datetime = func.now()
+        filter_options.invalidate('account_leads')
+        table_versions.bump('person')
+        search.refresh(self.session, self.model, [Employee.person_id])
+        # client documents include the account lead's email
+        search.refresh(
+            self.session, Client,
+            self.session.query(Client.client_organization_id).filter(
+                Client.account_manager_id == Employee.person_id))
 
 
 class ProductAdmin(AuthMixin, ModelView):
@@ -360,23 +832,161 @@ class ProductAdmin(AuthMixin, ModelView):
             Product.created_by = session['profile']['email']
         else:
             Product.modified_by = session['profile']['email']
+            Product.modified_datetime = func.now()
+        filter_options.invalidate('products', 'product_ids')
+        table_versions.bump('product_type')
+        # client documents include product names
+        search.refresh(
+            self.session, Client,
+            self.session.query(
+                t_client_product_association.c.client_organization_id).filter(
+                    t_client_product_association.c.product_type_id ==
+                    Product.product_type_id))
+
+    def on_model_delete(self, Product):
+        filter_options.invalidate('products', 'product_ids')
+        table_versions.bump('product_type')
+
+    def after_model_delete(self, Product):
+        # again after the commit, so options or pages cached in between
+        # don't keep the deleted product
+        filter_options.invalidate('products', 'product_ids')
+        table_versions.bump('product_type')
+
+
+class MetricsView(AuthMixin, BaseView):
+    """ Request and SQL metrics in Prometheus text format, for signed-in
+        users or requests bearing METRICS_TOKEN
+    """
+
+    def is_visible(self):
+        return False
+
+    def is_accessible(self):
+        authorization = request.headers.get('Authorization', '')
+        token = current_app.config['METRICS_TOKEN']
+        if token and hmac.compare_digest(authorization, 'Bearer ' + token):
+            return True
+        return super().is_accessible()
+
+    def inaccessible_callback(self, name, **kwargs):
+        if 'Authorization' in request.headers:
+            abort(403)
+        return super().inaccessible_callback(name, **kwargs)
+
+    @expose('/')
+    def index(self):
+        return Response(
+            metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class WorkloadView(AuthMixin, BaseView):
+    """ Active clients per account lead, as primary and secondary lead
+        and by product, from the workload summary tables
+    """
+    # products listed per lead on the page; the export has them all
+    mix_shown = 5
+
+    @expose('/')
+    def index(self):
+        return self.render(
+            'admin/workload.html',
+            leads=workload.report(db.session),
+            mix_shown=self.mix_shown)
+
+    @expose('/refresh/', methods=['POST'])
+    def refresh(self):
+        workload.refresh(db.session)
+        db.session.commit()
+        return redirect(url_for('.index'))
+
+    @expose('/export/csv/')
+    def export(self):
+        leads = workload.report(db.session)
+        if leads is None:
+            abort(404)
+
+        class Echo():
+            def write(self, line):
+                return line
+
+        writer = csv.writer(Echo())
+        return Response(
+            (writer.writerow(row) for row in workload.matrix(leads)),
+            headers={
+                'Content-Disposition': 'attachment;filename=workload.csv'
+            },
+            mimetype='text/csv')
+
+
+class ImportView(AuthMixin, BaseView):
+    """ Bulk CSV import of clients or products
+    """
+
+    @expose('/', methods=['GET', 'POST'])
+    def index(self):
+        kind = request.form.get('kind', 'clients')
+        dry_run = bool(request.form.get('dry_run'))
+        result = None
+        upload = request.files.get('file')
+        if request.method == 'POST' and upload:
+            if kind not in ('clients', 'products'):
+                abort(400)
+            result = bulk_import.import_csv(
+                db.session, kind, bulk_import.text_stream(upload.stream),
+                session['profile']['email'], dry_run)
+        return self.render(
+            'admin/bulk_import.html',
+            kind=kind,
+            dry_run=dry_run,
+            result=result,
+            client_columns=bulk_import.CLIENT_COLUMNS,
+            product_columns=bulk_import.PRODUCT_COLUMNS)
 
 
 """ Admin app provisioning.
-    - Instantiates Admin globally, for wsgi container
+    - create_app builds the app and its views; nothing in it touches the
+      database, which is first connected to by the first request
     - Order in which views and links are added corresponds to main nav menu
 """
-admin = Admin(
-    app, name='OAO Account Administration', template_mode='bootstrap3')
-
-admin.add_view(ClientAdmin(Client, db.session))
-# custom links for clients, to include active_client_flag filter
-admin.add_link(
-    MenuLink(name='Active', category='Client', url='/admin/client/?flt0_0=1'))
-admin.add_link(MenuLink(name='All', category='Client', url='/admin/client'))
-admin.add_view(EmployeeAdmin(Employee, db.session))
-admin.add_view(ProductAdmin(Product, db.session))
-admin.add_link(MenuLink(name='Logout', url='/logout'))
+
+
+def add_views(admin):
+    admin.add_view(ClientAdmin(Client, db.session))
+    # custom links for clients, to include active_client_flag filter
+    admin.add_link(
+        MenuLink(
+            name='Active', category='Client', url='/admin/client/?flt0_0=1'))
+    admin.add_link(
+        MenuLink(name='All', category='Client', url='/admin/client'))
+    admin.add_view(EmployeeAdmin(Employee, db.session))
+    admin.add_view(ProductAdmin(Product, db.session))
+    admin.add_view(WorkloadView(name='Workload', endpoint='workload'))
+    admin.add_view(ImportView(name='Import', endpoint='import'))
+    admin.add_view(MetricsView(name='Metrics', endpoint='metrics'))
+    admin.add_link(MenuLink(name='Logout', url='/logout'))
+
+
+def create_app(overrides=None):
+    """ Build the app from the environment and `overrides`, a dict of
+        settings; raises config.ConfigError if the settings are invalid
+    """
+    app = Flask(__name__)
+    app.config.update(config.load(overrides))
+    db.init_app(app)
+    sessions.init_app(app)
+    metrics.init_app(app)
+    register_auth0(app)
+    for rule, view in ROUTES:
+        app.add_url_rule(rule, view_func=view)
+    app.register_blueprint(api.blueprint, url_prefix='/api')
+    add_views(
+        Admin(
+            app,
+            name='OAO Account Administration',
+            template_mode='bootstrap3'))
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app(dict(DEBUG=True)).run(debug=True, host='0.0.0.0', port=5000)
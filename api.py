@@ -0,0 +1,370 @@
+""" Read-only JSON API over clients, employees, products and offices.
+
+    - /api/clients/?dfp_network_code=&client_organization_code=
+    - /api/employees/?email=
+    - /api/products/, /api/offices/
+    - /api/<collection>/<id>
+    - /api/<collection>/changes?since=<cursor>
+
+    Lookups go through the dfp_network_code, client code, lower(email) and
+    primary key indexes; unfiltered lists are paged by primary key with
+    `after` and `limit`. Requests need a signed-in session or a Bearer
+    API_TOKEN.
+
+    The changes feeds return rows by (modified_datetime, primary key), which
+    the model change hooks, bulk import and directory sync all maintain, so
+    former employees show up with current_employee_flag false. `next` is
+    the cursor to poll with. modified_datetime is the writing transaction's
+    start time, which can be behind rows already committed, so the feeds
+    only serve rows modified more than CHANGES_FEED_LAG seconds before the
+    database's current time; writes to these tables must commit within
+    that long. migrations.py creates the lookup and feed indexes and
+    backfills modified_datetime.
+
+    Responses carry an ETag, and a Last-Modified when the rows have
+    timestamps, and are answered with 304 when they match the request.
+    Bodies are kept in a process-local LRU cache of API_CACHE_SIZE entries
+    for API_CACHE_TTL seconds, keyed on the versions of the tables they
+    read, so model changes made through this process invalidate them.
+"""
+import functools
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, abort, current_app, request, session
+from sqlalchemy import func, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+
+import table_versions
+from keyset_pagination import decode_cursor, encode_cursor
+from models import Client, Employee, Office, Product
+
+API_CACHE_SIZE = int(os.getenv('API_CACHE_SIZE', 512))
+API_CACHE_TTL = int(os.getenv('API_CACHE_TTL', 60))
+# longer than any transaction writing clients, products or people runs
+CHANGES_FEED_LAG = int(os.getenv('CHANGES_FEED_LAG', 300))
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+blueprint = Blueprint('api', __name__)
+
+CachedResponse = namedtuple('CachedResponse',
+                            ['body', 'etag', 'last_modified', 'expires'])
+
+
+class ResponseCache():
+    """ Least recently used cache of response bodies, each kept for `ttl`
+        seconds
+    """
+
+    def __init__(self, size=None, ttl=None):
+        self.size = API_CACHE_SIZE if size is None else size
+        self.ttl = API_CACHE_TTL if ttl is None else ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, last_modified):
+        entry = CachedResponse(
+            body=body,
+            etag=hashlib.md5(body.encode('utf-8')).hexdigest(),
+            last_modified=last_modified,
+            expires=time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return entry
+
+
+cache = ResponseCache()
+
+
+def db_session():
+    return current_app.extensions['sqlalchemy'].db.session
+
+
+@blueprint.before_request
+def authenticate():
+    authorization = request.headers.get('Authorization', '')
+    token = current_app.config['API_TOKEN']
+    if token and hmac.compare_digest(authorization, 'Bearer ' + token):
+        return None
+    if 'profile' in session:
+        return None
+    abort(401)
+
+
+def cached(*tables):
+    """ Serve the view's (payload, last modified) result as JSON from the
+        response cache, keyed on the request and the versions of `tables`
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))),
+                   tuple(table_versions.get(table) for table in tables))
+            entry = cache.get(key)
+            if entry is None:
+                payload, last_modified = view(**kwargs)
+                entry = cache.put(key,
+                                  json.dumps(
+                                      payload, default=str, sort_keys=True),
+                                  last_modified)
+            response = Response(entry.body, mimetype='application/json')
+            response.set_etag(entry.etag)
+            if entry.last_modified is not None:
+                response.last_modified = entry.last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
+
+
+def last_modified(rows):
+    """ Latest modified or created time of `rows`, or None
+    """
+    times = [
+        row.modified_datetime or row.created_datetime for row in rows
+        if row.modified_datetime or row.created_datetime
+    ]
+    return max(times) if times else None
+
+
+def page_limit():
+    limit = request.args.get('limit', PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page(query, key):
+    """ (rows, next cursor) for one page of `query` ordered by `key`
+    """
+    after = request.args.get('after', type=int)
+    limit = page_limit()
+    if after is not None:
+        query = query.filter(key > after)
+    rows = query.order_by(key).limit(limit).all()
+    cursor = getattr(rows[-1], key.key) if len(rows) == limit else None
+    return rows, cursor
+
+
+def listing(rows, cursor, serialize):
+    return dict(data=[serialize(row) for row in rows], next=cursor)
+
+
+def person_summary(person):
+    if person is None:
+        return None
+    return dict(
+        person_id=person.person_id,
+        email=person.email,
+        first_name=person.first_name,
+        last_name=person.last_name)
+
+
+def client_json(client):
+    return dict(
+        client_organization_id=client.client_organization_id,
+        client_organization_code=client.client_organization_code,
+        client_organization_name=client.client_organization_name,
+        assigned_account_name=client.assigned_account_name,
+        dfp_network_code=client.dfp_network_code,
+        dfp_display_name=client.dfp_display_name,
+        active_client_flag=client.active_client_flag,
+        contract_start_date=client.contract_start_date,
+        contract_end_date=client.contract_end_date,
+        account_manager=person_summary(client.account_manager),
+        secondary_manager=person_summary(client.secondary_manager),
+        products=sorted(p.product_type_code for p in client.products))
+
+
+def employee_json(employee):
+    summary = person_summary(employee)
+    summary.update(
+        account_manager_flag=employee.account_manager_flag,
+        current_employee_flag=employee.current_employee_flag,
+        manager=person_summary(employee.manager),
+        office=employee.office.office_name if employee.office else None)
+    return summary
+
+
+def product_json(product):
+    return dict(
+        product_type_id=product.product_type_id,
+        product_type_code=product.product_type_code,
+        product_type_name=product.product_type_name,
+        product_type_description=product.product_type_description)
+
+
+def office_json(office):
+    return dict(office_id=office.office_id, office_name=office.office_name)
+
+
+def one(query, serialize):
+    row = query.first()
+    if row is None:
+        abort(404)
+    return serialize(row), last_modified([row])
+
+
+def client_query():
+    return db_session().query(Client).options(
+        joinedload(Client.account_manager),
+        joinedload(Client.secondary_manager), selectinload(Client.products))
+
+
+def employee_query():
+    return db_session().query(Employee).options(
+        joinedload(Employee.manager), joinedload(Employee.office))
+
+
+@blueprint.route('/clients/')
+@cached('client_organization', 'person', 'product_type')
+def clients():
+    query = client_query()
+    if 'dfp_network_code' in request.args:
+        network_code = request.args.get('dfp_network_code', type=int)
+        if network_code is None:
+            abort(400)
+        query = query.filter(Client.dfp_network_code == network_code)
+    if 'client_organization_code' in request.args:
+        query = query.filter(Client.client_organization_code ==
+                             request.args['client_organization_code'])
+    rows, cursor = page(query, Client.client_organization_id)
+    return listing(rows, cursor, client_json), last_modified(rows)
+
+
+@blueprint.route('/clients/<int:client_organization_id>')
+@cached('client_organization', 'person', 'product_type')
+def client(client_organization_id):
+    return one(
+        client_query().filter(
+            Client.client_organization_id == client_organization_id),
+        client_json)
+
+
+@blueprint.route('/employees/')
+@cached('person', 'office')
+def employees():
+    query = employee_query()
+    if 'email' in request.args:
+        query = query.filter(
+            func.lower(Employee.email) == request.args['email'].lower())
+    rows, cursor = page(query, Employee.person_id)
+    return listing(rows, cursor, employee_json), last_modified(rows)
+
+
+@blueprint.route('/employees/<int:person_id>')
+@cached('person', 'office')
+def employee(person_id):
+    return one(employee_query().filter(Employee.person_id == person_id),
+               employee_json)
+
+
+@blueprint.route('/products/')
+@cached('product_type')
+def products():
+    rows, cursor = page(db_session().query(Product), Product.product_type_id)
+    return listing(rows, cursor, product_json), last_modified(rows)
+
+
+@blueprint.route('/products/<int:product_type_id>')
+@cached('product_type')
+def product(product_type_id):
+    return one(db_session().query(Product).filter(
+        Product.product_type_id == product_type_id), product_json)
+
+
+@blueprint.route('/offices/')
+@cached('office')
+def offices():
+    rows, cursor = page(db_session().query(Office), Office.office_id)
+    return listing(rows, cursor, office_json), last_modified(rows)
+
+
+@blueprint.route('/offices/<int:office_id>')
+@cached('office')
+def office(office_id):
+    return one(db_session().query(Office).filter(
+        Office.office_id == office_id), office_json)
+
+
+def changes(query, model, key, serialize):
+    """ Rows of `query` changed after the `since` cursor (or all of them)
+        and at least CHANGES_FEED_LAG seconds ago, oldest first, with the
+        cursor to ask for the next changes with
+    """
+    modified = model.modified_datetime
+    since = request.args.get('since')
+    if since is None:
+        query = query.filter(modified.isnot(None))
+    else:
+        values = decode_cursor(since)
+        try:
+            values[0] = datetime.fromisoformat(values[0])
+        except (TypeError, ValueError):
+            abort(400)
+        if not isinstance(values[1], int) or isinstance(values[1], bool):
+            abort(400)
+        query = query.filter(tuple_(modified, key) > tuple_(*values))
+    # the database's clock, which stamped the rows
+    now = db_session().query(func.now()).scalar()
+    query = query.filter(
+        modified < now - timedelta(seconds=CHANGES_FEED_LAG))
+    rows = query.order_by(modified, key).limit(page_limit()).all()
+    if rows:
+        since = encode_cursor(
+            [rows[-1].modified_datetime,
+             getattr(rows[-1], key.key)])
+    return listing(rows, since, serialize), last_modified(rows)
+
+
+@blueprint.route('/clients/changes')
+@cached('client_organization', 'person', 'product_type')
+def client_changes():
+    return changes(client_query(), Client, Client.client_organization_id,
+                   client_json)
+
+
+@blueprint.route('/employees/changes')
+@cached('person', 'office')
+def employee_changes():
+    return changes(employee_query(), Employee, Employee.person_id,
+                   employee_json)
+
+
+@blueprint.route('/products/changes')
+@cached('product_type')
+def product_changes():
+    return changes(
+        db_session().query(Product), Product, Product.product_type_id,
+        product_json)
+
+
+@blueprint.route('/offices/changes')
+@cached('office')
+def office_changes():
+    return changes(
+        db_session().query(Office), Office, Office.office_id, office_json)
@@ -0,0 +1,3 @@
+""" Benchmarks for account-admin hot paths. Run modules from the repo root,
+    e.g. `python -m benchmarks.suite`.
+"""
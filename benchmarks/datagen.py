@@ -0,0 +1,169 @@
+""" Seeded synthetic data for benchmarks.
+
+    Builds offices, products, employees in a multi-level management tree
+    (some former employees, some account leads), clients with leads,
+    network codes and contract dates, and dense client-product
+    associations, then the search documents, org chart closure table and
+    account lead workload summary.
+    The same seed always gives the same data.
+
+    Works against SQLite, by copying the schema without its Postgres-only
+    server defaults, or Postgres, by creating the id sequences the schema
+    expects and advancing them past the generated ids.
+"""
+import random
+import re
+from datetime import date, datetime
+
+from sqlalchemy import MetaData
+
+import org_chart
+import search
+import workload
+from bulk_import import insert_rows
+from fake_directory import make_user
+from models import (Client, Employee, Office, Product, metadata,
+                    t_client_product_association)
+
+SCALES = dict(
+    small=dict(clients=2000, employees=500, products=50, offices=5),
+    default=dict(clients=50000, employees=10000, products=300, offices=20),
+)
+
+SEQUENCE = re.compile(r"nextval\('(\w+)'")
+WORDS = ('Acme', 'Globex', 'Initech', 'Umbrella', 'Hooli', 'Stark', 'Wayne',
+         'Tyrell', 'Cyberdyne', 'Soylent', 'Wonka', 'Gringotts', 'Monarch',
+         'Vandelay', 'Pied Piper', 'Aperture', 'Black Mesa', 'Oscorp')
+
+
+def sequences():
+    """ (sequence, table, primary key column) for nextval server defaults
+    """
+    for table in metadata.sorted_tables:
+        for column in table.columns:
+            default = column.server_default
+            match = default is not None and SEQUENCE.search(str(default.arg))
+            if match:
+                yield match.group(1), table.name, column.name
+
+
+def sqlite_metadata():
+    """ Copy of the schema without server defaults SQLite can't run
+    """
+    copy = MetaData()
+    for table in metadata.sorted_tables:
+        table.tometadata(copy)
+    for table in copy.tables.values():
+        for column in table.columns:
+            default = column.server_default
+            if default is not None and ('nextval' in str(default.arg)
+                                        or 'now()' in str(default.arg)):
+                column.server_default = None
+    return copy
+
+
+def create_schema(bind):
+    """ Drop and recreate every table
+    """
+    if bind.dialect.name == 'sqlite':
+        schema = sqlite_metadata()
+    else:
+        schema = metadata
+        bind.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for sequence, _, _ in sequences():
+            bind.execute('CREATE SEQUENCE IF NOT EXISTS ' + sequence)
+    schema.drop_all(bind)
+    schema.create_all(bind)
+
+
+def employees(rng, count, offices, now):
+    """ Employee rows; person 1 is the root of the management tree and
+        everyone else reports to someone added before them
+    """
+    rows = []
+    for i in range(1, count + 1):
+        user = make_user(i)
+        manager = rng.randint(max(1, (i - 1) // 10), max(1, (i - 1) // 4))
+        rows.append(
+            dict(
+                person_id=i,
+                person_code=user['id'],
+                first_name=user['name']['givenName'],
+                last_name=user['name']['familyName'],
+                email=user['primaryEmail'],
+                office_id=rng.randint(1, offices),
+                manager_person_id=manager if i > 1 else None,
+                account_manager_flag=rng.random() < 0.1,
+                current_employee_flag=rng.random() >= 0.05,
+                created_datetime=now))
+    return rows
+
+
+def clients(rng, count, leads, now):
+    rows = []
+    network_codes = rng.sample(range(10000, 10000000), count)
+    for i in range(1, count + 1):
+        word = rng.choice(WORDS)
+        rows.append(
+            dict(
+                client_organization_id=i,
+                client_organization_name='{0} {1}'.format(word, i),
+                assigned_account_name=word,
+                account_manager_id=rng.choice(leads),
+                secondary_manager_id=(rng.choice(leads)
+                                      if rng.random() < 0.5 else None),
+                dfp_network_code=network_codes[i - 1],
+                dfp_display_name='{0} Network {1}'.format(word, i),
+                active_client_flag=rng.random() < 0.9,
+                contract_start_date=date(
+                    rng.randint(2012, 2020), rng.randint(1, 12), 1),
+                created_datetime=now))
+    return rows
+
+
+def generate(session, seed=0, clients_count=50000, employees_count=10000,
+             products_count=300, offices_count=20, products_per_client=8):
+    """ Fill an empty schema with seeded data and commit
+    """
+    rng = random.Random(seed)
+    now = datetime(2018, 1, 1)
+
+    insert_rows(session, Office.__table__, [
+        dict(office_id=i, office_name='Office {0}'.format(i),
+             created_datetime=now)
+        for i in range(1, offices_count + 1)
+    ])
+    insert_rows(session, Product.__table__, [
+        dict(
+            product_type_id=i,
+            product_type_code='P{0:03d}'.format(i),
+            product_type_name='Product {0}'.format(i),
+            created_datetime=now) for i in range(1, products_count + 1)
+    ])
+    people = employees(rng, employees_count, offices_count, now)
+    insert_rows(session, Employee.__table__, people)
+
+    leads = [
+        person['person_id'] for person in people
+        if person['account_manager_flag'] and person['current_employee_flag']
+    ]
+    insert_rows(session, Client.__table__,
+                clients(rng, clients_count, leads, now))
+    insert_rows(session, t_client_product_association, [
+        dict(client_organization_id=client_id, product_type_id=product_id)
+        for client_id in range(1, clients_count + 1)
+        for product_id in rng.sample(
+            range(1, products_count + 1),
+            rng.randint(1, products_per_client))
+    ])
+
+    search.refresh(session, Client)
+    search.refresh(session, Employee)
+    org_chart.rebuild(session)
+    workload.refresh(session)
+    if session.get_bind().dialect.name == 'postgresql':
+        for sequence, table, column in sequences():
+            session.execute(
+                "SELECT setval('{0}', (SELECT max({1}) FROM {2}))".format(
+                    sequence, column, table))
+    session.commit()
@@ -0,0 +1,58 @@
+""" Throughput of directory_fetch against a local StubDirectoryServer.
+
+    Fetches every user with users.list, then looks each one up with
+    users.get at increasing worker counts, and reports requests per second.
+"""
+import argparse
+import time
+
+from directory_fetch import DirectoryFetcher, get_users
+from fake_directory import HttpDirectoryService, StubDirectoryServer, make_user
+from google_directory_sync import fetch_users
+
+
+def run(server, workers, qps):
+    fetcher = DirectoryFetcher(
+        lambda: HttpDirectoryService(server.base_url), workers=workers,
+        qps=qps)
+    started_requests = server.requests
+    started = time.monotonic()
+    users = list(fetch_users(fetcher.service(), limiter=fetcher.limiter))
+    get_users(fetcher, [user['id'] for user in users])
+    elapsed = time.monotonic() - started
+    requests = server.requests - started_requests
+    return dict(
+        workers=workers,
+        users=len(users),
+        requests=requests,
+        seconds=elapsed,
+        rate=requests / elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='stub server seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of stub responses that are 429s')
+    parser.add_argument('--qps', type=float, default=1000)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    server = StubDirectoryServer(
+        [make_user(i) for i in range(args.users)],
+        latency=args.latency,
+        error_rate=args.error_rate).start()
+    try:
+        for workers in args.workers:
+            result = run(server, workers, args.qps)
+            print('{workers:>3} workers: {users} users, {requests} requests '
+                  'in {seconds:.2f}s ({rate:.1f} req/s)'.format(**result))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
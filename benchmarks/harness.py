@@ -0,0 +1,110 @@
+""" Timing, query counting and baseline comparison for benchmark cases.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_queries = [0]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _queries[0] += 1
+
+
+class Result():
+    """ Latencies in seconds and query counts of a case's runs
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+
+    @contextmanager
+    def run(self):
+        queries = _queries[0]
+        started = time.perf_counter()
+        yield
+        self.latencies.append(time.perf_counter() - started)
+        self.queries.append(_queries[0] - queries)
+
+    def percentile(self, fraction):
+        """ Nearest-rank percentile of the latencies
+        """
+        ordered = sorted(self.latencies)
+        rank = max(1, int(round(fraction * len(ordered))))
+        return ordered[rank - 1]
+
+    def summary(self):
+        return dict(
+            runs=len(self.latencies),
+            p50=self.percentile(0.5),
+            p90=self.percentile(0.9),
+            p99=self.percentile(0.99),
+            mean=sum(self.latencies) / len(self.latencies),
+            queries=max(self.queries))
+
+
+def measure(name, case, repeat, warmup=1):
+    """ Run `case` `warmup` times untimed, then `repeat` times timed
+    """
+    for _ in range(warmup):
+        case()
+    result = Result(name)
+    for _ in range(repeat):
+        with result.run():
+            case()
+    return result
+
+
+def load_baseline(path):
+    with open(path) as baseline:
+        return json.load(baseline)
+
+
+def save_baseline(path, summaries):
+    with open(path, 'w') as baseline:
+        json.dump(summaries, baseline, indent=2, sort_keys=True)
+
+
+def regressions(summary, baseline, tolerance):
+    """ Reasons `summary` is worse than `baseline` beyond `tolerance`, a
+        fraction of the baseline p50
+    """
+    reasons = []
+    if summary['p50'] > baseline['p50'] * (1 + tolerance):
+        reasons.append('p50 {0:+.0%}'.format(
+            summary['p50'] / baseline['p50'] - 1))
+    if summary['queries'] > baseline['queries']:
+        reasons.append('queries {0} -> {1}'.format(baseline['queries'],
+                                                   summary['queries']))
+    return reasons
+
+
+def report(summaries, baseline=None, tolerance=0.2):
+    """ Print a table of `summaries` by case, compared with `baseline` if
+        given; returns the names of cases that regressed
+    """
+    print('{0:<28} {1:>5} {2:>9} {3:>9} {4:>9} {5:>8}  {6}'.format(
+        'case', 'runs', 'p50 ms', 'p90 ms', 'p99 ms', 'queries',
+        'vs baseline' if baseline else ''))
+    regressed = []
+    for name, summary in summaries.items():
+        comparison = ''
+        if baseline and name in baseline:
+            reasons = regressions(summary, baseline[name], tolerance)
+            if reasons:
+                regressed.append(name)
+                comparison = 'REGRESSED: ' + ', '.join(reasons)
+            else:
+                comparison = 'p50 {0:+.0%}'.format(
+                    summary['p50'] / baseline[name]['p50'] - 1)
+        print('{0:<28} {1:>5} {2:>9.1f} {3:>9.1f} {4:>9.1f} {5:>8}  {6}'.
+              format(name, summary['runs'], summary['p50'] * 1000,
+                     summary['p90'] * 1000, summary['p99'] * 1000,
+                     summary['queries'], comparison))
+    return regressed
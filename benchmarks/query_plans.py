@@ -0,0 +1,103 @@
+""" Query plans for the admin's hot queries.
+
+    hot_queries builds each query the same way the admin does, and explain
+    EXPLAINs one on Postgres with sequential scans disabled while planning,
+    so a sequential scan still showing up means no index can serve the
+    query whatever the table sizes; a whole index read only to filter its
+    rows counts as one too. tests/test_query_plans.py checks every hot
+    query this way when the tests run against Postgres (TEST_DATABASE_URL).
+"""
+import json
+
+from benchmarks.suite import SETTINGS
+
+PAGE_SIZE = 20
+
+
+def hot_queries(session):
+    """ Unexecuted queries by name, as the list pages, filters and lookups
+        build them
+    """
+    from admin_app import (AccountLeadFilter, AccountLeadsFilter,
+                           ClientAdmin, EmployeeAdmin, ProductFilter,
+                           ProductsFilter, create_app, employee_managers)
+    from models import Client, Employee, Product
+
+    app = create_app(SETTINGS)
+    views = app.extensions['admin'][0]._views
+    clients = next(v for v in views if isinstance(v, ClientAdmin))
+    employees = next(v for v in views if isinstance(v, EmployeeAdmin))
+    lead_filter = next(
+        f for f in clients._filters if isinstance(f, AccountLeadFilter))
+    product_filter = next(
+        f for f in clients._filters if isinstance(f, ProductFilter))
+    products_all_filter = next(
+        f for f in clients._filters
+        if isinstance(f, ProductsFilter) and f.match_all)
+    leads_any_filter = next(
+        f for f in clients._filters
+        if isinstance(f, AccountLeadsFilter) and not f.match_all)
+
+    lead = session.query(Employee.person_id).filter(
+        Employee.account_manager_flag.is_(True)).limit(1).scalar()
+    product = session.query(Product.product_type_name).limit(1).scalar()
+    product_ids = [
+        product_id
+        for product_id, in session.query(Product.product_type_id).limit(3)
+    ]
+    leads = [
+        person_id for person_id, in session.query(Employee.person_id).filter(
+            Employee.account_manager_flag.is_(True)).limit(3)
+    ]
+    client = session.query(Client).limit(1).one()
+    code = session.query(Employee.gsuite_id).limit(1).scalar()
+
+    def client_page(query):
+        return query.order_by(Client.client_organization_name,
+                              Client.client_organization_id).limit(PAGE_SIZE)
+
+    with app.app_context():
+        yield 'client_list_active', client_page(clients.get_query().filter(
+            Client.active_client_flag.is_(True)))
+        yield 'client_filter_lead', client_page(
+            lead_filter.apply(clients.get_query(), lead))
+        yield 'client_filter_product', client_page(
+            product_filter.apply(clients.get_query(), product))
+        yield 'client_filter_products_all', client_page(
+            products_all_filter.apply(clients.get_query(), product_ids))
+        yield 'client_filter_leads_any', client_page(
+            leads_any_filter.apply(clients.get_query(), leads))
+        yield 'client_products', session.query(Product).with_parent(
+            client, 'products')
+        yield 'employee_list', employees.get_query().order_by(
+            Employee.email, Employee.person_id).limit(PAGE_SIZE)
+        yield 'employee_managers', employee_managers()
+        yield 'employee_by_gsuite_id', session.query(Employee).filter_by(
+            gsuite_id=code)
+
+
+def explain(connection, dialect, query):
+    """ (plan text, names of tables read by a sequential scan or a
+        filtered full index scan)
+    """
+    compiled = query.statement.compile(dialect=dialect)
+    if compiled.positional:
+        params = [compiled.params[name] for name in compiled.positiontup]
+    else:
+        params = compiled.params
+    cursor = connection.cursor()
+    cursor.execute('SET LOCAL enable_seqscan = off')
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + str(compiled), params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        if node['Node Type'] == 'Seq Scan' or (
+                node['Node Type'] in ('Index Scan', 'Index Only Scan')
+                and 'Index Cond' not in node and 'Filter' in node):
+            scans.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return json.dumps(plan, indent=2), scans
@@ -0,0 +1,299 @@
+""" Latency and query count benchmarks for the admin's hot paths, over a
+    seeded synthetic dataset (see benchmarks.datagen).
+
+    Covers app startup in a fresh interpreter, the client list with its
+    single and multi-value filters, search and CSV export, and served from
+    the list page cache, the client edit form and its lead typeahead, the
+    employee list with the editable manager column and its choices, the
+    account lead workload report, bulk client code generation, a bulk lead
+    reassignment of every client, and the directory sync against a fake
+    directory. Each case reports p50/p90/p99 latency and the most queries
+    any run made, and can be saved as, or compared with, a JSON baseline.
+
+    python -m benchmarks.suite --generate     # build the dataset first
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+    Runs against sqlite:///benchmark.db unless --database-url is given;
+    point it at a scratch local Postgres, as --generate drops every table.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from urllib.parse import quote_plus
+
+# Auth0 settings are required, but never used by the benchmarks
+SETTINGS = dict(
+    AUTH0_DOMAIN='auth0.invalid',
+    AUTH0_CLIENT_ID='benchmark',
+    AUTH0_CALLBACK_URL='http://localhost/callback')
+CASES = ('startup', 'client_list', 'client_list_active',
+         'client_list_cached', 'client_filter_product', 'client_filter_lead',
+         'client_filter_products_all', 'client_filter_leads_any',
+         'client_search', 'client_export', 'client_edit', 'lead_typeahead',
+         'employee_list', 'employee_managers', 'workload_report',
+         'bulk_codes', 'bulk_reassign', 'directory_sync')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Benchmark account-admin hot paths')
+    parser.add_argument('--database-url', default='sqlite:///benchmark.db')
+    parser.add_argument(
+        '--generate',
+        action='store_true',
+        help='drop every table and generate the dataset')
+    parser.add_argument('--scale', choices=['small', 'default'],
+                        default='default')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES)
+    parser.add_argument('--baseline', help='JSON baseline to compare with')
+    parser.add_argument('--save-baseline', help='write results as JSON')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.2,
+        help='allowed p50 slowdown against the baseline')
+    return parser.parse_args()
+
+
+def startup_case():
+    """ Import the app and build it in a fresh interpreter, as a worker
+        does on cold start
+    """
+    command = [
+        sys.executable, '-c',
+        'import admin_app; admin_app.create_app({0!r})'.format(SETTINGS)
+    ]
+
+    def case():
+        subprocess.run(command, check=True)
+
+    return case
+
+
+def http_case(client, url, cached=False):
+    """ Request `url`, rendering list pages every time unless `cached`
+    """
+    import list_cache
+
+    def case():
+        if not cached:
+            list_cache.cache.clear()
+        response = client.get(url)
+        response.get_data()
+        if response.status_code != 200:
+            raise RuntimeError('{0} returned {1}'.format(
+                url, response.status_code))
+
+    return case
+
+
+def admin_cases(session):
+    """ Cases requesting admin pages through the Flask test client
+    """
+    from admin_app import (AccountLeadFilter, AccountLeadsFilter,
+                           ClientAdmin, ProductFilter, ProductsFilter,
+                           create_app)
+    from models import Client, Employee, Product
+
+    app = create_app(SETTINGS)
+    client = app.test_client()
+    with client.session_transaction() as browser:
+        browser['profile'] = dict(
+            user_id='benchmark', name='Benchmark', email='benchmark@oao.co')
+
+    view = next(v for v in app.extensions['admin'][0]._views
+                if isinstance(v, ClientAdmin))
+    product_filter = next(i for i, flt in enumerate(view._filters)
+                          if isinstance(flt, ProductFilter))
+    lead_filter = next(i for i, flt in enumerate(view._filters)
+                       if isinstance(flt, AccountLeadFilter))
+    products_all_filter = next(
+        i for i, flt in enumerate(view._filters)
+        if isinstance(flt, ProductsFilter) and flt.match_all)
+    leads_any_filter = next(
+        i for i, flt in enumerate(view._filters)
+        if isinstance(flt, AccountLeadsFilter) and not flt.match_all)
+    client_id = session.query(Client.client_organization_id).order_by(
+        Client.client_organization_id).limit(1).scalar()
+    product = session.query(Product.product_type_name).order_by(
+        Product.product_type_id).limit(1).scalar()
+    lead = session.query(Employee.person_id).filter(
+        Employee.account_manager_flag.is_(True)).order_by(
+            Employee.person_id).limit(1).scalar()
+    product_ids = ','.join(
+        str(product_id) for product_id, in session.query(
+            Product.product_type_id).order_by(
+                Product.product_type_id).limit(3))
+    leads = ','.join(
+        str(person_id) for person_id, in session.query(Employee.person_id).
+        filter(Employee.account_manager_flag.is_(True)).order_by(
+            Employee.person_id).limit(3))
+
+    urls = dict(
+        client_list='/admin/client/',
+        client_list_active='/admin/client/?flt0_0=1',
+        client_filter_product='/admin/client/?flt0_{0}={1}'.format(
+            product_filter, quote_plus(product)),
+        client_filter_lead='/admin/client/?flt0_{0}={1}'.format(
+            lead_filter, lead),
+        client_filter_products_all='/admin/client/?flt0_{0}={1}'.format(
+            products_all_filter, product_ids),
+        client_filter_leads_any='/admin/client/?flt0_{0}={1}'.format(
+            leads_any_filter, leads),
+        client_search='/admin/client/?search=acme',
+        client_export='/admin/client/export/csv/',
+        client_edit='/admin/client/edit/?id={0}&modal=True'.format(client_id),
+        lead_typeahead='/admin/client/ajax/lookup/?name=account_manager'
+        '&query=user1',
+        employee_list='/admin/employee/',
+        employee_managers='/admin/employee/ajax/managers/',
+        workload_report='/admin/workload/')
+    cases = {name: http_case(client, url) for name, url in urls.items()}
+    cases['client_list_cached'] = http_case(
+        client, urls['client_list_active'], cached=True)
+    return cases
+
+
+def bulk_codes_case(Session):
+    """ Plan and write a code for every client without one, then roll back
+    """
+    import client_codes
+
+    def case():
+        session = Session()
+        try:
+            plan = client_codes.plan_codes(session)
+            client_codes.apply_codes(session, plan)
+        finally:
+            session.rollback()
+            session.close()
+
+    return case
+
+
+def bulk_reassign_case(Session):
+    """ Make one lead the secondary lead of every client, then roll back
+    """
+    import bulk_actions
+    from models import Client, Employee
+
+    session = Session()
+    lead = session.query(Employee.person_id).filter(
+        Employee.account_manager_flag.is_(True)).order_by(
+            Employee.person_id).limit(1).scalar()
+    session.close()
+
+    def case():
+        session = Session()
+        try:
+            # every client, as the admin passes the list's query
+            bulk_actions.reassign_lead(
+                session, session.query(Client.client_organization_id),
+                'secondary', lead, 'benchmark@oao.co')
+        finally:
+            session.rollback()
+            session.close()
+
+    return case
+
+
+def directory_sync_case(Session):
+    """ Sync against a directory with 1% renamed, 1% new and 1% departed
+        users, then roll back
+    """
+    from fake_directory import FakeDirectoryService, make_user
+    from google_directory_sync import sync
+    from models import Employee
+
+    session = Session()
+    people = session.query(Employee.person_id).filter(
+        Employee.current_employee_flag.is_(True)).order_by(
+            Employee.person_id)
+    current = [make_user(person_id) for person_id, in people]
+    bind = session.get_bind()
+    session.close()
+    changed = []
+    for i, user in enumerate(current):
+        if i % 100 == 0:
+            continue
+        if i % 100 == 1:
+            user = dict(user, name=dict(user['name']))
+            user['name']['givenName'] += ' Jr'
+        changed.append(user)
+    changed.extend(make_user(1000000 + i) for i in range(len(current) // 100))
+
+    def case():
+        # sync commits; a session joined to an outer transaction only
+        # commits into it, so rolling that back keeps the dataset as seeded
+        connection = bind.connect()
+        transaction = connection.begin()
+        session = Session(bind=connection)
+        try:
+            sync(FakeDirectoryService(changed), session)
+        finally:
+            session.close()
+            transaction.rollback()
+            connection.close()
+
+    return case
+
+
+def main():
+    args = parse_args()
+    # database.py builds the shared engine from DATABASE_URL on import, so
+    # the app is imported after this
+    os.environ['DATABASE_URL'] = args.database_url
+
+    from sqlalchemy.orm import sessionmaker
+
+    import migrations
+    from benchmarks import datagen, harness
+    from database import engine
+
+    Session = sessionmaker(bind=engine)
+    if args.generate:
+        datagen.create_schema(engine)
+        session = Session()
+        try:
+            scale = datagen.SCALES[args.scale]
+            datagen.generate(
+                session,
+                seed=args.seed,
+                clients_count=scale['clients'],
+                employees_count=scale['employees'],
+                products_count=scale['products'],
+                offices_count=scale['offices'])
+        finally:
+            session.close()
+    migrations.migrate(engine)
+
+    session = Session()
+    try:
+        cases = admin_cases(session)
+    finally:
+        session.close()
+    cases['startup'] = startup_case()
+    cases['bulk_codes'] = bulk_codes_case(Session)
+    cases['bulk_reassign'] = bulk_reassign_case(Session)
+    if 'directory_sync' in args.cases:
+        cases['directory_sync'] = directory_sync_case(Session)
+
+    summaries = {}
+    for name in args.cases:
+        result = harness.measure(name, cases[name], args.repeat)
+        summaries[name] = result.summary()
+
+    baseline = harness.load_baseline(args.baseline) if args.baseline else None
+    regressed = harness.report(summaries, baseline, args.tolerance)
+    if args.save_baseline:
+        harness.save_baseline(args.save_baseline, summaries)
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+""" Set-based bulk actions for ClientAdmin and EmployeeAdmin.
+
+    Each action changes every selected row, or every row matching the
+    list's current search and filters, with one UPDATE (and INSERT ...
+    SELECT or DELETE, for product associations) whose WHERE takes the
+    selected ids or the list's query as a subquery, instead of a save per
+    row. Audit fields are set, the search documents, workload summary, org
+    chart and caches derived from the changed rows are brought up to date,
+    and everything is committed in one transaction.
+
+    Changing the rows can change what the list's query matches, so the
+    keys of the updated rows are read by the UPDATE itself on Postgres
+    (RETURNING), or just before it elsewhere, and later statements take
+    those.
+
+    BulkActionsMixin adds a view's `bulk_actions` to Flask-Admin's actions
+    menu. Picking one shows a form for its parameters and whether to apply
+    it to the selected rows or to every matching row; submitting it calls
+    the view's `bulk_<name>(ids, values)` method, which returns a message
+    reporting the rows changed.
+"""
+from collections import namedtuple
+from functools import partial
+from urllib.parse import urlsplit
+
+from flask import abort, flash, redirect, request, url_for
+from flask_admin import expose
+from sqlalchemy import and_, exists, func, inspect, literal, select
+
+import filter_options
+import org_chart
+import search
+import table_versions
+import workload
+from models import Client, Employee, t_client_product_association
+
+# `choices` is a callable returning (value, label) pairs, or None for a
+# text input
+BulkAction = namedtuple('BulkAction', ['name', 'text', 'fields'])
+BulkField = namedtuple('BulkField', ['name', 'label', 'choices'])
+
+LEAD_COLUMNS = dict(
+    primary='account_manager_id', secondary='secondary_manager_id')
+
+client = Client.__table__
+association = t_client_product_association
+
+
+class BulkActionError(Exception):
+    """ The action can't be applied as asked; nothing was changed
+    """
+
+
+def update(session, model, ids, values, user):
+    """ Set `values` and the audit fields on `model` rows whose primary key
+        is in `ids`, a list or a query of keys, with one UPDATE. Returns the
+        number of rows updated and a list of their keys.
+    """
+    key = inspect(model).primary_key[0]
+    values = dict(values, modified_by=user, modified_datetime=func.now())
+    if not isinstance(ids, list):
+        if session.get_bind().dialect.name == 'postgresql':
+            changed = [
+                updated for updated, in session.execute(
+                    model.__table__.update().where(key.in_(ids)).values(
+                        values).returning(key))
+            ]
+            return len(changed), changed
+        ids = [selected for selected, in ids]
+    updated = session.query(model).filter(key.in_(ids)).update(
+        values, synchronize_session=False)
+    return updated, ids
+
+
+def clients_changed(session, ids, leads, documents=True):
+    """ Refresh what is derived from clients in `ids`: the workload rows of
+        `leads` and, if `documents` is set, the clients' search documents
+    """
+    if documents:
+        search.refresh(session, Client, ids)
+    workload.refresh(session, sorted(leads - {None}))
+    table_versions.bump('client_organization')
+
+
+def client_leads(session, ids):
+    return {lead for lead, in workload.client_leads(session, ids)}
+
+
+def reassign_lead(session, ids, role, person_id, user):
+    """ Make `person_id` the primary or secondary lead, per `role`, of
+        clients in `ids`
+    """
+    if role not in LEAD_COLUMNS:
+        raise BulkActionError('Unknown lead role: {0}'.format(role))
+    leads = client_leads(session, ids) | {person_id}
+    updated, changed = update(session, Client, ids,
+                              {LEAD_COLUMNS[role]: person_id}, user)
+    # documents include the primary lead's email
+    clients_changed(session, changed, leads, documents=role == 'primary')
+    return updated
+
+
+def add_product(session, ids, product_id, user):
+    """ Associate `product_id` with clients in `ids`, returning the number
+        of clients that didn't have it and the number of clients
+    """
+    leads = client_leads(session, ids)
+    updated, changed = update(session, Client, ids, {}, user)
+    has_product = exists().where(
+        and_(association.c.client_organization_id ==
+             client.c.client_organization_id,
+             association.c.product_type_id == product_id))
+    missing = select([
+        client.c.client_organization_id,
+        literal(product_id).label('product_type_id')
+    ]).where(
+        and_(client.c.client_organization_id.in_(changed), ~has_product))
+    added = session.execute(association.insert().from_select(
+        ['client_organization_id', 'product_type_id'], missing)).rowcount
+    clients_changed(session, changed, leads)
+    return added, updated
+
+
+def remove_product(session, ids, product_id, user):
+    """ Remove `product_id` from clients in `ids`, returning the number of
+        clients that had it and the number of clients
+    """
+    leads = client_leads(session, ids)
+    updated, changed = update(session, Client, ids, {}, user)
+    removed = session.execute(association.delete().where(
+        and_(association.c.client_organization_id.in_(changed),
+             association.c.product_type_id == product_id))).rowcount
+    clients_changed(session, changed, leads)
+    return removed, updated
+
+
+def set_active(session, ids, active, user):
+    leads = client_leads(session, ids)
+    updated, changed = update(session, Client, ids,
+                              dict(active_client_flag=active), user)
+    clients_changed(session, changed, leads, documents=False)
+    return updated
+
+
+def set_manager(session, ids, manager_id, user):
+    """ Make `manager_id` (None for no manager) the manager of people in
+        `ids`, unless that would put anyone above themselves
+    """
+    if manager_id is not None:
+        above = {manager_id}
+        above.update(person['person_id']
+                     for person in org_chart.chain_of_command(
+                         session, manager_id))
+        selected_above = session.query(Employee.person_id).filter(
+            Employee.person_id.in_(above), Employee.person_id.in_(ids))
+        if session.query(selected_above.exists()).scalar():
+            raise BulkActionError(
+                'The new manager is selected or reports to someone selected')
+    updated, changed = update(session, Employee, ids,
+                              dict(manager_person_id=manager_id), user)
+    org_chart.move_all(session, changed, manager_id)
+    table_versions.bump('person')
+    return updated
+
+
+def set_account_lead(session, ids, flag, user):
+    updated, _ = update(session, Employee, ids,
+                        dict(account_manager_flag=flag), user)
+    filter_options.invalidate('account_leads')
+    table_versions.bump('person')
+    return updated
+
+
+class BulkActionsMixin():
+    bulk_actions = []
+    bulk_template = 'admin/bulk_action.html'
+
+    def init_actions(self):
+        super().init_actions()
+        for action in self.bulk_actions:
+            self._actions.append((action.name, action.text))
+            self._actions_data[action.name] = (partial(
+                self._bulk_form, action), action.text, None)
+
+    def _bulk_form(self, action, ids):
+        """ Render the form for `action` from the actions menu, keeping the
+            list's search and filters in the form URL
+        """
+        query = urlsplit(request.form.get('url', '')).query
+        form_url = url_for('.bulk_view', action_name=action.name)
+        return self.render(
+            self.bulk_template,
+            action=action,
+            ids=ids,
+            choices={
+                field.name: field.choices()
+                for field in action.fields if field.choices
+            },
+            form_url=form_url + ('?' + query if query else ''),
+            list_url=self._bulk_list_url(query),
+            filtered=bool(query))
+
+    def _bulk_list_url(self, query):
+        url = self.get_url('.index_view')
+        return url + ('?' + query if query else '')
+
+    def matching_ids(self):
+        """ Query of the primary keys of every row matching the search and
+            filters in the request arguments
+        """
+        view_args = self._get_list_extra_args()
+        query = self.get_query()
+        joins = {}
+        count_joins = {}
+        if self._search_supported and view_args.search:
+            query, _, joins, count_joins = self._apply_search(
+                query, None, joins, count_joins, view_args.search)
+        if view_args.filters and self._filters:
+            query, _, joins, count_joins = self._apply_filters(
+                query, None, joins, count_joins, view_args.filters)
+        key = getattr(self.model, self._primary_key)
+        # searches are ranked, which a subquery has no use for
+        return query.with_entities(key).order_by(None)
+
+    @expose('/bulk/<action_name>/', methods=['POST'])
+    def bulk_view(self, action_name):
+        action = next(
+            (a for a in self.bulk_actions if a.name == action_name), None)
+        if action is None:
+            abort(404)
+        if request.form.get('scope') == 'matching':
+            ids = self.matching_ids()
+        else:
+            key = getattr(self.model, self._primary_key)
+            try:
+                ids = [
+                    key.type.python_type(value)
+                    for value in request.form.getlist('rowid')
+                ]
+            except ValueError:
+                abort(400)
+        values = {
+            field.name: request.form.get(field.name, '').strip()
+            for field in action.fields
+        }
+        try:
+            message = getattr(self, 'bulk_' + action.name)(ids, values)
+            self.session.commit()
+        except BulkActionError as error:
+            self.session.rollback()
+            flash(str(error), 'error')
+        except Exception:
+            self.session.rollback()
+            raise
+        else:
+            # the actions bump versions before the commit, so a page cached
+            # in between may hold the old rows under the new version
+            table_versions.bump(self.model.__table__.name)
+            flash(message, 'success')
+        return redirect(
+            self._bulk_list_url(request.query_string.decode('utf-8')))
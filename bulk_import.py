@@ -0,0 +1,322 @@
+""" Bulk CSV import of clients and products.
+
+    A client CSV has a header row naming any of CLIENT_COLUMNS;
+    client_organization_name and assigned_account_name are required. Leads
+    are given by employee email and products by a ';' separated list of
+    product_type_code. A product CSV names PRODUCT_COLUMNS, of which
+    product_type_code and product_type_name are required.
+
+    Emails, product codes and client codes in use are loaded once into
+    lookup maps, then every row is checked before anything is written, so
+    an import with any bad row writes nothing and reports each problem by
+    line. Good imports are written with multi-row INSERTs of BATCH_SIZE
+    rows, clients get a code as ClientAdmin would give them, and everything
+    commits in one transaction.
+
+    Imports run from the admin Import view, or with
+    `python bulk_import.py clients|products FILE --user EMAIL [--dry-run]`.
+"""
+import argparse
+import codecs
+import csv
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy.orm import sessionmaker
+
+import client_codes
+import filter_options
+import search
+import table_versions
+import workload
+from models import (Client, Employee, Product, engine,
+                    t_client_product_association)
+
+BATCH_SIZE = 500
+
+CLIENT_COLUMNS = ('client_organization_name', 'assigned_account_name',
+                  'account_manager', 'secondary_manager', 'products',
+                  'dfp_network_code', 'dfp_display_name',
+                  'contract_start_date', 'contract_end_date',
+                  'active_client_flag', 'oao_inbox_name',
+                  'oao_escalation_group_name', 'oao_shared_folder',
+                  'oao_wiki_page', 'notes')
+CLIENT_REQUIRED = ('client_organization_name', 'assigned_account_name')
+PRODUCT_COLUMNS = ('product_type_code', 'product_type_name',
+                   'product_type_description')
+PRODUCT_REQUIRED = ('product_type_code', 'product_type_name')
+
+FLAGS = {
+    'true': True,
+    'yes': True,
+    'y': True,
+    '1': True,
+    'false': False,
+    'no': False,
+    'n': False,
+    '0': False
+}
+
+RowError = namedtuple('RowError', ['line', 'message'])
+
+
+class ImportResult():
+    """ Rows read, rows written and errors found by an import
+    """
+
+    def __init__(self, kind, dry_run):
+        self.kind = kind
+        self.dry_run = dry_run
+        self.rows = []
+        self.errors = []
+        self.written = 0
+
+
+class Lookups():
+    """ Ids by employee email and product code, and client codes in use
+    """
+
+    def __init__(self, session):
+        self.people = {
+            email.lower(): person_id
+            for person_id, email in session.query(
+                Employee.person_id, Employee.email).filter(
+                    Employee.current_employee_flag.is_(True))
+        }
+        self.products = dict(
+            session.query(Product.product_type_code,
+                          Product.product_type_id))
+        self.codes = {
+            code
+            for code, in session.query(Client.client_organization_code).
+            filter(Client.client_organization_code.isnot(None))
+        }
+
+
+def check_header(fieldnames, columns, required):
+    fieldnames = fieldnames or []
+    errors = [
+        'unknown column {0}'.format(name) for name in fieldnames
+        if name not in columns
+    ]
+    errors.extend('missing column {0}'.format(name) for name in required
+                  if name not in fieldnames)
+    return [RowError(1, message) for message in errors]
+
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_client(record, lookups, user):
+    """ (client values, product ids, error messages) for one CSV record
+    """
+    messages = []
+    values = {}
+    for name in CLIENT_COLUMNS:
+        value = (record.get(name) or '').strip()
+        if not value:
+            if name in CLIENT_REQUIRED:
+                messages.append('{0} is required'.format(name))
+            continue
+        values[name] = value
+
+    for name in ('account_manager', 'secondary_manager'):
+        email = values.pop(name, None)
+        if email is None:
+            continue
+        person_id = lookups.people.get(email.lower())
+        if person_id is None:
+            messages.append('no current employee with email {0}'.format(
+                email))
+        values[name + '_id'] = person_id
+    if 'dfp_network_code' in values:
+        try:
+            values['dfp_network_code'] = int(values['dfp_network_code'])
+        except ValueError:
+            messages.append('dfp_network_code must be a number')
+    for name in ('contract_start_date', 'contract_end_date'):
+        if name in values:
+            try:
+                values[name] = parse_date(values[name])
+            except ValueError:
+                messages.append('{0} must be a YYYY-MM-DD date'.format(name))
+    flag = FLAGS.get(values.get('active_client_flag', 'true').lower())
+    if flag is None:
+        messages.append('active_client_flag must be true or false')
+    values['active_client_flag'] = flag
+
+    product_ids = []
+    codes = [code.strip() for code in values.pop('products', '').split(';')]
+    for code in sorted(set(filter(None, codes))):
+        if code not in lookups.products:
+            messages.append('no product with code {0}'.format(code))
+        product_ids.append(lookups.products.get(code))
+
+    if not messages:
+        values['created_by'] = user
+        values['client_organization_code'] = client_codes.next_code(
+            values['client_organization_name'],
+            values['assigned_account_name'],
+            values.get('contract_start_date'), lookups.codes)
+    return values, product_ids, messages
+
+
+def parse_product(record, lookups, user, seen):
+    messages = []
+    values = {}
+    for name in PRODUCT_COLUMNS:
+        value = (record.get(name) or '').strip()
+        if not value:
+            if name in PRODUCT_REQUIRED:
+                messages.append('{0} is required'.format(name))
+            continue
+        values[name] = value
+    code = values.get('product_type_code')
+    if code in lookups.products or code in seen:
+        messages.append('product code {0} already exists'.format(code))
+    seen.add(code)
+    values['created_by'] = user
+    return values, messages
+
+
+def read(kind, stream, lookups, user, result):
+    """ Parse and check every record of `stream` into `result`
+    """
+    reader = csv.DictReader(stream)
+    if kind == 'clients':
+        columns, required = CLIENT_COLUMNS, CLIENT_REQUIRED
+    else:
+        columns, required = PRODUCT_COLUMNS, PRODUCT_REQUIRED
+    result.errors.extend(check_header(reader.fieldnames, columns, required))
+    if result.errors:
+        return
+    seen = set()
+    for record in reader:
+        if kind == 'clients':
+            values, product_ids, messages = parse_client(
+                record, lookups, user)
+            row = (values, product_ids)
+        else:
+            values, messages = parse_product(record, lookups, user, seen)
+            row = values
+        result.errors.extend(
+            RowError(reader.line_num, message) for message in messages)
+        result.rows.append(row)
+
+
+def batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def uniform(rows):
+    """ `rows` with every key any of them has, as multi-row INSERTs need
+    """
+    keys = set().union(*rows)
+    return [{key: row.get(key) for key in keys} for row in rows]
+
+
+def insert_rows(session, table, rows):
+    """ Insert `rows`, a list of dicts, in multi-row INSERT statements
+    """
+    for batch in batches(rows):
+        session.execute(table.insert().values(uniform(batch)))
+
+
+def write_clients(session, rows):
+    """ Insert clients and their product associations; returns the new
+        client ids
+    """
+    table = Client.__table__
+    by_code = {}
+    for batch in batches(rows):
+        session.execute(table.insert().values(
+            uniform([values for values, _ in batch])))
+        codes = [values['client_organization_code'] for values, _ in batch]
+        by_code.update(
+            session.query(Client.client_organization_code,
+                          Client.client_organization_id).filter(
+                              Client.client_organization_code.in_(codes)))
+
+    associations = [
+        dict(
+            client_organization_id=by_code[values[
+                'client_organization_code']],
+            product_type_id=product_id) for values, product_ids in rows
+        for product_id in product_ids
+    ]
+    insert_rows(session, t_client_product_association, associations)
+    return list(by_code.values())
+
+
+def import_csv(session, kind, stream, user, dry_run=False):
+    """ Import `kind` ('clients' or 'products') rows from `stream`, an
+        iterable of CSV text lines, as `user`, writing nothing unless every
+        row is valid and `dry_run` is off
+    """
+    result = ImportResult(kind, dry_run)
+    read(kind, stream, Lookups(session), user, result)
+    if dry_run or result.errors or not result.rows:
+        return result
+    try:
+        if kind == 'clients':
+            client_ids = write_clients(session, result.rows)
+            search.refresh(session, Client, client_ids)
+            workload.refresh(session,
+                             workload.client_leads(session, client_ids))
+        else:
+            insert_rows(session, Product.__table__, result.rows)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    # after the commit, so nothing cached in between holds the old rows
+    if kind == 'products':
+        filter_options.invalidate('products', 'product_ids')
+        table_versions.bump('product_type')
+    else:
+        table_versions.bump('client_organization')
+    result.written = len(result.rows)
+    return result
+
+
+def text_stream(binary):
+    """ Decoded lines of an uploaded file, dropping any UTF-8 BOM
+    """
+    return codecs.iterdecode(binary, 'utf-8-sig')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Import clients or products from a CSV file')
+    parser.add_argument('kind', choices=['clients', 'products'])
+    parser.add_argument('file')
+    parser.add_argument(
+        '--user', required=True, help='email recorded as created_by')
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='check every row without writing')
+    args = parser.parse_args()
+
+    session = sessionmaker(bind=engine)()
+    try:
+        with open(args.file, encoding='utf-8-sig', newline='') as stream:
+            result = import_csv(session, args.kind, stream, args.user,
+                                args.dry_run)
+    finally:
+        session.close()
+    for error in result.errors:
+        print('line {0}: {1}'.format(error.line, error.message))
+    if result.errors:
+        print('{0} errors, nothing imported'.format(len(result.errors)))
+    elif result.dry_run:
+        print('{0} {1} would be imported'.format(
+            len(result.rows), result.kind))
+    else:
+        print('{0} {1} imported'.format(result.written, result.kind))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+""" OAO Standard Client codes.
+
+    A code is the first two letters of the assigned account name, the
+    contract start year and a three digit suffix, e.g. AC2018-042. The
+    suffix starts at the sum of the client name's UTF-8 bytes modulo 999;
+    if that code is taken, the next suffixes are tried in order (wrapping
+    at 999), so a given set of clients always gets the same codes.
+    client_organization_code has a unique index to catch anything that
+    slips through.
+
+    Run `python client_codes.py` to give every client without a code one,
+    in a single pass; `--revalidate` also recodes all but the oldest client
+    sharing a duplicated code, after which migrations.py can add the unique
+    index, and `--dry-run` prints the changes without making them.
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import bindparam
+from sqlalchemy.orm import sessionmaker
+
+from models import Client, engine
+
+SUFFIXES = 1000
+PROBE_BATCH = 50
+
+table = Client.__table__
+
+
+class CodesExhausted(Exception):
+    """ Every suffix for a prefix and year is taken
+    """
+
+
+def code_prefix(assigned_account_name, contract_start_date):
+    """ Code up to the suffix, e.g. 'AC2018-'
+    """
+    norm_name = assigned_account_name.upper().strip().replace('THE ', '')
+    try:
+        start_year = contract_start_date.year
+    except AttributeError:
+        start_year = datetime.now().year
+    return '{0}{1}-'.format(norm_name[:2], start_year)
+
+
+def candidates(client_organization_name, assigned_account_name,
+               contract_start_date):
+    """ Every code the client could get, in order of preference. Made as
+        they are asked for, since one of the first few is usually free.
+    """
+    prefix = code_prefix(assigned_account_name, contract_start_date)
+    start = sum(bytearray(client_organization_name, 'utf-8')) % 999
+    for i in range(SUFFIXES):
+        yield '{0}{1:03d}'.format(prefix, (start + i) % SUFFIXES)
+
+
+def first_free(codes, taken):
+    """ First of `codes` not in `taken`, or None
+    """
+    return next((code for code in codes if code not in taken), None)
+
+
+def next_code(client_organization_name, assigned_account_name,
+              contract_start_date, taken):
+    """ First code for the client not in `taken`, which it is added to
+    """
+    code = first_free(
+        candidates(client_organization_name, assigned_account_name,
+                   contract_start_date), taken)
+    if code is None:
+        raise CodesExhausted(
+            code_prefix(assigned_account_name, contract_start_date))
+    taken.add(code)
+    return code
+
+
+def generate_code(session, client):
+    """ The client's code, or the first free code for it if it has none
+    """
+    if client.client_organization_code:
+        # no-op if client already has a code
+        return client.client_organization_code
+    codes = candidates(client.client_organization_name,
+                       client.assigned_account_name,
+                       client.contract_start_date)
+    while True:
+        batch = list(islice(codes, PROBE_BATCH))
+        if not batch:
+            raise CodesExhausted(
+                code_prefix(client.assigned_account_name,
+                            client.contract_start_date))
+        taken = {
+            code
+            for code, in session.query(Client.client_organization_code).
+            filter(Client.client_organization_code.in_(batch))
+        }
+        code = first_free(batch, taken)
+        if code is not None:
+            return code
+
+
+def plan_codes(session, revalidate=False):
+    """ {client_organization_id: (old code, new code)} for clients without
+        a code, and with `revalidate` for all but the first client (by id)
+        sharing a code
+    """
+    rows = session.execute(
+        table.select().with_only_columns([
+            table.c.client_organization_id, table.c.client_organization_code,
+            table.c.client_organization_name, table.c.assigned_account_name,
+            table.c.contract_start_date
+        ]).order_by(table.c.client_organization_id)).fetchall()
+
+    holders = defaultdict(list)
+    for row in rows:
+        if row.client_organization_code:
+            holders[row.client_organization_code].append(row)
+    taken = set(holders)
+    recode = [row for row in rows if not row.client_organization_code]
+    if revalidate:
+        recode.extend(
+            row for shared in holders.values() for row in shared[1:])
+        recode.sort(key=lambda row: row.client_organization_id)
+
+    plan = {}
+    for row in recode:
+        code = next_code(row.client_organization_name,
+                         row.assigned_account_name, row.contract_start_date,
+                         taken)
+        plan[row.client_organization_id] = (row.client_organization_code,
+                                            code)
+    return plan
+
+
+def apply_codes(session, plan):
+    """ Write the new codes in `plan` with one batched UPDATE
+    """
+    if not plan:
+        return
+    session.execute(
+        table.update().where(table.c.client_organization_id == bindparam(
+            'id')).values(client_organization_code=bindparam('code')),
+        [dict(id=key, code=new) for key, (old, new) in plan.items()])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Fill in missing client codes')
+    parser.add_argument(
+        '--revalidate',
+        action='store_true',
+        help='also recode clients sharing a code')
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='print the changes without making them')
+    args = parser.parse_args()
+
+    session = sessionmaker(bind=engine)()
+    try:
+        plan = plan_codes(session, args.revalidate)
+        for key, (old, new) in sorted(plan.items()):
+            print('{0}: {1} -> {2}'.format(key, old or '(none)', new))
+        print('{0} client codes to change'.format(len(plan)))
+        if args.dry_run:
+            return
+        apply_codes(session, plan)
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
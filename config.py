@@ -0,0 +1,82 @@
+""" Settings for the admin app, read from the environment and checked up
+    front, so a misconfigured worker fails at startup listing every problem
+    instead of part way through a request.
+"""
+import os
+
+import database
+import sessions
+
+# Settings the app can't run without, unless it is in testing mode
+REQUIRED = ('AUTH0_DOMAIN', 'AUTH0_CLIENT_ID', 'AUTH0_CALLBACK_URL')
+TRUE = ('1', 'true', 'yes', 'on')
+
+
+class ConfigError(Exception):
+    """ The settings are missing or invalid; args are the problems
+    """
+
+    def __str__(self):
+        return 'Invalid configuration: ' + '; '.join(self.args)
+
+
+def make_secret_key():
+    key = os.urandom(24).hex()
+    return (key)
+
+
+def from_env():
+    return dict(
+        SECRET_KEY=os.getenv('SECRET_KEY') or make_secret_key(),
+        SQLALCHEMY_DATABASE_URI=database.DATABASE_URL,
+        SQLALCHEMY_TRACK_MODIFICATIONS=False,
+        # Fail list views that exceed their query budget; on by default
+        # when testing
+        ENFORCE_QUERY_BUDGET=(os.getenv('ENFORCE_QUERY_BUDGET', '').lower()
+                              in TRUE),
+        AUTH0_CALLBACK_URL=os.getenv('AUTH0_CALLBACK_URL'),
+        AUTH0_CLIENT_ID=os.getenv('AUTH0_CLIENT_ID'),
+        AUTH0_CLIENT_SECRET=os.getenv('AUTH0_CLIENT_SECRET'),
+        AUTH0_DOMAIN=os.getenv('AUTH0_DOMAIN'),
+        AUTH0_AUDIENCE=os.getenv('AUTH0_AUDIENCE'),
+        # Bearer token accepted by /admin/metrics, for Prometheus scrapers
+        METRICS_TOKEN=os.getenv('METRICS_TOKEN'),
+        # Bearer token accepted by the /api endpoints, for other services
+        API_TOKEN=os.getenv('API_TOKEN'),
+        DEBUG=os.getenv('FLASK_DEBUG', '').lower() in TRUE,
+        SESSION_STORE=os.getenv('SESSION_STORE', 'sql'))
+
+
+def load(overrides=None):
+    """ Settings from the environment updated with `overrides`, with
+        derived Auth0 URLs filled in; raises ConfigError if any are invalid
+    """
+    settings = from_env()
+    settings.update(overrides or {})
+    problems = []
+
+    if not settings.get('TESTING'):
+        problems.extend('{0} is not set'.format(name) for name in REQUIRED
+                        if not settings.get(name))
+    domain = settings.get('AUTH0_DOMAIN') or 'auth0.invalid'
+    if '/' in domain:
+        problems.append(
+            'AUTH0_DOMAIN should be a host name like tenant.auth0.com')
+    callback = settings.get('AUTH0_CALLBACK_URL')
+    if callback and not callback.startswith(('http://', 'https://')):
+        problems.append('AUTH0_CALLBACK_URL should be an http(s) URL')
+    if settings.get('SESSION_STORE') not in sessions.STORES:
+        problems.append('SESSION_STORE should be one of ' +
+                        ', '.join(sessions.STORES))
+    elif (settings['SESSION_STORE'] == 'memory'
+          and not (settings.get('DEBUG') or settings.get('TESTING'))):
+        # each worker would have its own sessions
+        problems.append("SESSION_STORE 'memory' is only for debug and "
+                        'testing mode')
+    if problems:
+        raise ConfigError(*problems)
+
+    settings['AUTH0_BASE_URL'] = 'https://' + domain
+    if not settings.get('AUTH0_AUDIENCE'):
+        settings['AUTH0_AUDIENCE'] = settings['AUTH0_BASE_URL'] + '/userinfo'
+    return settings
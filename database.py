@@ -0,0 +1,108 @@
+""" The one SQLAlchemy engine shared by models, the admin app and the
+    directory sync, so each process holds a single connection pool.
+
+    Pool settings come from the environment:
+    - DB_POOL_SIZE, DB_MAX_OVERFLOW: connections kept open, and extra
+      connections allowed under load
+    - DB_POOL_TIMEOUT: seconds to wait for a free connection
+    - DB_POOL_RECYCLE: seconds before a connection is replaced
+    - DB_POOL_PRE_PING: test connections on checkout (default on)
+    - DB_STATEMENT_TIMEOUT: Postgres statement_timeout in ms (0 disables)
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+DATABASE_URL = os.getenv('DATABASE_URL',
+                         ('postgres://account_admin_user@localhost:5454'
+                          '/account_admin'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 2))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+
+
+class PoolMetrics():
+    """ Running totals of connection checkouts and the time spent waiting
+        for one
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """ QueuePool that records how long each checkout waits
+    """
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_metrics.record(time.monotonic() - started, timed_out=True)
+            raise
+        pool_metrics.record(time.monotonic() - started)
+        return connection
+
+
+def make_engine(url=DATABASE_URL):
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        return create_engine(url)
+
+    connect_args = {}
+    # 'postgres://' URLs report a 'postgres' backend
+    if DB_STATEMENT_TIMEOUT and url.get_backend_name().startswith('postgres'):
+        connect_args['options'] = '-c statement_timeout={0}'.format(
+            DB_STATEMENT_TIMEOUT)
+    return create_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args)
+
+
+engine = make_engine()
+
+
+def pool_stats():
+    """ Current pool occupancy and checkout wait totals
+    """
+    stats = dict(
+        checkouts=pool_metrics.checkouts,
+        timeouts=pool_metrics.timeouts,
+        wait_seconds=pool_metrics.wait_seconds,
+        max_wait_seconds=pool_metrics.max_wait_seconds)
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow())
+    return stats
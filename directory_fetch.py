@@ -0,0 +1,137 @@
+""" Bounded-concurrency Directory API fetching with retry and rate limiting.
+
+    - TokenBucket keeps the request rate under the API quota, and is paused
+      for everyone when any worker gets rate limited
+    - execute() retries 429, 5xx and rate-limit 403 responses with
+      exponential backoff and jitter
+    - DirectoryFetcher runs requests on a thread pool, with one authorized
+      service object per worker thread since httplib2.Http is not
+      thread-safe
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+from apiclient import discovery
+from apiclient.errors import HttpError
+
+DIRECTORY_API_WORKERS = int(os.getenv('DIRECTORY_API_WORKERS', 8))
+# Requests per second, kept under the Directory API per-user quota
+DIRECTORY_API_QPS = float(os.getenv('DIRECTORY_API_QPS', 20))
+MAX_RETRIES = 5
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 32
+
+
+class TokenBucket():
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ Block until a request may be sent
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ Hold back every caller for at least `seconds`
+        """
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+def is_retryable(error):
+    status = int(error.resp.status)
+    if status == 429 or status >= 500:
+        return True
+    # Quota errors come back as 403 with a rateLimitExceeded reason
+    content = error.content or b''
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return status == 403 and (b'rateLimitExceeded' in content
+                              or b'userRateLimitExceeded' in content)
+
+
+def execute(request, limiter=None, retries=MAX_RETRIES):
+    """ Execute an API request, retrying rate limit and server errors
+    """
+    for attempt in range(retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            return request.execute()
+        except HttpError as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            delay = random.uniform(0, min(MAX_BACKOFF,
+                                          BASE_BACKOFF * 2**attempt))
+            if limiter:
+                limiter.pause(delay)
+            time.sleep(delay)
+
+
+def build_service(credentials):
+    """ Directory API service object with its own authorized Http
+    """
+    http = credentials.authorize(httplib2.Http())
+    return discovery.build(
+        'admin', 'directory_v1', http=http, cache_discovery=False)
+
+
+class DirectoryFetcher():
+    def __init__(self, service_factory, workers=None, qps=None):
+        """ `service_factory` builds a new service object; it is called
+            once per worker thread.
+        """
+        self.service_factory = service_factory
+        self.workers = workers or DIRECTORY_API_WORKERS
+        self.limiter = TokenBucket(qps or DIRECTORY_API_QPS)
+        self._local = threading.local()
+
+    def service(self):
+        """ This thread's service object
+        """
+        if not hasattr(self._local, 'service'):
+            self._local.service = self.service_factory()
+        return self._local.service
+
+    def execute(self, make_request, item=None):
+        """ Build a request with make_request(service, item) and execute it
+        """
+        return execute(make_request(self.service(), item), self.limiter)
+
+    def map(self, make_request, items):
+        """ Execute make_request(service, item) for every item concurrently,
+            returning results in the order of `items`
+        """
+        with ThreadPoolExecutor(self.workers) as pool:
+            return list(
+                pool.map(lambda item: self.execute(make_request, item),
+                         items))
+
+
+def get_users(fetcher, user_keys):
+    """ Full user resources for each id or email in `user_keys`
+    """
+    return fetcher.map(
+        lambda service, key: service.users().get(userKey=key), user_keys)
@@ -0,0 +1,213 @@
+""" Local stand-ins for the Google Directory API, for running
+    google_directory_sync and directory_fetch without Google.
+
+    - FakeDirectoryService answers in memory
+    - StubDirectoryServer serves the same data over HTTP, with optional
+      latency and injected 429s, and HttpDirectoryService talks to it so
+      real network concurrency can be measured
+
+    Only the calls the sync makes are implemented: users().list(...),
+    paged with maxResults/pageToken, and users().get(userKey=...).
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import httplib2
+from apiclient.errors import HttpError
+
+
+class FakeDirectoryService():
+    def __init__(self, users, page_size=None):
+        """ `users` is a list of Directory API user resources. `page_size`
+            caps each page below the requested maxResults, to exercise
+            paging with small data sets.
+        """
+        self.users_data = sorted(users, key=lambda u: u['primaryEmail'])
+        self.page_size = page_size
+        self.requests = 0
+
+    def users(self):
+        return FakeUsersResource(self)
+
+
+class FakeUsersResource():
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, customer=None, query=None, orderBy=None, maxResults=100,
+             pageToken=None):
+        return FakeRequest(
+            lambda: list_page(self.service.users_data, maxResults,
+                              pageToken, self.service.page_size),
+            self.service)
+
+    def get(self, userKey):
+        return FakeRequest(
+            lambda: get_user(self.service.users_data, userKey), self.service)
+
+
+class FakeRequest():
+    def __init__(self, handler, service):
+        self.handler = handler
+        self.service = service
+
+    def execute(self):
+        self.service.requests += 1
+        return self.handler()
+
+
+def list_page(users, max_results, page_token, page_size=None):
+    """ users.list response body for one page of `users`
+    """
+    size = int(max_results)
+    if page_size:
+        size = min(size, page_size)
+    start = int(page_token or 0)
+    end = start + size
+    results = dict(users=users[start:end])
+    if end < len(users):
+        results['nextPageToken'] = str(end)
+    return results
+
+
+def get_user(users, user_key):
+    """ users.get response body; raises HttpError 404, as the API does, if
+        no user matches
+    """
+    for user in users:
+        if user_key in (user['id'], user['primaryEmail']):
+            return user
+    raise HttpError(
+        httplib2.Response(dict(status=404)),
+        json.dumps(dict(error='notFound')).encode('utf-8'),
+        uri='users/{0}'.format(user_key))
+
+
+class StubDirectoryServer():
+    """ Threaded HTTP server answering users.list and users.get on
+        127.0.0.1, sleeping `latency` seconds per request and answering
+        429 for a random `error_rate` fraction of requests
+    """
+
+    def __init__(self, users, latency=0.0, error_rate=0.0, page_size=None):
+        self.users_data = sorted(users, key=lambda u: u['primaryEmail'])
+        self.by_key = {}
+        for user in self.users_data:
+            self.by_key[user['id']] = user
+            self.by_key[user['primaryEmail']] = user
+        self.latency = latency
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                          self._handler_class())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return 'http://127.0.0.1:{0}/admin/directory/v1'.format(
+            self.server.server_address[1])
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.latency)
+                if random.random() < stub.error_rate:
+                    return self._reply(429, dict(error='rateLimitExceeded'))
+                url = urlparse(self.path)
+                args = {k: v[0] for k, v in parse_qs(url.query).items()}
+                prefix = '/admin/directory/v1/users'
+                if url.path == prefix:
+                    return self._reply(200, list_page(
+                        stub.users_data, args.get('maxResults', 100),
+                        args.get('pageToken'), stub.page_size))
+                user = stub.by_key.get(url.path[len(prefix) + 1:])
+                if url.path.startswith(prefix + '/') and user:
+                    return self._reply(200, user)
+                return self._reply(404, dict(error='notFound'))
+
+            def _reply(self, status, body):
+                content = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpDirectoryService():
+    """ Minimal Directory API client for a StubDirectoryServer. Like a
+        discovery-built service it owns one httplib2.Http, so build one per
+        thread.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.http = httplib2.Http()
+
+    def users(self):
+        return HttpUsersResource(self)
+
+
+class HttpUsersResource():
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, customer=None, query=None, orderBy=None, maxResults=100,
+             pageToken=None):
+        args = dict(maxResults=maxResults)
+        if pageToken:
+            args['pageToken'] = pageToken
+        return HttpRequest(self.service.http, '{0}/users?{1}'.format(
+            self.service.base_url, urlencode(args)))
+
+    def get(self, userKey):
+        return HttpRequest(self.service.http, '{0}/users/{1}'.format(
+            self.service.base_url, userKey))
+
+
+class HttpRequest():
+    def __init__(self, http, uri):
+        self.http = http
+        self.uri = uri
+
+    def execute(self):
+        resp, content = self.http.request(self.uri, 'GET')
+        if resp.status >= 300:
+            raise HttpError(resp, content, uri=self.uri)
+        return json.loads(content.decode('utf-8'))
+
+
+def make_user(index, domain='example.com'):
+    """ Synthetic Directory API user resource
+    """
+    return {
+        'id': str(100000000000000000000 + index),
+        'primaryEmail': 'user{0}@{1}'.format(index, domain),
+        'name': {
+            'givenName': 'First{0}'.format(index),
+            'familyName': 'Last{0}'.format(index),
+        },
+    }
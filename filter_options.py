@@ -0,0 +1,74 @@
+""" Lazily loaded, process-local cache for list view filter options.
+
+    Providers are registered by name and only hit the database the first
+    time their options are requested, so importing the admin app does not
+    need a live connection. Loaded options are kept for FILTER_OPTIONS_TTL
+    seconds, until a model change hook invalidates them, or, for providers
+    given a `version` callable, until the version they were loaded at moves.
+"""
+import os
+import threading
+import time
+
+from query_budget import cache_load
+
+FILTER_OPTIONS_TTL = int(os.getenv('FILTER_OPTIONS_TTL', 300))
+
+_providers = {}
+
+
+class OptionProvider():
+    """ Callable returning a cached list of (value, label) filter options.
+
+        Flask-Admin calls a filter's `options` when it is callable, so an
+        instance can be passed straight to a filter's `options` argument.
+    """
+
+    def __init__(self, name, loader, ttl=None, version=None):
+        self.name = name
+        self.loader = loader
+        self.ttl = FILTER_OPTIONS_TTL if ttl is None else ttl
+        self.version = version
+        self._options = None
+        self._loaded_at = None
+        self._loaded_version = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            version = self.version() if self.version else None
+            if (self._options is None or self._expired()
+                    or version != self._loaded_version):
+                # Materialize to plain tuples; ORM instances would be
+                # detached once the loading session is closed
+                with cache_load():
+                    self._options = [(value, str(label))
+                                     for value, label in self.loader()]
+                self._loaded_at = time.monotonic()
+                self._loaded_version = version
+            return self._options
+
+    def _expired(self):
+        return time.monotonic() - self._loaded_at > self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._options = None
+            self._loaded_at = None
+
+
+def register(name, loader, ttl=None, version=None):
+    """ Create and register a named OptionProvider for `loader`
+    """
+    provider = OptionProvider(name, loader, ttl, version)
+    _providers[name] = provider
+    return provider
+
+
+def invalidate(*names):
+    """ Drop cached options for the named providers, or all if none given.
+        Names not registered in this process (e.g. in a CLI) are skipped.
+    """
+    for name in names or list(_providers):
+        if name in _providers:
+            _providers[name].invalidate()
@@ -1,22 +1,27 @@
 import os
-
-import httplib2
-from apiclient import discovery
-from models import Employee
+import time
+from collections import namedtuple
+
+import org_chart
+import search
+from database import engine
+from directory_fetch import DirectoryFetcher, build_service, execute
+from models import Client, Employee
 from oauth2client import client, tools
 from oauth2client.file import Storage
-from sqlalchemy import create_engine
 from sqlalchemy.orm.session import sessionmaker
 
-engine = create_engine(
-    os.getenv('DATABASE_URL', ('postgres://account_admin_user@localhost:5433'
-                        '/account_admin?sslmode=verify-ca')))
 Session = sessionmaker(bind=engine)
 
 
 SCOPES = 'https://www.googleapis.com/auth/admin.directory.user'
 CLIENT_SECRET_FILE = 'client_secret.json'
 APPLICATION_NAME = 'Directory API Python Sync'
+USER_QUERY = "orgUnitPath='/Google Users' isSuspended=false"
+# Directory API maximum for users.list
+PAGE_SIZE = 500
+
+SyncPlan = namedtuple('SyncPlan', ['inserts', 'updates', 'deletes'])
 
 
 def get_credentials():
@@ -45,6 +50,142 @@ def get_credentials():
     return credentials
 
 
+def fetch_users(service, page_size=PAGE_SIZE, limiter=None):
+    """Yield every Google user from the Directory API, following
+    nextPageToken until the last page. Each page is retried on rate limit
+    and server errors, and throttled by `limiter` if given.
+    """
+    page_token = None
+    while True:
+        results = execute(
+            service.users().list(
+                customer='my_customer',
+                query=USER_QUERY,
+                orderBy='email',
+                maxResults=page_size,
+                pageToken=page_token), limiter)
+        yield from results.get('users', [])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+
+def user_fields(user):
+    """Employee column values for a Directory API user resource
+    """
+    return dict(
+        first_name=user['name']['givenName'],
+        last_name=user['name']['familyName'],
+        email=user['primaryEmail'])
+
+
+def diff_people(users, people):
+    """Compare directory users against current 'person' rows.
+
+    `users` is an iterable of Directory API user resources and `people` an
+    iterable of (person_id, gsuite_id, first_name, last_name, email,
+    current_employee_flag) rows. Returns a SyncPlan of mappings to insert,
+    mappings to update, and person_ids to soft delete. People who are
+    already soft deleted are left alone.
+    """
+    directory = {user['id']: user for user in users}
+    current = {}
+    known_ids = set()
+    for (person_id, gsuite_id, first_name, last_name, email,
+         current_flag) in people:
+        known_ids.add(gsuite_id)
+        if current_flag is not False:
+            current[gsuite_id] = (person_id, dict(
+                first_name=first_name, last_name=last_name, email=email))
+
+    inserts = [
+        dict(gsuite_id=user_id, **user_fields(user))
+        for user_id, user in directory.items() if user_id not in known_ids
+    ]
+    updates = []
+    for user_id in directory.keys() & current.keys():
+        person_id, fields = current[user_id]
+        new_fields = user_fields(directory[user_id])
+        if new_fields != fields:
+            updates.append(dict(person_id=person_id, **new_fields))
+    deletes = [
+        current[user_id][0] for user_id in current.keys() - directory.keys()
+    ]
+    return SyncPlan(inserts, updates, deletes)
+
+
+def apply_plan(session, plan):
+    """Write a SyncPlan as bulk statements in a single transaction
+    """
+    try:
+        if plan.inserts:
+            session.bulk_insert_mappings(Employee, plan.inserts)
+        if plan.updates:
+            session.bulk_update_mappings(Employee, plan.updates)
+        if plan.deletes:
+            session.query(Employee).filter(
+                Employee.person_id.in_(plan.deletes)).update(
+                    {Employee.current_employee_flag: False},
+                    synchronize_session=False)
+        if plan.inserts:
+            org_chart.add_missing(session)
+        if plan.inserts or plan.updates:
+            changed = [update['person_id'] for update in plan.updates]
+            if plan.inserts:
+                changed.extend(
+                    person_id for person_id, in session.query(
+                        Employee.person_id).filter(Employee.gsuite_id.in_(
+                            [insert['gsuite_id'] for insert in plan.inserts])))
+            search.refresh(session, Employee, changed)
+        if plan.updates:
+            # client documents include the account lead's email
+            search.refresh(
+                session, Client,
+                session.query(Client.client_organization_id).filter(
+                    Client.account_manager_id.in_(
+                        [update['person_id'] for update in plan.updates])))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+
+def sync(service, session, limiter=None):
+    """Run the fetch, diff and apply steps, returning a report dict of
+    row counts and per-step timings in seconds.
+    """
+    timings = {}
+
+    started = time.monotonic()
+    users = list(fetch_users(service, limiter=limiter))
+    timings['fetch'] = time.monotonic() - started
+
+    started = time.monotonic()
+    people = session.query(Employee.person_id, Employee.gsuite_id,
+                           Employee.first_name, Employee.last_name,
+                           Employee.email, Employee.current_employee_flag)
+    plan = diff_people(users, people)
+    timings['diff'] = time.monotonic() - started
+
+    started = time.monotonic()
+    apply_plan(session, plan)
+    timings['apply'] = time.monotonic() - started
+
+    return dict(
+        users=len(users),
+        inserted=len(plan.inserts),
+        updated=len(plan.updates),
+        deleted=len(plan.deletes),
+        timings=timings)
+
+
+def print_report(report):
+    print('{users} directory users: {inserted} inserted, {updated} updated, '
+          '{deleted} soft deleted'.format(**report))
+    print(', '.join('{0} {1:.3f}s'.format(step, seconds)
+                    for step, seconds in report['timings'].items()))
+
+
 def main():
     """
     Simple script to fetch all OAO internal users from Google Directory API
@@ -52,50 +193,21 @@ def main():
 
     Users are matched based on Google user id. Any id values appearing in the
     API pull that aren't already added get a row inserted with name, gsuite_id,
-    and email. Manager is left to be filled in by the administrative user.
+    and email, and existing rows get their name and email refreshed. Manager
+    is left to be filled in by the administrative user.
 
-    After that, and similiarly, any id values in the database table that are
-    not in the pull from Google have their current_employee_flag set to False
+    After that, and similiarly, any current employees in the database table
+    whose id is not in the pull from Google have their current_employee_flag
+    set to False. All writes are committed in one transaction.
     """
     credentials = get_credentials()
-    http = credentials.authorize(httplib2.Http())
-    service = discovery.build('admin', 'directory_v1', http=http)
-
-    # Get all Google Users from Directory API
-    results = service.users().list(
-        customer='my_customer',
-        query="orgUnitPath='/Google Users' isSuspended=false",
-        orderBy='email').execute()
-    users = results.get('users', [])
-    user_ids = [user['id'] for user in users]
-
-    # Get list of Employee codes (== user['id'] from google) from database
+    fetcher = DirectoryFetcher(lambda: build_service(credentials))
+
     session = Session()
-    person_query = session.query(Employee).all()
-    person_codes = [person.gsuite_id for person in person_query]
-
-    # Add any Google users to 'person' table if user['id'] not already
-    # in person_code
-    for user in users:
-        if user['id'] not in person_codes:
-            print(user['primaryEmail'], user['id'])
-            q = Employee(first_name=user['name']['givenName'],
-                         last_name=user['name']['familyName'],
-                         gsuite_id=user['id'],
-                         email=user['primaryEmail'])
-            session.add(q)
-            session.commit()
-
-    # Set current_employee_flag to False if person's gsuite_id not found in
-    # list of ids from Google, as a way to "soft delete" these users
-
-    # TODO: This will keep updating users that have already been soft-deleted.
-    #       Not a _terrible_ issue, but we should do better.
-    for person in person_codes:
-        if person not in user_ids:
-            q = session.query(Employee).filter_by(gsuite_id=person).first()
-            q.current_employee_flag = False
-            session.commit()
+    try:
+        print_report(sync(fetcher.service(), session, fetcher.limiter))
+    finally:
+        session.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,122 @@
+""" Local verification of Auth0 ID tokens.
+
+    The login callback gets the user's claims from the ID token in the
+    token response instead of a second request to Auth0's userinfo
+    endpoint. Tokens are checked against the tenant's signing keys, fetched
+    from its JWKS document and kept for JWKS_REFRESH seconds; a token
+    signed with a key id not seen yet refetches the document, at most once
+    every JWKS_MIN_REFRESH seconds, to pick up key rotation. If the
+    document can't be fetched the keys fetched last are kept, and the fetch
+    is retried no more than every JWKS_MIN_REFRESH seconds.
+"""
+import logging
+import os
+import threading
+import time
+
+import requests
+from authlib.common.errors import AuthlibBaseError
+from authlib.specs.oidc.claims import CodeIDToken
+from authlib.specs.rfc7517 import JWK
+from authlib.specs.rfc7518 import JWK_ALGORITHMS
+from authlib.specs.rfc7519 import JWT
+
+JWKS_REFRESH = int(os.getenv('JWKS_REFRESH', 3600))
+JWKS_MIN_REFRESH = 60
+JWKS_TIMEOUT = 5
+# allowed clock difference with Auth0, in seconds
+LEEWAY = 60
+
+log = logging.getLogger(__name__)
+jwk = JWK(algorithms=JWK_ALGORITHMS)
+jwt = JWT(algorithms=['RS256'])
+
+
+class InvalidIDToken(Exception):
+    """ The ID token is missing, malformed, badly signed or has the wrong
+        claims
+    """
+
+
+class KeysUnavailable(Exception):
+    """ The JWKS document can't be fetched and no keys were fetched before
+    """
+
+
+class KeySet():
+    """ Signing keys by key id from the JWKS document at `url`, refetched
+        every `ttl` seconds
+    """
+
+    def __init__(self, url, ttl=None):
+        self.url = url
+        self.ttl = JWKS_REFRESH if ttl is None else ttl
+        self._keys = {}
+        self._fetched_at = None
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        response = requests.get(self.url, timeout=JWKS_TIMEOUT)
+        response.raise_for_status()
+        return response.json()['keys']
+
+    def _refresh(self):
+        self._keys = {
+            key['kid']: jwk.loads(key)
+            for key in self.fetch() if key.get('use', 'sig') == 'sig'
+        }
+        self._fetched_at = time.monotonic()
+
+    def get(self, kid):
+        """ The public key with id `kid`, or None if the tenant has none;
+            raises KeysUnavailable if no keys could be fetched
+        """
+        with self._lock:
+            now = time.monotonic()
+            age = None if self._fetched_at is None else now - self._fetched_at
+            stale = (age is None or age > self.ttl
+                     or (kid not in self._keys and age > JWKS_MIN_REFRESH))
+            failed = (self._failed_at is not None
+                      and now - self._failed_at < JWKS_MIN_REFRESH)
+            if stale and not failed:
+                try:
+                    self._refresh()
+                except (requests.RequestException, KeyError,
+                        ValueError) as error:
+                    log.warning('Could not fetch %s: %s', self.url, error)
+                    self._failed_at = now
+            if not self._keys:
+                raise KeysUnavailable(self.url)
+            return self._keys.get(kid)
+
+
+def verify(id_token, keys, issuer, audience, nonce):
+    """ Claims of `id_token` once its signature, issuer, audience, expiry
+        and `nonce` are checked; raises InvalidIDToken otherwise, or
+        KeysUnavailable if the signing keys can't be fetched
+    """
+    if not id_token:
+        raise InvalidIDToken('No ID token in the token response')
+    if not nonce:
+        raise InvalidIDToken('No nonce to check the ID token against')
+
+    def key(header, payload):
+        public_key = keys.get(header.get('kid'))
+        if public_key is None:
+            raise InvalidIDToken('Unknown signing key')
+        return public_key
+
+    try:
+        claims = jwt.decode(
+            id_token,
+            key,
+            claims_cls=CodeIDToken,
+            claims_options=dict(
+                iss=dict(essential=True, value=issuer),
+                aud=dict(essential=True, value=audience)),
+            claims_params=dict(nonce=nonce))
+        claims.validate(leeway=LEEWAY)
+    except (AuthlibBaseError, ValueError) as error:
+        raise InvalidIDToken(str(error))
+    return dict(claims)
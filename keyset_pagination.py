@@ -0,0 +1,135 @@
+""" Keyset (seek) pagination for Flask-Admin SQLAlchemy list views.
+
+    When a list is in its default sort order, pages are fetched with
+    WHERE (sort column, primary key) > (last row's values) instead of
+    OFFSET, so every page costs about the same as the first and rows don't
+    shift between pages while people edit. The position is carried in the
+    URL as an opaque `after` or `before` cursor next to the usual page,
+    filter and search arguments.
+
+    Explicit sorts, searches (which are ranked) and nullable sort columns
+    fall back to OFFSET paging. Keyset views use the simple prev/next pager,
+    since arbitrary page numbers can't be reached from a cursor.
+"""
+import base64
+import binascii
+import json
+
+from flask import abort, g, request
+from sqlalchemy import tuple_
+
+# cursor values the driver can bind
+SCALARS = (str, int, float)
+
+
+def encode_cursor(values):
+    text = json.dumps(values, default=str).encode('utf-8')
+    return base64.urlsafe_b64encode(text).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """ Values encoded in `cursor`, or None if it is malformed or holds
+        anything but strings, numbers and nulls
+    """
+    try:
+        text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(text.decode('utf-8'))
+    except (binascii.Error, ValueError):
+        return None
+    if not isinstance(values, list) or len(values) != 2:
+        return None
+    if not all(value is None or isinstance(value, SCALARS)
+               for value in values):
+        return None
+    return values
+
+
+class KeysetPaginationMixin():
+    keyset_pagination = True
+    simple_list_pager = True
+
+    def _keyset_order(self, sort_column, search):
+        """ (column, descending) to seek on, or None to use OFFSET paging
+        """
+        if not self.keyset_pagination or search or sort_column is not None:
+            return None
+        order = self._get_default_order()
+        if order is None:
+            return None
+        column, joins, desc = order
+        if joins or not hasattr(column, 'property'):
+            return None
+        if any(c.nullable for c in getattr(column.property, 'columns', [])):
+            return None
+        return column, desc
+
+    def _keyset_cursor(self):
+        """ ('after' or 'before', values) from the request, or None; aborts
+            with 400 for a malformed cursor
+        """
+        for direction in ('after', 'before'):
+            if request.args.get(direction):
+                values = decode_cursor(request.args[direction])
+                if values is None:
+                    abort(400)
+                return direction, values
+        return None
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        order = self._keyset_order(sort_column, search)
+        cursor = self._keyset_cursor()
+        if not execute or order is None or (page and cursor is None):
+            return super().get_list(page, sort_column, sort_desc, search,
+                                    filters, execute, page_size)
+
+        column, desc = order
+        count, query = super().get_list(
+            0, sort_column, sort_desc, search, filters, execute=False,
+            page_size=0)
+
+        pk = getattr(self.model, self._primary_key)
+        key = tuple_(column, pk)
+        backwards = cursor is not None and cursor[0] == 'before'
+        scan_desc = desc != backwards
+        if cursor is not None:
+            bound = tuple_(*cursor[1])
+            query = query.filter(key < bound if scan_desc else key > bound)
+        query = query.order_by(None).order_by(
+            *[c.desc() if scan_desc else c.asc() for c in (column, pk)])
+        data = query.limit(page_size or self.page_size).all()
+        if backwards:
+            data.reverse()
+
+        def row_cursor(row):
+            return encode_cursor(
+                [getattr(row, column.key),
+                 getattr(row, self._primary_key)])
+
+        g.keyset = dict(
+            view=self,
+            page=page,
+            args={k: request.args[k]
+                  for k in ('after', 'before') if k in request.args},
+            next=row_cursor(data[-1]) if data else None,
+            prev=row_cursor(data[0]) if data else None)
+        return count, data
+
+    def _get_list_url(self, view_args):
+        """ Carry the cursor for the neighbouring pages in pager links
+        """
+        keyset = g.get('keyset')
+        if keyset is not None and keyset['view'] is self:
+            cursor = {}
+            if view_args.page == keyset['page'] and view_args.page:
+                cursor = keyset['args']
+            elif view_args.page == keyset['page'] + 1 and keyset['next']:
+                cursor = dict(after=keyset['next'])
+            elif (view_args.page == keyset['page'] - 1 and view_args.page
+                  and keyset['prev']):
+                cursor = dict(before=keyset['prev'])
+            if cursor:
+                extra_args = dict(view_args.extra_args)
+                extra_args.update(cursor)
+                view_args = view_args.clone(extra_args=extra_args)
+        return super()._get_list_url(view_args)
@@ -0,0 +1,176 @@
+""" Cached list pages for the admin views.
+
+    ListCacheMixin keeps the rendered HTML of a view's list page, keyed on
+    its URL path, its query string with the arguments sorted and empty ones
+    dropped, and two versions of the view's `cache_tables`: the
+    table_versions this process bumps on any change it makes (an edit, a
+    list edit, a bulk action or import), and the newest modified_datetime
+    of each table that has one, read with one statement per request that
+    the (modified_datetime, key) indexes answer. Edits other workers or the
+    directory sync commit move the latter, so later requests miss and
+    render the page again.
+
+    Pages are kept for at most LIST_CACHE_TTL seconds, to pick up what
+    neither version shows: rows other processes delete, or stamp no later
+    than the newest one already seen (a transaction that started earlier,
+    or within the same second on SQLite). The cache is least recently used
+    and holds at most LIST_CACHE_BYTES, which 0 turns off. The page holds
+    nothing specific to the user: requests with flashed messages waiting to
+    be shown, or that change the session while rendering, are neither
+    served from nor stored in the cache.
+"""
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import request, session
+from flask_admin import expose
+from sqlalchemy import func, select
+
+import table_versions
+from models import metadata
+
+LIST_CACHE_TTL = int(os.getenv('LIST_CACHE_TTL', 30))
+LIST_CACHE_BYTES = int(os.getenv('LIST_CACHE_BYTES', 16 * 1024 * 1024))
+# larger pages would push out too many others
+LIST_CACHE_MAX_PAGE = 4
+
+
+class PageCache():
+    """ Least recently used cache of rendered pages, each kept for `ttl`
+        seconds, holding at most `max_bytes` of keys and pages
+    """
+
+    def __init__(self, max_bytes=None, ttl=None):
+        self.max_bytes = LIST_CACHE_BYTES if max_bytes is None else max_bytes
+        self.ttl = LIST_CACHE_TTL if ttl is None else ttl
+        self.bytes = 0
+        self.stats = dict.fromkeys(
+            ('hits', 'misses', 'bypasses', 'stores', 'evictions',
+             'expirations', 'oversized'), 0)
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is None:
+                self.stats['misses'] += 1
+                return None
+            if cached[0] <= now:
+                self._remove(key)
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._pages.move_to_end(key)
+            self.stats['hits'] += 1
+            return cached[1]
+
+    def put(self, key, page):
+        size = sys.getsizeof(key) + sys.getsizeof(page)
+        with self._lock:
+            if size > self.max_bytes // LIST_CACHE_MAX_PAGE:
+                self.stats['oversized'] += 1
+                return
+            if key in self._pages:
+                self._remove(key)
+            self._pages[key] = (time.monotonic() + self.ttl, page, size)
+            self.bytes += size
+            self.stats['stores'] += 1
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._pages)))
+                self.stats['evictions'] += 1
+
+    def _remove(self, key):
+        self.bytes -= self._pages.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.bytes = 0
+
+    def snapshot(self):
+        """ Counters, and the number and size of cached pages
+        """
+        with self._lock:
+            return dict(self.stats, entries=len(self._pages), bytes=self.bytes)
+
+
+cache = PageCache()
+
+
+def normalized_query():
+    """ The request's query string with its arguments sorted and those
+        without a value dropped
+    """
+    return '&'.join(
+        '{0}={1}'.format(key, value)
+        for key, value in sorted(request.args.items(multi=True)) if value)
+
+
+def shared_versions(session, tables):
+    """ Newest modified_datetime of each of the named `tables` that has one
+    """
+    newest = [
+        select([func.max(table.c.modified_datetime)]).as_scalar()
+        for table in map(metadata.tables.get, tables)
+        if 'modified_datetime' in table.c
+    ]
+    if not newest:
+        return ()
+    return tuple(session.execute(select(newest)).first())
+
+
+class ListCacheMixin():
+    """ Serve the list page from `cache` while the view's `cache_tables`,
+        by default the model's table, are unchanged
+    """
+    cache_tables = None
+
+    def _cache_tables(self):
+        return self.cache_tables or [self.model.__table__.name]
+
+    def _local_versions(self):
+        return [table_versions.get(table) for table in self._cache_tables()]
+
+    def _list_cache_key(self, local):
+        # read before rendering, so the page is no older than the key
+        shared = shared_versions(self.session, self._cache_tables())
+        return '{0}?{1}#{2}#{3}'.format(
+            request.path, normalized_query(), ','.join(map(str, local)),
+            ','.join(map(str, shared)))
+
+    @expose('/')
+    def index_view(self):
+        if not cache.max_bytes or session.get('_flashes'):
+            cache.count('bypasses')
+            return super().index_view()
+        local = self._local_versions()
+        key = self._list_cache_key(local)
+        page = cache.get(key)
+        if page is not None:
+            return page
+        page = super().index_view()
+        # not a redirect, a page showing a message flashed while rendering, or
+        # one rendered while this process changed the tables
+        if (isinstance(page, str) and not session.modified
+                and local == self._local_versions()):
+            cache.put(key, page)
+        return page
+
+    def after_model_change(self, form, model, is_created):
+        # on_model_change bumps before the commit, so a page rendered in
+        # between may hold the old rows under the new version
+        table_versions.bump(self.model.__table__.name)
+        super().after_model_change(form, model, is_created)
+
+    def after_model_delete(self, model):
+        table_versions.bump(self.model.__table__.name)
+        super().after_model_delete(model)
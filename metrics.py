@@ -0,0 +1,214 @@
+""" Per-request SQL and latency instrumentation.
+
+    SQLAlchemy cursor events time every statement, and Flask request hooks
+    time every request. Totals are kept per endpoint (e.g.
+    'client.index_view', 'employee.ajax_update', 'callback_handling') and
+    rendered in Prometheus text format by `render`.
+
+    Requests slower than SLOW_REQUEST_SECONDS are logged with their slowest
+    statements, and for a SLOW_REQUEST_EXPLAIN_RATE fraction of them on
+    Postgres, the EXPLAIN plan of the slowest SELECT.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import database
+import list_cache
+
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 0))
+SLOW_REQUEST_EXPLAIN_RATE = float(os.getenv('SLOW_REQUEST_EXPLAIN_RATE', 0))
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOWEST_STATEMENTS = 10
+
+log = logging.getLogger(__name__)
+
+
+class EndpointStats():
+    def __init__(self):
+        self.requests = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+    def record(self, latency, queries, sql_seconds):
+        self.requests += 1
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+        self.queries += queries
+        self.sql_seconds += sql_seconds
+
+
+class Registry():
+    def __init__(self):
+        self.endpoints = defaultdict(EndpointStats)
+        # (seconds, endpoint, statement), slowest first
+        self.slowest = []
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency, stats):
+        with self._lock:
+            self.endpoints[endpoint].record(latency, stats.queries,
+                                            stats.seconds)
+            for seconds, statement, _ in stats.slowest:
+                self.slowest.append((seconds, endpoint, statement))
+            self.slowest.sort(key=lambda s: s[0], reverse=True)
+            del self.slowest[SLOWEST_STATEMENTS:]
+
+
+registry = Registry()
+
+
+class RequestSQL():
+    """ SQL totals for one request, keeping its three slowest statements
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest = []
+
+    def record(self, seconds, statement, parameters):
+        self.queries += 1
+        self.seconds += seconds
+        if len(self.slowest) < 3 or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement, parameters))
+            self.slowest.sort(key=lambda s: s[0], reverse=True)
+            del self.slowest[3:]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    # kept on the statement's execution context, which is dropped with it
+    # if the statement fails; statements run without one aren't timed
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None:
+        return
+    if has_request_context() and 'request_sql' in g:
+        g.request_sql.record(time.perf_counter() - started, statement,
+                             parameters)
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.request_sql = RequestSQL()
+
+
+def _finish_request(exc=None):
+    if 'request_started' not in g:
+        return
+    latency = time.perf_counter() - g.request_started
+    stats = g.pop('request_sql')
+    endpoint = request.endpoint or 'unmatched'
+    registry.record(endpoint, latency, stats)
+    if SLOW_REQUEST_SECONDS and latency >= SLOW_REQUEST_SECONDS:
+        log_slow_request(endpoint, latency, stats)
+
+
+def log_slow_request(endpoint, latency, stats):
+    log.warning('Slow request %s: %.3fs, %d queries, %.3fs SQL', endpoint,
+                latency, stats.queries, stats.seconds)
+    for seconds, statement, _ in stats.slowest:
+        log.warning('  %.3fs %s', seconds, ' '.join(statement.split()))
+    if stats.slowest and random.random() < SLOW_REQUEST_EXPLAIN_RATE:
+        log_explain(stats.slowest)
+
+
+def log_explain(slowest):
+    if not database.engine.dialect.name == 'postgresql':
+        return
+    for seconds, statement, parameters in slowest:
+        if statement.lstrip().upper().startswith('SELECT'):
+            connection = database.engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute('EXPLAIN ' + statement, parameters)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                log.warning('  EXPLAIN (%.3fs):\n%s', seconds, plan)
+            finally:
+                connection.close()
+            return
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.teardown_request(_finish_request)
+
+
+def _label(value):
+    value = ' '.join(str(value).split())[:200]
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render():
+    """ All metrics in Prometheus text exposition format
+    """
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        for suffix, labels, value in samples:
+            label_text = ','.join('{0}="{1}"'.format(k, _label(v))
+                                  for k, v in labels)
+            lines.append('{0}{1}{{{2}}} {3}'.format(name, suffix, label_text,
+                                                   value))
+
+    with registry._lock:
+        endpoints = sorted(registry.endpoints.items())
+        slowest = list(registry.slowest)
+
+    histogram = []
+    for endpoint, stats in endpoints:
+        for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+            histogram.append(('_bucket', [('endpoint', endpoint),
+                                          ('le', bound)], count))
+        histogram.append(('_bucket', [('endpoint', endpoint), ('le', '+Inf')],
+                          stats.requests))
+        histogram.append(('_sum', [('endpoint', endpoint)],
+                          stats.latency_sum))
+        histogram.append(('_count', [('endpoint', endpoint)],
+                          stats.requests))
+    metric('account_admin_request_seconds', 'histogram',
+           'End-to-end request latency', histogram)
+    metric('account_admin_sql_queries_total', 'counter',
+           'SQL statements run by requests',
+           [('', [('endpoint', e)], s.queries) for e, s in endpoints])
+    metric('account_admin_sql_seconds_total', 'counter',
+           'Time spent in SQL statements by requests',
+           [('', [('endpoint', e)], s.sql_seconds) for e, s in endpoints])
+    metric('account_admin_slowest_sql_seconds', 'gauge',
+           'Slowest SQL statements seen', [('', [('endpoint', e),
+                                                 ('statement', stmt)], sec)
+                                           for sec, e, stmt in slowest])
+    metric('account_admin_db_pool', 'gauge',
+           'Connection pool occupancy and checkout waits',
+           [('', [('stat', k)], v)
+            for k, v in sorted(database.pool_stats().items())])
+    page_cache = list_cache.cache.snapshot()
+    metric('account_admin_list_cache_total', 'counter',
+           'List page cache lookups and changes',
+           [('', [('event', k)], v) for k, v in sorted(page_cache.items())
+            if k not in ('entries', 'bytes')])
+    metric('account_admin_list_cache_size', 'gauge',
+           'Pages and bytes in the list page cache',
+           [('', [('stat', k)], page_cache[k]) for k in ('entries', 'bytes')])
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,262 @@
+""" Managed schema migrations.
+
+    MIGRATIONS are applied in order, each once per database in its own
+    transaction, and recorded by name in the schema_migration table. They
+    only add what models.py declares, if missing, and fill what is derived
+    from existing rows, so a database created from the models by create_all,
+    or set up by hand before a migration existed, can be migrated too.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --list     # show which are applied
+"""
+import argparse
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
+
+import org_chart
+import search
+import workload
+from models import (Client, Employee, Office, Product, engine, metadata,
+                    t_client_product_association, t_lead_product_mix,
+                    t_lead_workload, t_person_closure, t_schema_migration,
+                    t_web_session)
+
+Migration = namedtuple('Migration', ['name', 'description', 'apply'])
+Session = sessionmaker()
+
+FEED_MODELS = (Client, Employee, Product, Office)
+
+
+class MigrationError(Exception):
+    """ The data doesn't allow the migration; nothing was changed
+    """
+
+
+def indexes(table, *names):
+    by_name = {index.name: index for index in table.indexes}
+    return [by_name[name] for name in names]
+
+
+def create_indexes(bind, indexes):
+    """ Create `indexes` if missing. Expression indexes can't be
+        reflected, so this leans on IF NOT EXISTS.
+    """
+    for index in indexes:
+        ddl = str(CreateIndex(index).compile(bind=bind))
+        # CREATE INDEX or CREATE UNIQUE INDEX
+        bind.execute(ddl.replace(' INDEX ', ' INDEX IF NOT EXISTS ', 1))
+
+
+def fill(connection, refresh):
+    """ Run `refresh(session)` with a session in the migration's
+        transaction
+    """
+    forget_installed(connection)
+    session = Session(bind=connection)
+    try:
+        refresh(session)
+    finally:
+        session.close()
+        # seen from inside a transaction that may yet roll back
+        forget_installed(connection)
+
+
+def forget_installed(bind):
+    """ Drop what the modules remember about whether their tables exist,
+        as they skip them while they don't
+    """
+    key = str(bind.engine.url)
+    for module in (search, org_chart, workload):
+        module._installed.pop(key, None)
+
+
+def check_unique(connection, column):
+    """ Raise MigrationError if `column` has duplicated values
+    """
+    duplicates = connection.execute(
+        select([column]).where(column.isnot(None)).group_by(column).having(
+            func.count() > 1).order_by(column).limit(10)).fetchall()
+    if duplicates:
+        raise MigrationError('{0} values used more than once: {1}'.format(
+            column, ', '.join(str(value) for value, in duplicates)))
+
+
+def foreign_key_indexes(connection):
+    create_indexes(
+        connection,
+        indexes(Client.__table__, 'client_organization_account_manager_idx',
+                'client_organization_secondary_manager_idx') +
+        indexes(Employee.__table__, 'person_manager_idx', 'person_office_idx')
+        + indexes(t_client_product_association,
+                  'client_product_association_client_idx'))
+
+
+def list_indexes(connection):
+    create_indexes(
+        connection,
+        indexes(Client.__table__, 'client_organization_active_name_idx') +
+        indexes(Employee.__table__, 'person_current_email_idx') +
+        indexes(Product.__table__, 'product_type_name_idx'))
+
+
+def unique_keys(connection):
+    check_unique(connection, Employee.__table__.c.person_code)
+    check_unique(connection, Product.__table__.c.product_type_code)
+    create_indexes(
+        connection,
+        indexes(Employee.__table__, 'person_person_code_key') + indexes(
+            Product.__table__, 'product_type_code_key'))
+
+
+def search_documents(connection):
+    search.create_schema(connection)
+
+    def refresh(session):
+        for model in search.SOURCES:
+            search.refresh(session, model)
+
+    fill(connection, refresh)
+
+
+def person_closure(connection):
+    metadata.create_all(connection, tables=[t_person_closure])
+    fill(connection, org_chart.rebuild)
+
+
+def lead_workload(connection):
+    metadata.create_all(
+        connection, tables=[t_lead_workload, t_lead_product_mix])
+    fill(connection, workload.refresh)
+
+
+def web_sessions(connection):
+    metadata.create_all(connection, tables=[t_web_session])
+
+
+def person_prefix_indexes(connection):
+    create_indexes(
+        connection,
+        indexes(Employee.__table__, 'person_email_prefix_idx',
+                'person_first_name_prefix_idx',
+                'person_last_name_prefix_idx'))
+
+
+def client_code_key(connection):
+    try:
+        check_unique(connection, Client.__table__.c.client_organization_code)
+    except MigrationError as error:
+        raise MigrationError(
+            '{0}; run python client_codes.py --revalidate to recode them'.
+            format(error))
+    create_indexes(connection,
+                   indexes(Client.__table__, 'client_organization_code_key'))
+
+
+def change_feed(connection):
+    for model in FEED_MODELS:
+        # rows that predate the feed
+        table = model.__table__
+        connection.execute(table.update().where(
+            table.c.modified_datetime.is_(None)).values(
+                modified_datetime=func.coalesce(table.c.created_datetime,
+                                                func.now())))
+    create_indexes(
+        connection,
+        [
+            index for model in FEED_MODELS
+            for index in model.__table__.indexes
+            if index.name.endswith('_modified_idx')
+        ] + indexes(Client.__table__,
+                    'client_organization_dfp_network_code_idx') +
+        indexes(Employee.__table__, 'person_email_lower_idx'))
+
+
+MIGRATIONS = [
+    Migration('0001_foreign_key_indexes',
+              'Indexes on client leads, managers, offices and client '
+              'products', foreign_key_indexes),
+    Migration('0002_list_indexes',
+              'Partial indexes for active clients and current employees, '
+              'and product names', list_indexes),
+    Migration('0003_unique_keys', 'Unique person codes and product codes',
+              unique_keys),
+    Migration('0004_search_documents',
+              'pg_trgm and the client and employee search documents',
+              search_documents),
+    Migration('0005_person_closure', 'Org chart closure table',
+              person_closure),
+    Migration('0006_lead_workload',
+              'Account lead workload and product mix summaries',
+              lead_workload),
+    Migration('0007_web_sessions', 'Server-side session table',
+              web_sessions),
+    Migration('0008_person_prefix_indexes',
+              'Prefix indexes for the typeahead pickers',
+              person_prefix_indexes),
+    Migration('0009_client_code_key', 'Unique client codes',
+              client_code_key),
+    Migration('0010_change_feed',
+              'modified_datetime backfill, change feed and API lookup '
+              'indexes', change_feed),
+]
+
+
+def applied(bind):
+    """ Names of the migrations applied to `bind`, with when
+    """
+    metadata.create_all(bind, tables=[t_schema_migration])
+    return dict(
+        bind.execute(
+            select([
+                t_schema_migration.c.migration_name,
+                t_schema_migration.c.applied_datetime
+            ])).fetchall())
+
+
+def migrate(bind=engine):
+    """ Apply pending migrations, returning their names
+    """
+    done = applied(bind)
+    names = []
+    for migration in MIGRATIONS:
+        if migration.name in done:
+            continue
+        with bind.begin() as connection:
+            migration.apply(connection)
+            connection.execute(t_schema_migration.insert().values(
+                migration_name=migration.name,
+                applied_datetime=datetime.utcnow()))
+        names.append(migration.name)
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply schema migrations')
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='show migrations and when they were applied')
+    args = parser.parse_args()
+
+    if args.list:
+        done = applied(engine)
+        for migration in MIGRATIONS:
+            print('{0}  {1}  {2}'.format(
+                migration.name, done.get(migration.name, 'pending'),
+                migration.description))
+        return
+    try:
+        names = migrate(engine)
+    except MigrationError as error:
+        raise SystemExit(str(error))
+    for name in names:
+        print('Applied ' + name)
+    print('{0} migrations applied'.format(len(names)))
+
+
+if __name__ == '__main__':
+    main()
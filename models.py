@@ -1,14 +1,11 @@
 # coding: utf-8
-import os
-
-from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Integer,
-                        Table, Text, create_engine, text)
+from sqlalchemy import (Boolean, Column, Date, DateTime, ForeignKey, Index,
+                        Integer, Table, Text, func, text)
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
-engine = create_engine(
-    os.getenv('DATABASE_URL', ('postgres://account_admin_user@localhost:5454'
-                               '/account_admin')))
+from database import engine
 
 Base = declarative_base(engine)
 metadata = Base.metadata
@@ -24,11 +21,32 @@ t_client_product_association = Table(
         'client_organization_id',
         ForeignKey('client_organization.client_organization_id'),
         primary_key=True,
-        nullable=False))
+        nullable=False),
+    # the primary key serves lookups by product
+    Index('client_product_association_client_idx', 'client_organization_id'))
 
 
 class Client(Base):
     __tablename__ = 'client_organization'
+    __table_args__ = (
+        Index(
+            'client_organization_code_key',
+            'client_organization_code',
+            unique=True),
+        Index('client_organization_dfp_network_code_idx', 'dfp_network_code'),
+        Index('client_organization_modified_idx', 'modified_datetime',
+              'client_organization_id'),
+        Index('client_organization_account_manager_idx',
+              'account_manager_id'),
+        Index('client_organization_secondary_manager_idx',
+              'secondary_manager_id'),
+        # the default list: active clients in name order
+        Index(
+            'client_organization_active_name_idx',
+            'client_organization_name',
+            'client_organization_id',
+            postgresql_where=text('active_client_flag')),
+    )
 
     client_organization_id = Column(
         Integer,
@@ -52,7 +70,8 @@ class Client(Base):
     contract_end_date = Column(Date)
     active_client_flag = Column(Boolean, server_default=text("true"))
     created_datetime = Column(DateTime, server_default=text("now()"))
-    modified_datetime = Column(DateTime)
+    modified_datetime = Column(
+        DateTime, default=func.now(), onupdate=func.now())
     created_by = Column(Text)
     modified_by = Column(Text)
 
@@ -73,6 +92,13 @@ class Client(Base):
 
 class Product(Base):
     __tablename__ = 'product_type'
+    __table_args__ = (
+        Index('product_type_modified_idx', 'modified_datetime',
+              'product_type_id'),
+        # imports look products up by code
+        Index('product_type_code_key', 'product_type_code', unique=True),
+        Index('product_type_name_idx', 'product_type_name'),
+    )
 
     product_type_id = Column(
         Integer,
@@ -83,7 +109,8 @@ class Product(Base):
     product_type_name = Column(Text, nullable=False)
     product_type_description = Column(Text)
     created_datetime = Column(DateTime, server_default=text("now()"))
-    modified_datetime = Column(DateTime)
+    modified_datetime = Column(
+        DateTime, default=func.now(), onupdate=func.now())
     created_by = Column(Text)
     modified_by = Column(Text)
 
@@ -98,6 +125,19 @@ class Product(Base):
 
 class Employee(Base):
     __tablename__ = 'person'
+    __table_args__ = (
+        Index('person_modified_idx', 'modified_datetime', 'person_id'),
+        # the directory sync matches people on their G Suite id
+        Index('person_person_code_key', 'person_code', unique=True),
+        Index('person_manager_idx', 'manager_person_id'),
+        Index('person_office_idx', 'office_id'),
+        # the employee list: current employees in email order
+        Index(
+            'person_current_email_idx',
+            'email',
+            'person_id',
+            postgresql_where=text('current_employee_flag')),
+    )
 
     gsuite_id = Column('person_code', Text, nullable=False)
     first_name = Column(Text, nullable=False)
@@ -105,7 +145,8 @@ class Employee(Base):
     office_id = Column(ForeignKey('office.office_id'))
     email = Column(Text, nullable=False)
     created_datetime = Column(DateTime, server_default=text("now()"))
-    modified_datetime = Column(DateTime)
+    modified_datetime = Column(
+        DateTime, default=func.now(), onupdate=func.now())
     person_id = Column(
         Integer,
         primary_key=True,
@@ -126,8 +167,28 @@ class Employee(Base):
     __mapper_args__ = {"order_by": email}
 
 
+# case-insensitive email lookups
+Index('person_email_lower_idx', func.lower(Employee.email))
+# prefix matching for typeahead pickers; text_pattern_ops lets LIKE 'x%' use
+# the index whatever the database collation
+Index(
+    'person_email_prefix_idx',
+    func.lower(Employee.email).label('email'),
+    postgresql_ops={'email': 'text_pattern_ops'})
+Index(
+    'person_first_name_prefix_idx',
+    func.lower(Employee.first_name).label('first_name'),
+    postgresql_ops={'first_name': 'text_pattern_ops'})
+Index(
+    'person_last_name_prefix_idx',
+    func.lower(Employee.last_name).label('last_name'),
+    postgresql_ops={'last_name': 'text_pattern_ops'})
+
+
 class Office(Base):
     __tablename__ = 'office'
+    __table_args__ = (Index('office_modified_idx', 'modified_datetime',
+                            'office_id'), )
 
     office_id = Column(
         Integer,
@@ -135,9 +196,119 @@ class Office(Base):
         server_default=text("nextval('oao_office_office_id_seq'::regclass)"))
     office_name = Column(Text, nullable=False)
     created_datetime = Column(DateTime, server_default=text("now()"))
-    modified_datetime = Column(DateTime)
+    modified_datetime = Column(
+        DateTime, default=func.now(), onupdate=func.now())
     created_by = Column(Text)
     modified_by = Column(Text)
 
     def __str__(self):
         return self.office_name
+
+
+""" Search documents maintained by search.py. On Postgres the document is
+    trigram indexed for substring matching and its tsvector used for ranking.
+"""
+t_client_search_document = Table(
+    'client_search_document',
+    metadata,
+    Column(
+        'client_organization_id',
+        ForeignKey(
+            'client_organization.client_organization_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column('document', Text, nullable=False),
+    Column('document_tsv', Text().with_variant(TSVECTOR(), 'postgresql')),
+    Index(
+        'client_search_document_trgm_idx',
+        'document',
+        postgresql_using='gin',
+        postgresql_ops={'document': 'gin_trgm_ops'}),
+    Index(
+        'client_search_document_tsv_idx',
+        'document_tsv',
+        postgresql_using='gin'))
+
+t_employee_search_document = Table(
+    'employee_search_document',
+    metadata,
+    Column(
+        'person_id',
+        ForeignKey('person.person_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column('document', Text, nullable=False),
+    Column('document_tsv', Text().with_variant(TSVECTOR(), 'postgresql')),
+    Index(
+        'employee_search_document_trgm_idx',
+        'document',
+        postgresql_using='gin',
+        postgresql_ops={'document': 'gin_trgm_ops'}),
+    Index(
+        'employee_search_document_tsv_idx',
+        'document_tsv',
+        postgresql_using='gin'))
+
+""" Reporting structure closure table maintained by org_chart.py: one row
+    per (ancestor, descendant) pair along Employee.manager, plus a depth 0
+    row for each person.
+"""
+t_person_closure = Table(
+    'person_closure',
+    metadata,
+    Column(
+        'ancestor_id',
+        ForeignKey('person.person_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column(
+        'descendant_id',
+        ForeignKey('person.person_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column('depth', Integer, nullable=False),
+    Index('person_closure_descendant_idx', 'descendant_id', 'depth'))
+
+""" Account lead workload summary maintained by workload.py: active clients
+    each lead carries as primary and as secondary lead, in total and by
+    product.
+"""
+t_lead_workload = Table(
+    'lead_workload',
+    metadata,
+    Column(
+        'person_id',
+        ForeignKey('person.person_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column('primary_clients', Integer, nullable=False),
+    Column('secondary_clients', Integer, nullable=False),
+    Column('refreshed_datetime', DateTime, nullable=False))
+
+t_lead_product_mix = Table(
+    'lead_product_mix',
+    metadata,
+    Column(
+        'person_id',
+        ForeignKey('person.person_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column(
+        'product_type_id',
+        ForeignKey('product_type.product_type_id', ondelete='CASCADE'),
+        primary_key=True),
+    Column('primary_clients', Integer, nullable=False),
+    Column('secondary_clients', Integer, nullable=False))
+
+""" Server-side session data for sessions.SQLStore, keyed by the id in the
+    session cookie.
+"""
+t_web_session = Table(
+    'web_session',
+    metadata,
+    Column('session_id', Text, primary_key=True),
+    Column('data', Text, nullable=False),
+    Column('expires_datetime', DateTime, nullable=False),
+    Index('web_session_expires_idx', 'expires_datetime'))
+
+""" Schema migrations applied by migrations.py, by name.
+"""
+t_schema_migration = Table(
+    'schema_migration',
+    metadata,
+    Column('migration_name', Text, primary_key=True),
+    Column('applied_datetime', DateTime, nullable=False))
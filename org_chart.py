@@ -0,0 +1,268 @@
+""" Reporting structure queries over Employee.manager.
+
+    Reports (everyone under a person), chain of command and span of control
+    are each answered in a single statement: from the person_closure table
+    when it exists, otherwise with a recursive CTE over person.manager_person_id
+    bounded at MAX_DEPTH levels so bad data with a cycle still terminates.
+
+    The closure table is kept current from EmployeeAdmin.on_model_change
+    (move), the set manager bulk action (move_all) and the directory sync
+    (add_missing). migrations.py creates and fills it; run
+    `python org_chart.py` to rebuild it and report any management cycles.
+"""
+import time
+
+from sqlalchemy import and_, case, exists, func, inspect, literal, select
+from sqlalchemy.orm import sessionmaker
+
+from models import Employee, engine, t_person_closure
+from query_budget import cache_load
+
+MAX_DEPTH = 64
+INSTALLED_RECHECK = 30
+
+person = Employee.__table__
+closure = t_person_closure
+
+_installed = {}
+
+
+def is_installed(session):
+    """ Whether the closure table exists; once it does that is remembered
+        per database, until then it is checked again after
+        INSTALLED_RECHECK seconds
+    """
+    bind = session.get_bind()
+    key = str(bind.engine.url)
+    installed, checked = _installed.get(key, (False, None))
+    if not installed and (checked is None or
+                          time.monotonic() - checked >= INSTALLED_RECHECK):
+        with cache_load():
+            installed = closure.name in inspect(bind).get_table_names()
+        _installed[key] = (installed, time.monotonic())
+    return installed
+
+
+def _reports(session, person_id):
+    """ Select of (person_id, depth) for everyone under `person_id`
+    """
+    if is_installed(session):
+        return select([
+            closure.c.descendant_id.label('person_id'), closure.c.depth
+        ]).where(
+            and_(closure.c.ancestor_id == person_id, closure.c.depth > 0))
+
+    cte = select([
+        person.c.person_id,
+        literal(1).label('depth')
+    ]).where(person.c.manager_person_id == person_id).cte(
+        'reports', recursive=True)
+    cte = cte.union_all(
+        select([person.c.person_id, cte.c.depth + 1]).where(
+            and_(person.c.manager_person_id == cte.c.person_id,
+                 cte.c.depth < MAX_DEPTH)))
+    return select([cte.c.person_id,
+                   func.min(cte.c.depth).label('depth')]).group_by(
+                       cte.c.person_id)
+
+
+def _managers(session, person_id):
+    """ Select of (person_id, depth) for everyone above `person_id`
+    """
+    if is_installed(session):
+        return select([
+            closure.c.ancestor_id.label('person_id'), closure.c.depth
+        ]).where(
+            and_(closure.c.descendant_id == person_id, closure.c.depth > 0))
+
+    cte = select([
+        person.c.manager_person_id.label('person_id'),
+        literal(1).label('depth')
+    ]).where(
+        and_(person.c.person_id == person_id,
+             person.c.manager_person_id.isnot(None))).cte(
+                 'managers', recursive=True)
+    cte = cte.union_all(
+        select([person.c.manager_person_id, cte.c.depth + 1]).where(
+            and_(person.c.person_id == cte.c.person_id,
+                 person.c.manager_person_id.isnot(None),
+                 cte.c.depth < MAX_DEPTH)))
+    return select([cte.c.person_id,
+                   func.min(cte.c.depth).label('depth')]).group_by(
+                       cte.c.person_id)
+
+
+def _people(session, relatives):
+    relatives = relatives.alias('relatives')
+    rows = session.execute(
+        select([
+            person.c.person_id, person.c.first_name, person.c.last_name,
+            person.c.email, person.c.manager_person_id,
+            person.c.current_employee_flag, relatives.c.depth
+        ]).select_from(
+            person.join(relatives,
+                        relatives.c.person_id == person.c.person_id)).
+        order_by(relatives.c.depth, person.c.email))
+    return [dict(row) for row in rows]
+
+
+def reports(session, person_id):
+    """ Everyone under `person_id`, nearest first, with their depth
+    """
+    return _people(session, _reports(session, person_id))
+
+
+def chain_of_command(session, person_id):
+    """ Managers above `person_id`, direct manager first
+    """
+    return _people(session, _managers(session, person_id))
+
+
+def span_of_control(session, person_id):
+    """ Counts of direct and total reports for `person_id`
+    """
+    relatives = _reports(session, person_id).alias('relatives')
+    direct, total = session.execute(
+        select([
+            func.coalesce(
+                func.sum(case([(relatives.c.depth == 1, 1)], else_=0)), 0),
+            func.count()
+        ]).select_from(relatives)).first()
+    return dict(person_id=person_id, direct=direct, total=total)
+
+
+def would_create_cycle(session, person_id, manager_id):
+    """ Whether making `manager_id` the manager of `person_id` would
+        put someone above themselves
+    """
+    if manager_id is None:
+        return False
+    if manager_id == person_id:
+        return True
+    managers = _managers(session, manager_id).alias('managers')
+    return session.execute(
+        select([func.count()]).select_from(managers).where(
+            managers.c.person_id == person_id)).scalar() > 0
+
+
+def find_cycles(session):
+    """ Lists of person_ids that form management cycles
+    """
+    managers = dict(
+        session.execute(
+            select([person.c.person_id,
+                    person.c.manager_person_id])).fetchall())
+    cycles = []
+    done = set()
+    for start in managers:
+        path = []
+        seen = {}
+        current = start
+        while current is not None and current not in done:
+            if current in seen:
+                cycles.append(path[seen[current]:])
+                break
+            seen[current] = len(path)
+            path.append(current)
+            current = managers.get(current)
+        done.update(path)
+    return cycles
+
+
+def add_missing(session):
+    """ Add the depth 0 closure row for people who have none yet
+    """
+    if not is_installed(session):
+        return
+    has_self_row = exists().where(
+        and_(closure.c.ancestor_id == person.c.person_id,
+             closure.c.depth == 0))
+    missing = select([
+        person.c.person_id.label('ancestor_id'),
+        person.c.person_id.label('descendant_id'),
+        literal(0).label('depth')
+    ]).where(~has_self_row)
+    session.execute(closure.insert().from_select(
+        ['ancestor_id', 'descendant_id', 'depth'], missing))
+
+
+def move(session, person_id, manager_id):
+    """ Re-parent `person_id` and everyone under them to `manager_id`
+        (None for no manager) in the closure table
+    """
+    move_all(session, [person_id], manager_id)
+
+
+def move_all(session, person_ids, manager_id):
+    """ Re-parent everyone in `person_ids`, a list or a query of ids, and
+        everyone under them to `manager_id` (None for no manager) in the
+        closure table. `manager_id` must not be under any of them.
+    """
+    if not is_installed(session):
+        return
+    add_missing(session)
+    # unlink each moved subtree from everyone above its root, which also
+    # separates the subtrees of moved people under other moved people
+    sub = closure.alias('sub')
+    sup = closure.alias('sup')
+    session.execute(closure.delete().where(
+        exists().where(
+            and_(sub.c.ancestor_id.in_(person_ids),
+                 sub.c.descendant_id == closure.c.descendant_id,
+                 sup.c.descendant_id == sub.c.ancestor_id,
+                 sup.c.ancestor_id == closure.c.ancestor_id,
+                 sup.c.depth > 0))))
+    if manager_id is None:
+        return
+    session.execute(closure.insert().from_select(
+        ['ancestor_id', 'descendant_id', 'depth'],
+        select([
+            sup.c.ancestor_id, sub.c.descendant_id,
+            sup.c.depth + sub.c.depth + 1
+        ]).where(
+            and_(sup.c.descendant_id == manager_id,
+                 sub.c.ancestor_id.in_(person_ids)))))
+
+
+def rebuild(session):
+    """ Refill the closure table from person.manager_person_id, skipping
+        links that would repeat someone in their own chain
+    """
+    managers = dict(
+        session.execute(
+            select([person.c.person_id,
+                    person.c.manager_person_id])).fetchall())
+    rows = []
+    for descendant in managers:
+        rows.append(
+            dict(ancestor_id=descendant, descendant_id=descendant, depth=0))
+        seen = {descendant}
+        ancestor = managers.get(descendant)
+        depth = 1
+        while ancestor is not None and ancestor not in seen:
+            rows.append(
+                dict(
+                    ancestor_id=ancestor,
+                    descendant_id=descendant,
+                    depth=depth))
+            seen.add(ancestor)
+            ancestor = managers.get(ancestor)
+            depth += 1
+    session.execute(closure.delete())
+    if rows:
+        session.execute(closure.insert(), rows)
+
+
+def main():
+    session = sessionmaker(bind=engine)()
+    try:
+        rebuild(session)
+        session.commit()
+        for cycle in find_cycles(session):
+            print('Management cycle: ' + ' -> '.join(map(str, cycle)))
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
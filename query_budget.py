@@ -0,0 +1,80 @@
+""" Per-request SQL query counting, used to enforce query budgets on list
+    views while testing.
+
+    Every statement run through any SQLAlchemy engine is counted against
+    the current Flask app context, but only inside a `query_budget` block.
+    Statements run inside a `cache_load` block, which wraps the loads that
+    fill per-process caches (filter options, table checks, cached counts),
+    are counted separately and don't use up the budget, so budgets can be
+    set to what a request costs once those caches are warm.
+"""
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCount():
+    """ Statements run in a query_budget block: `queries` against the
+        budget and `cold_queries` filling caches
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.cold_queries = 0
+        self.cold_depth = 0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context():
+        return
+    count = g.get('query_count')
+    if count is None:
+        return
+    if count.cold_depth:
+        count.cold_queries += 1
+    else:
+        count.queries += 1
+
+
+@contextmanager
+def query_budget(budget, label='request'):
+    """ Raise QueryBudgetExceeded if the block runs more than `budget`
+        statements outside `cache_load` blocks; yields the QueryCount.
+        Counts are added to any enclosing block's.
+    """
+    previous = g.get('query_count')
+    count = g.query_count = QueryCount()
+    try:
+        yield count
+        if count.queries > budget:
+            raise QueryBudgetExceeded(
+                '{0} ran {1} queries, budget is {2}'.format(
+                    label, count.queries, budget))
+    finally:
+        g.query_count = previous
+        if previous is not None:
+            previous.queries += count.queries
+            previous.cold_queries += count.cold_queries
+
+
+@contextmanager
+def cache_load():
+    """ Count the block's statements as cache loads rather than against
+        the current budget
+    """
+    count = g.get('query_count') if has_app_context() else None
+    if count is None:
+        yield
+        return
+    count.cold_depth += 1
+    try:
+        yield
+    finally:
+        count.cold_depth -= 1
@@ -0,0 +1,186 @@
+""" Row count strategies for list views.
+
+    Views using the simple pager (as keyset views do) don't count rows, so
+    CountStrategyMixin counts them separately for the list heading, in one
+    of three ways picked by the view's `count_strategy`:
+    - 'exact': run the view's count query every time
+    - 'cached': run it once per search and filter combination, kept for
+      COUNT_CACHE_TTL seconds or until a model change bumps the table
+      version of one of the view's `count_tables`
+    - 'estimated': on Postgres, read the planner's estimate, from
+      pg_class.reltuples for an unfiltered list or the EXPLAIN row estimate
+      otherwise. Estimates below COUNT_ESTIMATE_EXACT_BELOW are too rough
+      to show and cheap to replace, so those lists are counted exactly.
+      Elsewhere lists are always counted exactly.
+
+    Estimated counts are shown as "about N".
+"""
+import json
+import os
+import threading
+import time
+
+from flask import g
+from sqlalchemy import text
+
+import table_versions
+from query_budget import cache_load
+
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 60))
+COUNT_CACHE_SIZE = 1000
+COUNT_ESTIMATE_EXACT_BELOW = int(os.getenv('COUNT_ESTIMATE_EXACT_BELOW', 1000))
+
+
+class EstimatedCount(int):
+    """ A row count taken from planner statistics
+    """
+
+    def __str__(self):
+        return 'about {0:,}'.format(int(self))
+
+
+class CountCache():
+    """ Counts by key, each kept for `ttl` seconds
+    """
+
+    def __init__(self, ttl=None, size=COUNT_CACHE_SIZE):
+        self.ttl = COUNT_CACHE_TTL if ttl is None else ttl
+        self.size = size
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        count = loader()
+        with self._lock:
+            if len(self._counts) >= self.size:
+                self._counts = {
+                    k: v
+                    for k, v in self._counts.items() if v[0] > now
+                }
+                if len(self._counts) >= self.size:
+                    self._counts.clear()
+            self._counts[key] = (now + self.ttl, count)
+        return count
+
+
+cache = CountCache()
+
+
+def is_postgres(session):
+    return session.get_bind().dialect.name == 'postgresql'
+
+
+def table_estimate(session, table):
+    """ Planner's row estimate for `table`, or None if it has no statistics
+    """
+    estimate = session.execute(
+        text('SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)'),
+        dict(table=table)).scalar()
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
+def plan_estimate(session, query):
+    """ Planner's estimate of the rows `query` returns
+    """
+    compiled = query.statement.compile(dialect=session.get_bind().dialect)
+    plan = session.connection().execute(
+        'EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def exact(session, count_query):
+    return count_query.scalar()
+
+
+def estimated(session, count_query, rows_query, table):
+    """ Estimated count of `rows_query`, from `table`'s statistics if the
+        query is unfiltered, or the exact count for small results and
+        databases without planner statistics
+    """
+    if not is_postgres(session):
+        return exact(session, count_query)
+    estimate = None
+    if count_query.whereclause is None:
+        estimate = table_estimate(session, table)
+    if estimate is None:
+        estimate = plan_estimate(session, rows_query)
+    if estimate < COUNT_ESTIMATE_EXACT_BELOW:
+        return exact(session, count_query)
+    return EstimatedCount(estimate)
+
+
+def freeze(value):
+    """ `value` with lists turned into tuples, to use in a cache key
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class CountStrategyMixin():
+    """ Count simple pager list views with `count_strategy` ('exact',
+        'cached', 'estimated' or None to not count), and show the count in
+        the list heading
+    """
+    count_strategy = 'exact'
+    # tables whose changes invalidate cached counts; defaults to the model's
+    count_tables = None
+
+    def _list_count_query(self, search, filters):
+        """ The view's count query with `search` and `filters` applied
+        """
+        query = self.get_query()
+        count_query = self.get_count_query()
+        joins = {}
+        count_joins = {}
+        if self._search_supported and search:
+            query, count_query, joins, count_joins = self._apply_search(
+                query, count_query, joins, count_joins, search)
+        if filters and self._filters:
+            query, count_query, joins, count_joins = self._apply_filters(
+                query, count_query, joins, count_joins, filters)
+        return count_query
+
+    def count_rows(self, search, filters):
+        count_query = self._list_count_query(search, filters)
+        if self.count_strategy == 'estimated':
+            pk = getattr(self.model, self._primary_key)
+            return estimated(self.session, count_query,
+                             count_query.with_entities(pk),
+                             self.model.__table__.name)
+        if self.count_strategy == 'cached':
+            tables = self.count_tables or [self.model.__table__.name]
+            # multi-value filters (IdListFilter) hold lists
+            key = (type(self).__name__, search, freeze(filters or ()),
+                   tuple(table_versions.get(t) for t in tables))
+            with cache_load():
+                return cache.get(key,
+                                 lambda: exact(self.session, count_query))
+        return exact(self.session, count_query)
+
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        count, data = super().get_list(page, sort_column, sort_desc, search,
+                                       filters, execute, page_size)
+        if execute and count is None and self.count_strategy:
+            g.list_count = (self, self.count_rows(search, filters))
+        return count, data
+
+    def render(self, template, **kwargs):
+        """ Pass the count to the list template without turning on the
+            numbered pager, which needs an exact count
+        """
+        list_count = g.get('list_count')
+        if (template == self.list_template and kwargs.get('count') is None
+                and list_count is not None and list_count[0] is self):
+            kwargs['count'] = list_count[1]
+        return super().render(template, **kwargs)
@@ -0,0 +1,229 @@
+""" Indexed search for ClientAdmin and EmployeeAdmin.
+
+    Each client and employee gets one row in a search document table,
+    holding the text of the fields the view searches (including joined
+    product names, account lead email and office name), so a search is a
+    single indexed lookup instead of ILIKEs across several outer joins.
+
+    On Postgres every search term must match the document with ILIKE, which
+    the pg_trgm index serves, and results are ranked by ts_rank over the
+    document's tsvector plus trigram similarity. Elsewhere (SQLite) the
+    documents are matched and ranked in Python.
+
+    Documents are refreshed from the admin on_model_change hooks and the
+    directory sync. migrations.py creates the tables and builds every
+    document, and `python search.py` rebuilds them; until the tables exist
+    the views fall back to Flask-Admin search.
+"""
+import time
+from collections import namedtuple
+
+from flask import g, has_request_context, request
+from flask_admin.contrib.sqla.tools import parse_like_term
+from sqlalchemy import and_, case, func, inspect
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from models import (Client, Employee, engine, metadata,
+                    t_client_search_document, t_employee_search_document)
+from query_budget import cache_load
+
+SearchSource = namedtuple('SearchSource',
+                          ['table', 'key', 'document', 'options'])
+
+
+def client_document(client):
+    values = [
+        client.client_organization_name, client.dfp_network_code,
+        client.dfp_display_name
+    ]
+    if client.account_manager:
+        values.append(client.account_manager.email)
+    values.extend(product.product_type_name for product in client.products)
+    return ' '.join(str(value) for value in values if value is not None)
+
+
+def employee_document(employee):
+    values = [employee.first_name, employee.last_name, employee.email]
+    if employee.office:
+        values.append(employee.office.office_name)
+    return ' '.join(str(value) for value in values if value is not None)
+
+
+SOURCES = {
+    Client:
+    SearchSource(t_client_search_document, 'client_organization_id',
+                 client_document, [
+                     selectinload(Client.account_manager),
+                     selectinload(Client.products)
+                 ]),
+    Employee:
+    SearchSource(t_employee_search_document, 'person_id', employee_document,
+                 [selectinload(Employee.office)]),
+}
+
+INSTALLED_RECHECK = 30
+
+_installed = {}
+
+
+def is_installed(session):
+    """ Whether the search document tables exist; once they do that is
+        remembered per database, until then it is checked again after
+        INSTALLED_RECHECK seconds
+    """
+    bind = session.get_bind()
+    key = str(bind.engine.url)
+    installed, checked = _installed.get(key, (False, None))
+    if not installed and (checked is None or
+                          time.monotonic() - checked >= INSTALLED_RECHECK):
+        with cache_load():
+            names = set(inspect(bind).get_table_names())
+        installed = all(
+            source.table.name in names for source in SOURCES.values())
+        _installed[key] = (installed, time.monotonic())
+    return installed
+
+
+def is_postgres(session):
+    return session.get_bind().dialect.name == 'postgresql'
+
+
+def refresh(session, model, ids=None):
+    """ Rebuild search documents for `model` rows whose key is in `ids`, a
+        list or a query of keys, or for every row if `ids` is None.
+        Runs in the caller's transaction.
+    """
+    if not is_installed(session):
+        return
+    source = SOURCES[model]
+    table = source.table
+    key = getattr(model, source.key)
+
+    rows = session.query(model).options(*source.options)
+    delete = table.delete()
+    if ids is not None:
+        rows = rows.filter(key.in_(ids))
+        delete = delete.where(table.c[source.key].in_(ids))
+    documents = [{
+        source.key: getattr(row, source.key),
+        'document': source.document(row)
+    } for row in rows]
+
+    session.execute(delete)
+    if documents:
+        session.execute(table.insert(), documents)
+        if is_postgres(session):
+            session.execute(table.update().where(table.c[source.key].in_([
+                document[source.key] for document in documents
+            ])).values(
+                document_tsv=func.to_tsvector('simple', table.c.document)))
+
+
+def python_search(session, source, terms):
+    """ Keys of documents matching every term, best first
+    """
+    matchers = []
+    for term in terms:
+        like = parse_like_term(term).lower()
+        if like.startswith('%') and like.endswith('%'):
+            matchers.append(lambda doc, t=like[1:-1]: doc.count(t))
+        elif like.endswith('%'):
+            matchers.append(lambda doc, t=like[:-1]: int(doc.startswith(t)))
+        else:
+            matchers.append(lambda doc, t=like: int(doc == t))
+
+    scored = []
+    for key, document in session.query(source.table.c[source.key],
+                                       source.table.c.document):
+        document = document.lower()
+        scores = [match(document) for match in matchers]
+        if all(scores):
+            scored.append((-sum(scores), key))
+    return [key for _, key in sorted(scored)]
+
+
+def _python_search(session, source, terms):
+    """ python_search, run once per request for the list and its count
+    """
+    if not has_request_context():
+        return python_search(session, source, terms)
+    results = g.setdefault('python_search', {})
+    key = (source.table.name, tuple(terms))
+    if key not in results:
+        results[key] = python_search(session, source, terms)
+    return results[key]
+
+
+def apply_search(session, model, query, count_query, search, rank=True):
+    """ Restrict `query` and `count_query` to rows matching `search`, and
+        order `query` by relevance if `rank` is set
+    """
+    source = SOURCES[model]
+    table = source.table
+    key = getattr(model, source.key)
+    terms = [term for term in search.split(' ') if term]
+    if not terms:
+        return query, count_query
+
+    if is_postgres(session):
+        on = table.c[source.key] == key
+        criterion = and_(*[
+            table.c.document.ilike(parse_like_term(term)) for term in terms
+        ])
+        query = query.join(table, on).filter(criterion)
+        if count_query is not None:
+            count_query = count_query.join(table, on).filter(criterion)
+        if rank:
+            tsquery = func.plainto_tsquery('simple', search)
+            query = query.order_by((
+                func.ts_rank(table.c.document_tsv, tsquery) +
+                func.similarity(table.c.document, search)).desc())
+    else:
+        keys = _python_search(session, source, terms)
+        query = query.filter(key.in_(keys))
+        if count_query is not None:
+            count_query = count_query.filter(key.in_(keys))
+        if rank and keys:
+            query = query.order_by(
+                case({k: position
+                      for position, k in enumerate(keys)}, value=key))
+
+    return query, count_query
+
+
+class IndexedSearchMixin():
+    """ Route a ModelView's search through the search documents. Results
+        are ranked unless the user picked a sort column.
+    """
+
+    def _apply_search(self, query, count_query, joins, count_joins, search):
+        if self.model not in SOURCES or not is_installed(self.session):
+            return super()._apply_search(query, count_query, joins,
+                                         count_joins, search)
+        rank = request.args.get('sort') is None
+        query, count_query = apply_search(self.session, self.model, query,
+                                          count_query, search, rank)
+        return query, count_query, joins, count_joins
+
+
+def create_schema(bind):
+    """ Create the search document tables and the extension they need
+    """
+    if bind.dialect.name == 'postgresql':
+        bind.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    metadata.create_all(
+        bind, tables=[source.table for source in SOURCES.values()])
+
+
+def main():
+    session = sessionmaker(bind=engine)()
+    try:
+        for model in SOURCES:
+            refresh(session, model)
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
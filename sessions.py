@@ -0,0 +1,184 @@
+""" Server-side sessions.
+
+    The session cookie carries only a random session id; the session data
+    stays on the server in the store picked by SESSION_STORE:
+    - 'sql', the default: the web_session table, shared by every worker
+      and instance
+    - 'memory': a least recently used cache of SESSION_CACHE_SIZE sessions
+      in each process, only allowed in debug and testing mode
+    - 'cookie': Flask's signed cookie sessions, as before
+
+    Sessions expire after PERMANENT_SESSION_LIFETIME. migrations.py
+    creates the web_session table; run `python sessions.py` to delete
+    expired sessions from it, e.g. nightly from cron.
+"""
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import flask
+from flask.sessions import (SessionInterface, SessionMixin,
+                            session_json_serializer)
+from werkzeug.datastructures import CallbackDict
+
+from models import engine, t_web_session
+
+SESSION_CACHE_SIZE = int(os.getenv('SESSION_CACHE_SIZE', 10000))
+STORES = ('memory', 'sql', 'cookie')
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None
+
+
+def new_sid():
+    return secrets.token_urlsafe(32)
+
+
+def rotate():
+    """ Give the current session a new id, e.g. on login so an id issued
+        before authentication can't be reused after it
+    """
+    session = flask.session._get_current_object()
+    if isinstance(session, ServerSession):
+        session.replaced_sid = session.replaced_sid or session.sid
+        session.sid = new_sid()
+        session.modified = True
+
+
+class MemoryStore():
+    """ Serialized sessions by id, least recently used dropped first
+    """
+
+    def __init__(self, size=SESSION_CACHE_SIZE):
+        self.size = size
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            stored = self._sessions.get(sid)
+            if stored is None:
+                return None
+            if stored[0] < time.time():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return stored[1]
+
+    def put(self, sid, data, lifetime):
+        with self._lock:
+            self._sessions[sid] = (time.time() + lifetime.total_seconds(),
+                                   data)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLStore():
+    """ Serialized sessions in the web_session table
+    """
+
+    def __init__(self, bind=engine):
+        self.bind = bind
+
+    def get(self, sid):
+        table = t_web_session
+        return self.bind.execute(
+            table.select().with_only_columns([table.c.data]).where(
+                table.c.session_id == sid).where(
+                    table.c.expires_datetime > datetime.utcnow())).scalar()
+
+    def put(self, sid, data, lifetime):
+        table = t_web_session
+        values = dict(
+            data=data, expires_datetime=datetime.utcnow() + lifetime)
+        with self.bind.begin() as connection:
+            updated = connection.execute(table.update().where(
+                table.c.session_id == sid).values(**values)).rowcount
+            if not updated:
+                connection.execute(table.insert().values(
+                    session_id=sid, **values))
+
+    def delete(self, sid):
+        self.bind.execute(
+            t_web_session.delete().where(t_web_session.c.session_id == sid))
+
+    def purge(self):
+        """ Delete expired sessions, returning how many there were
+        """
+        return self.bind.execute(t_web_session.delete().where(
+            t_web_session.c.expires_datetime <= datetime.utcnow())).rowcount
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            data = self.store.get(sid)
+            if data is not None:
+                return ServerSession(self.serializer.loads(data), sid)
+        return ServerSession(sid=new_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.replaced_sid:
+            self.store.delete(session.replaced_sid)
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    app.session_cookie_name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+        self.store.put(session.sid, self.serializer.dumps(dict(session)),
+                       app.permanent_session_lifetime)
+        response.set_cookie(
+            app.session_cookie_name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
+
+
+def init_app(app):
+    """ Use the session store named by the app's SESSION_STORE setting
+    """
+    store = app.config['SESSION_STORE']
+    if store == 'memory':
+        app.session_interface = ServerSessionInterface(MemoryStore())
+    elif store == 'sql':
+        app.session_interface = ServerSessionInterface(SQLStore())
+
+
+def main():
+    print('Deleted {0} expired sessions'.format(SQLStore().purge()))
+
+
+if __name__ == '__main__':
+    main()
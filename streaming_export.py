@@ -0,0 +1,69 @@
+""" Streaming export for Flask-Admin SQLAlchemy model views.
+
+    Flask-Admin's export runs the list query with `.all()` before writing
+    anything. StreamingExportMixin hands the export writers an unexecuted
+    query with yield_per instead, which on Postgres fetches rows through a
+    server-side cursor in batches, so memory stays flat however many rows
+    are exported. Filters, search and sort come from the request exactly as
+    they do for the list view.
+"""
+import json
+
+from flask import Response, stream_with_context
+from flask_admin import expose
+from werkzeug.utils import secure_filename
+
+EXPORT_YIELD_PER = 1000
+
+
+class StreamingExportMixin():
+    export_types = ['csv', 'ndjson']
+    export_yield_per = EXPORT_YIELD_PER
+
+    def _export_data(self):
+        view_args = self._get_list_extra_args()
+
+        sort_column = self._get_column_by_idx(view_args.sort)
+        if sort_column is not None:
+            sort_column = sort_column[0]
+
+        count, query = self.get_list(
+            0,
+            sort_column,
+            view_args.sort_desc,
+            view_args.search,
+            view_args.filters,
+            execute=False,
+            page_size=self.export_max_rows)
+
+        # yield_per also turns on stream_results (server-side cursor)
+        return count, query.yield_per(self.export_yield_per)
+
+    @expose('/export/<export_type>/')
+    def export(self, export_type):
+        if (export_type == 'ndjson' and self.can_export
+                and export_type in self.export_types):
+            return self._export_ndjson()
+        return super().export(export_type)
+
+    def _export_ndjson(self):
+        """ Export one JSON object per line, keyed by column name
+        """
+        count, data = self._export_data()
+
+        def generate():
+            for row in data:
+                yield json.dumps(
+                    {
+                        name: self.get_export_value(row, name)
+                        for name, _ in self._export_columns
+                    },
+                    default=str) + '\n'
+
+        filename = self.get_export_name(export_type='ndjson')
+        disposition = 'attachment;filename=%s' % (secure_filename(filename), )
+
+        return Response(
+            stream_with_context(generate()),
+            headers={'Content-Disposition': disposition},
+            mimetype='application/x-ndjson')
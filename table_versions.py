@@ -0,0 +1,26 @@
+""" Process-local version counters for database tables.
+
+    Cached data derived from a table can be keyed on its version, which is
+    bumped whenever this process changes the table. Changes made by other
+    workers or the directory sync are not seen, so caches keyed on a
+    version should still expire on a TTL.
+"""
+import threading
+from collections import defaultdict
+
+_versions = defaultdict(int)
+_lock = threading.Lock()
+
+
+def get(table):
+    """ Current version of `table`
+    """
+    return _versions[table]
+
+
+def bump(*tables):
+    """ Advance the version of each named table
+    """
+    with _lock:
+        for table in tables:
+            _versions[table] += 1
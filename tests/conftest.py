@@ -0,0 +1,71 @@
+""" Shared fixtures: a small seeded database (see benchmarks.datagen) and
+    the admin app in testing mode.
+
+    Tests run against a temporary SQLite database, or the database at
+    TEST_DATABASE_URL, which is dropped and reseeded. database.py builds
+    the shared engine from DATABASE_URL on import, so that is set before
+    anything from the app is imported.
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ['DATABASE_URL'] = os.getenv(
+    'TEST_DATABASE_URL',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db'))
+
+SCALE = dict(
+    clients_count=200, employees_count=60, products_count=10,
+    offices_count=3)
+
+
+@pytest.fixture(scope='session')
+def engine():
+    import migrations
+    from benchmarks import datagen
+    from database import engine
+    from sqlalchemy.orm import sessionmaker
+
+    datagen.create_schema(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        datagen.generate(session, **SCALE)
+    finally:
+        session.close()
+    migrations.migrate(engine)
+    return engine
+
+
+@pytest.fixture
+def session(engine):
+    from sqlalchemy.orm import sessionmaker
+
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.rollback()
+    session.close()
+
+
+@pytest.fixture(scope='session')
+def app(engine):
+    import admin_app
+    return admin_app.create_app(dict(TESTING=True))
+
+
+@pytest.fixture
+def client(app):
+    """ Test client signed in as a fake user
+    """
+    client = app.test_client()
+    with client.session_transaction() as browser:
+        browser['profile'] = dict(
+            user_id='test', name='Test', email='test@oao.co')
+    return client
+
+
+@pytest.fixture(scope='session')
+def views(app):
+    """ The app's admin views by class name
+    """
+    return {type(v).__name__: v for v in app.extensions['admin'][0]._views}
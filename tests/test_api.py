@@ -0,0 +1,87 @@
+""" JSON API change feeds.
+"""
+from datetime import datetime
+
+import pytest
+from sqlalchemy import bindparam, func, select
+
+import api
+import table_versions
+from keyset_pagination import encode_cursor
+from models import Client
+
+
+@pytest.fixture
+def feed(engine, monkeypatch):
+    """ Mark clients 1 to 5 as modified in 2018, the rest just now, and put
+        the stamps back afterwards. The app reads them on connections of its
+        own, so they are committed.
+    """
+    table = Client.__table__
+    key = table.c.client_organization_id
+    stamps = [
+        dict(key=row_key, stamp=stamp) for row_key, stamp in engine.execute(
+            select([key, table.c.modified_datetime]))
+    ]
+    with engine.begin() as conn:
+        conn.execute(table.update().values(modified_datetime=func.now()))
+        for row_key in range(1, 6):
+            conn.execute(table.update().where(key == row_key).values(
+                modified_datetime=datetime(2018, 1, row_key)))
+    table_versions.bump('client_organization')
+    monkeypatch.setattr(api, 'cache', api.ResponseCache())
+    yield
+    with engine.begin() as conn:
+        conn.execute(
+            table.update().where(key == bindparam('key')).values(
+                modified_datetime=bindparam('stamp')), stamps)
+    table_versions.bump('client_organization')
+
+
+def changes(client, **args):
+    response = client.get('/api/clients/changes', query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_feed_holds_back_recent_changes(client, feed):
+    body = changes(client)
+
+    assert [row['client_organization_id']
+            for row in body['data']] == [1, 2, 3, 4, 5]
+    assert changes(client, since=body['next'])['data'] == []
+
+
+def test_feed_pages_by_cursor(client, feed):
+    first = changes(client, limit=2)
+    second = changes(client, limit=2, since=first['next'])
+
+    assert [row['client_organization_id']
+            for row in first['data'] + second['data']] == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize('cursor', [
+    'W3t9LDFd',  # [{},1]
+    encode_cursor(['2018-01-01T00:00:00', 'x']),
+    encode_cursor(['2018-01-01T00:00:00', 1.5]),
+    encode_cursor(['2018-01-01T00:00:00', True]),
+    encode_cursor(['yesterday', 1]),
+    encode_cursor([None, 1]),
+])
+def test_feed_rejects_bad_cursor(client, cursor):
+    response = client.get('/api/clients/changes?since=' + cursor)
+
+    assert response.status_code == 400
+
+
+def test_api_token_from_app_config(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'API_TOKEN', 'secret')
+    client = app.test_client()
+
+    assert client.get('/api/offices/').status_code == 401
+    assert client.get('/api/offices/', headers={
+        'Authorization': 'Bearer wrong'
+    }).status_code == 401
+    assert client.get('/api/offices/', headers={
+        'Authorization': 'Bearer secret'
+    }).status_code == 200
@@ -0,0 +1,166 @@
+""" Bulk actions on every selected or matching row.
+"""
+import pytest
+from sqlalchemy import select
+
+import bulk_actions
+import org_chart
+from admin_app import AccountLeadFilter, ProductFilter
+from models import (Client, Employee, Product, t_client_product_association,
+                    t_client_search_document, t_person_closure)
+
+USER = 'test@oao.co'
+
+
+def filter_arg(view, cls):
+    index = next(
+        i for i, f in enumerate(view._filters) if isinstance(f, cls))
+    return 'flt0_{0}'.format(index)
+
+
+@pytest.fixture
+def clients_view(app, views):
+    """ ClientAdmin, whose session is rolled back after the test
+    """
+    view = views['ClientAdmin']
+    with app.app_context():
+        yield view
+        view.session.rollback()
+
+
+def matching(app, view, query_string):
+    with app.test_request_context('/admin/client/?' + query_string):
+        return view.matching_ids()
+
+
+def documents(session, ids):
+    table = t_client_search_document
+    rows = session.execute(
+        select([table.c.client_organization_id, table.c.document
+                ]).where(table.c.client_organization_id.in_(ids)))
+    return dict(rows.fetchall())
+
+
+def test_reassign_every_client_of_a_lead(app, clients_view):
+    session = clients_view.session
+    old, new = [
+        person_id for person_id, in session.query(Employee.person_id).filter(
+            Employee.account_manager_flag.is_(True)).order_by(
+                Employee.person_id).limit(2)
+    ]
+    primary = [
+        key for key, in session.query(Client.client_organization_id).filter(
+            Client.account_manager_id == old)
+    ]
+    assert primary
+    ids = matching(app, clients_view, '{0}={1}'.format(
+        filter_arg(clients_view, AccountLeadFilter), old))
+
+    bulk_actions.reassign_lead(session, ids, 'primary', new, USER)
+
+    assert not session.query(Client).filter(
+        Client.account_manager_id == old).count()
+    email = session.query(Employee.email).filter(
+        Employee.person_id == new).scalar()
+    # no longer matched by the filter once reassigned, but still refreshed
+    assert all(email in document
+               for document in documents(session, primary).values())
+
+
+def test_remove_product_from_every_client_with_it(app, clients_view):
+    session = clients_view.session
+    product, name = session.query(
+        Product.product_type_id, Product.product_type_name).join(
+            t_client_product_association).first()
+    having = [
+        key for key, in session.query(
+            t_client_product_association.c.client_organization_id).filter(
+                t_client_product_association.c.product_type_id == product)
+    ]
+    ids = matching(app, clients_view, '{0}={1}'.format(
+        filter_arg(clients_view, ProductFilter), name))
+
+    removed, updated = bulk_actions.remove_product(session, ids, product,
+                                                   USER)
+
+    assert removed == updated == len(having)
+    assert not session.query(t_client_product_association).filter_by(
+        product_type_id=product).count()
+    assert not any(name in document
+                   for document in documents(session, having).values())
+    assert {
+        key for key, in session.query(Client.client_organization_id).filter(
+            Client.client_organization_id.in_(having),
+            Client.modified_by == USER)
+    } == set(having)
+
+
+def test_update_returns_only_its_rows(session):
+    first, second = [
+        key for key, in session.query(Client.client_organization_id).order_by(
+            Client.client_organization_id).limit(2)
+    ]
+    # an earlier action by the same user in this transaction, within the
+    # same second
+    bulk_actions.update(session, Client, [first], {}, USER)
+
+    updated, changed = bulk_actions.update(
+        session, Client,
+        session.query(Client.client_organization_id).filter(
+            Client.client_organization_id == second), {}, USER)
+
+    assert (updated, changed) == (1, [second])
+
+
+def closure_rows(session):
+    rows = session.execute(select(list(t_person_closure.c)))
+    return {tuple(row) for row in rows}
+
+
+@pytest.mark.parametrize('as_query', [False, True])
+def test_set_manager_moves_subtrees(session, as_query):
+    # someone below the top of the tree, and one of their reports
+    middle, top = session.query(Employee.person_id,
+                                Employee.manager_person_id).filter(
+        Employee.manager_person_id.in_(
+            session.query(Employee.person_id).filter(
+                Employee.manager_person_id.isnot(None)))).order_by(
+                    Employee.person_id).first()
+    below = {person['person_id']
+             for person in org_chart.reports(session, top)} | {top}
+    manager = session.query(Employee.person_id).filter(
+        Employee.person_id.notin_(below)).order_by(
+            Employee.person_id).first()[0]
+    ids = [top, middle]
+    if as_query:
+        ids = session.query(Employee.person_id).filter(
+            Employee.person_id.in_(ids))
+
+    assert bulk_actions.set_manager(session, ids, manager, USER) == 2
+
+    moved = closure_rows(session)
+    org_chart.rebuild(session)
+    assert moved == closure_rows(session)
+    assert {
+        person['person_id']
+        for person in org_chart.chain_of_command(session, middle)
+    } == {manager} | {
+        person['person_id']
+        for person in org_chart.chain_of_command(session, manager)
+    }
+
+
+def test_set_manager_refuses_cycles(session):
+    person_id, manager_id = session.query(
+        Employee.person_id, Employee.manager_person_id).filter(
+            Employee.manager_person_id.isnot(None)).first()
+
+    with pytest.raises(bulk_actions.BulkActionError):
+        bulk_actions.set_manager(session, [manager_id], person_id, USER)
+
+
+def test_non_numeric_row_id(client):
+    response = client.post('/admin/client/bulk/set_active/',
+                           data=dict(rowid=['1', 'x'], active='1'))
+
+    assert response.status_code == 400
@@ -0,0 +1,144 @@
+""" Bulk CSV imports.
+"""
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+import bulk_import
+import client_codes
+from models import Client, Employee, Product, t_client_search_document
+
+USER = 'import@oao.co'
+HEADER = ('client_organization_name,assigned_account_name,account_manager,'
+          'products,contract_start_date\n')
+
+
+@pytest.fixture
+def joined(engine):
+    """ Session whose commits are rolled back after the test
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection)
+    yield session
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+def lead_and_products(session):
+    email = session.query(Employee.email).filter(
+        Employee.current_employee_flag.is_(True)).order_by(
+            Employee.person_id).limit(1).scalar()
+    codes = [
+        code for code, in session.query(Product.product_type_code).order_by(
+            Product.product_type_id).limit(2)
+    ]
+    return email, codes
+
+
+def client_count(session):
+    return session.query(func.count(Client.client_organization_id)).scalar()
+
+
+def test_bad_rows_reported_by_line_and_nothing_written(joined):
+    email, codes = lead_and_products(joined)
+    before = client_count(joined)
+    lines = [
+        HEADER,
+        'Good,Good Corp,{0},{1},2018-01-01\n'.format(email, codes[0]),
+        ',No Name Corp,,,\n',
+        'Bad Lead,Bad Corp,nobody@oao.co,,2018-13-01\n',
+        'Bad Product,Bad Corp,,NOPE;{0},\n'.format(codes[1]),
+    ]
+
+    result = bulk_import.import_csv(joined, 'clients', lines, USER)
+
+    assert [tuple(error) for error in result.errors] == [
+        (3, 'client_organization_name is required'),
+        (4, 'no current employee with email nobody@oao.co'),
+        (4, 'contract_start_date must be a YYYY-MM-DD date'),
+        (5, 'no product with code NOPE'),
+    ]
+    assert result.written == 0
+    assert client_count(joined) == before
+
+
+def test_unknown_column_stops_before_rows(joined):
+    result = bulk_import.import_csv(
+        joined, 'clients', ['client_organization_name,colour\n', 'A,red\n'],
+        USER)
+
+    assert [tuple(error) for error in result.errors] == [
+        (1, 'unknown column colour'),
+        (1, 'missing column assigned_account_name'),
+    ]
+    assert result.rows == []
+
+
+def test_clients_written_with_codes_and_products(joined):
+    email, codes = lead_and_products(joined)
+    taken = {
+        code for code, in joined.query(Client.client_organization_code)
+    }
+    lines = [HEADER] + [
+        'Imported {0},Acme Corp,{1},{2},2018-03-01\n'.format(
+            index, email, ';'.join(codes)) for index in range(3)
+    ]
+
+    result = bulk_import.import_csv(joined, 'clients', lines, USER)
+
+    assert result.errors == [] and result.written == 3
+    clients = joined.query(Client).filter(
+        Client.client_organization_name.like('Imported %')).order_by(
+            Client.client_organization_name).all()
+    assert len(clients) == 3
+    # as next_code gives them, in file order, around the codes in use
+    expected = []
+    for client in clients:
+        expected.append(client_codes.next_code(
+            client.client_organization_name, 'Acme Corp',
+            client.contract_start_date, taken))
+    assert [client.client_organization_code for client in clients] == expected
+    assert all(code.startswith('AC2018-') for code in expected)
+    assert all(client.created_by == USER for client in clients)
+    assert all(
+        sorted(product.product_type_code for product in client.products) ==
+        sorted(codes) for client in clients)
+    ids = [client.client_organization_id for client in clients]
+    documents = joined.execute(
+        select([t_client_search_document.c.client_organization_id]).where(
+            t_client_search_document.c.client_organization_id.in_(ids)))
+    assert sorted(key for key, in documents) == sorted(ids)
+
+
+def test_dry_run_writes_nothing(joined):
+    email, _ = lead_and_products(joined)
+    before = client_count(joined)
+    lines = [HEADER, 'Dry,Dry Corp,{0},,\n'.format(email)]
+
+    result = bulk_import.import_csv(joined, 'clients', lines, USER,
+                                    dry_run=True)
+
+    assert result.errors == [] and len(result.rows) == 1
+    assert result.written == 0
+    assert client_count(joined) == before
+
+
+def test_duplicate_product_codes_reported(joined):
+    _, codes = lead_and_products(joined)
+    lines = [
+        'product_type_code,product_type_name\n',
+        'NEW,New product\n',
+        'NEW,Again\n',
+        '{0},Existing\n'.format(codes[0]),
+    ]
+
+    result = bulk_import.import_csv(joined, 'products', lines, USER)
+
+    assert [tuple(error) for error in result.errors] == [
+        (3, 'product code NEW already exists'),
+        (4, 'product code {0} already exists'.format(codes[0])),
+    ]
+    assert not joined.query(Product).filter_by(
+        product_type_code='NEW').count()
@@ -0,0 +1,47 @@
+""" Client code assignment.
+"""
+from datetime import date
+
+import pytest
+
+import client_codes
+from client_codes import CodesExhausted, candidates, next_code
+
+START = date(2018, 3, 1)
+
+
+def test_first_choice_is_name_checksum():
+    code = next(candidates('Acme', 'Acme Corp', START))
+
+    assert code == 'AC2018-{0:03d}'.format(
+        sum(bytearray('Acme', 'utf-8')) % 999)
+
+
+def test_taken_codes_are_skipped_in_order():
+    first, second, third = list(candidates('Acme', 'Acme Corp', START))[:3]
+    taken = {first, second}
+
+    assert next_code('Acme', 'Acme Corp', START, taken) == third
+    assert third in taken
+
+
+def test_suffixes_wrap_and_run_out():
+    codes = list(candidates('Acme', 'Acme Corp', START))
+    assert len(set(codes)) == client_codes.SUFFIXES
+
+    taken = set(codes[:-1])
+    assert next_code('Acme', 'Acme Corp', START, taken) == codes[-1]
+    with pytest.raises(CodesExhausted):
+        next_code('Acme', 'Acme Corp', START, taken)
+
+
+def test_plan_gives_unique_codes(session):
+    plan = client_codes.plan_codes(session, revalidate=True)
+    client_codes.apply_codes(session, plan)
+
+    codes = [
+        code for code, in session.query(
+            client_codes.Client.client_organization_code)
+    ]
+    assert all(codes)
+    assert len(set(codes)) == len(codes)
@@ -0,0 +1,80 @@
+""" Settings validation and app startup.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+import admin_app
+import config
+
+# import admin_app and build the app, excluding interpreter start up
+STARTUP_SECONDS = 3
+SETTINGS = dict(
+    AUTH0_DOMAIN='auth0.invalid',
+    AUTH0_CLIENT_ID='test',
+    AUTH0_CALLBACK_URL='http://localhost/callback')
+
+
+@pytest.fixture
+def bare_env(monkeypatch):
+    for name in config.REQUIRED + ('SESSION_STORE', ):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_create_app_lists_every_missing_setting(bare_env):
+    with pytest.raises(config.ConfigError) as raised:
+        admin_app.create_app()
+
+    assert sorted(raised.value.args) == sorted(
+        '{0} is not set'.format(name) for name in config.REQUIRED)
+    for name in config.REQUIRED:
+        assert name in str(raised.value)
+
+
+def test_invalid_settings_reported_together(bare_env):
+    with pytest.raises(config.ConfigError) as raised:
+        config.load(
+            dict(SETTINGS, AUTH0_DOMAIN='https://tenant.auth0.com/',
+                 AUTH0_CALLBACK_URL='localhost/callback'))
+
+    assert len(raised.value.args) == 2
+
+
+def test_settings_derive_auth0_urls(bare_env):
+    settings = config.load(SETTINGS)
+
+    assert settings['AUTH0_BASE_URL'] == 'https://auth0.invalid'
+    assert settings['AUTH0_AUDIENCE'] == 'https://auth0.invalid/userinfo'
+
+
+def test_startup_is_fast_without_a_database(tmp_path):
+    """ A worker boots in a fresh interpreter, before the database is up
+    """
+    script = ('import time\n'
+              'started = time.perf_counter()\n'
+              'import admin_app\n'
+              'admin_app.create_app({0!r})\n'
+              'print(time.perf_counter() - started)\n').format(SETTINGS)
+    env = dict(
+        os.environ,
+        DATABASE_URL='sqlite:///{0}'.format(tmp_path / 'missing' / 'x.db'))
+
+    result = subprocess.run([sys.executable, '-c', script],
+                            env=env,
+                            cwd=os.path.dirname(os.path.dirname(__file__)),
+                            stdout=subprocess.PIPE,
+                            check=True)
+
+    assert float(result.stdout) < STARTUP_SECONDS
+
+
+def test_memory_sessions_only_when_debugging(bare_env):
+    with pytest.raises(config.ConfigError) as raised:
+        config.load(dict(SETTINGS, SESSION_STORE='memory'))
+    assert 'SESSION_STORE' in str(raised.value)
+
+    assert config.load(dict(SETTINGS, SESSION_STORE='memory', DEBUG=True))
+    assert config.load(dict(SESSION_STORE='memory', TESTING=True))
+    assert config.load(SETTINGS)['SESSION_STORE'] == 'sql'
@@ -0,0 +1,145 @@
+""" Directory sync against the in-memory fake Directory API.
+"""
+import pytest
+from apiclient.errors import HttpError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import search
+from benchmarks import datagen
+from fake_directory import FakeDirectoryService, make_user
+from google_directory_sync import SyncPlan, diff_people, fetch_users, sync
+from models import Employee, t_employee_search_document
+
+
+def person(index, current=True, first_name=None, email=None):
+    """ 'person' row for make_user(index), as diff_people takes them
+    """
+    user = make_user(index)
+    return (index, user['id'], first_name or user['name']['givenName'],
+            user['name']['familyName'], email or user['primaryEmail'],
+            current)
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    """ Session on an empty database of its own, as sync commits
+    """
+    engine = create_engine('sqlite:///{0}'.format(tmp_path / 'sync.db'))
+    datagen.create_schema(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def test_fetch_follows_pages():
+    users = [make_user(i) for i in range(1, 12)]
+    service = FakeDirectoryService(users, page_size=5)
+
+    fetched = list(fetch_users(service))
+
+    assert [u['id'] for u in fetched] == [u['id'] for u in service.users_data]
+    assert service.requests == 3
+
+
+def test_get_unknown_user_is_404():
+    service = FakeDirectoryService([make_user(1)])
+
+    assert service.users().get(userKey=make_user(1)['id']).execute()
+    with pytest.raises(HttpError) as raised:
+        service.users().get(userKey='nobody@example.com').execute()
+    assert raised.value.resp.status == 404
+
+
+def test_diff_inserts_new_users():
+    plan = diff_people([make_user(1), make_user(2)], [person(1)])
+
+    assert plan.inserts == [
+        dict(gsuite_id=make_user(2)['id'], first_name='First2',
+             last_name='Last2', email='user2@example.com')
+    ]
+    assert plan.updates == [] and plan.deletes == []
+
+
+def test_diff_refreshes_name_and_email():
+    people = [
+        person(1, first_name='Old'),
+        person(2, email='old@example.com'),
+        person(3),
+    ]
+    users = [make_user(1), make_user(2), make_user(3)]
+
+    plan = diff_people(users, people)
+
+    assert sorted(plan.updates, key=lambda u: u['person_id']) == [
+        dict(person_id=1, first_name='First1', last_name='Last1',
+             email='user1@example.com'),
+        dict(person_id=2, first_name='First2', last_name='Last2',
+             email='user2@example.com'),
+    ]
+    assert plan.inserts == [] and plan.deletes == []
+
+
+def test_diff_soft_deletes_departed_once():
+    people = [person(1), person(2), person(3, current=False)]
+
+    plan = diff_people([make_user(1)], people)
+
+    # person 3 is already soft deleted and not inserted again either
+    assert plan == SyncPlan([], [], [2])
+
+
+def test_sync_applies_each_branch(scratch):
+    scratch.bulk_insert_mappings(Employee, [
+        dict(person_id=index, gsuite_id=gsuite_id, first_name=first_name,
+             last_name=last_name, email=email, current_employee_flag=current)
+        for index, gsuite_id, first_name, last_name, email, current in [
+            person(1), person(2, first_name='Old'), person(3),
+            person(4, current=False)
+        ]
+    ])
+    scratch.commit()
+    users = [make_user(1), make_user(2), make_user(5)]
+
+    report = sync(FakeDirectoryService(users, page_size=2), scratch)
+
+    assert (report['users'], report['inserted'], report['updated'],
+            report['deleted']) == (3, 1, 1, 1)
+    rows = {
+        e.email: (e.first_name, e.current_employee_flag)
+        for e in scratch.query(Employee)
+    }
+    assert rows == {
+        'user1@example.com': ('First1', True),
+        'user2@example.com': ('First2', True),
+        'user3@example.com': ('First3', False),
+        'user4@example.com': ('First4', False),
+        'user5@example.com': ('First5', True),
+    }
+    assert sync(FakeDirectoryService(users), scratch)['updated'] == 0
+
+
+def test_sync_refreshes_changed_documents_only(scratch):
+    scratch.bulk_insert_mappings(Employee, [
+        dict(person_id=index, gsuite_id=gsuite_id, first_name=first_name,
+             last_name=last_name, email=email)
+        for index, gsuite_id, first_name, last_name, email, _ in
+        [person(1, first_name='Old'), person(2)]
+    ])
+    search.refresh(scratch, Employee)
+    scratch.execute(t_employee_search_document.update().where(
+        t_employee_search_document.c.person_id == 2).values(document='stale'))
+    scratch.commit()
+
+    sync(FakeDirectoryService([make_user(1), make_user(2), make_user(3)]),
+         scratch)
+
+    documents = dict(
+        scratch.query(t_employee_search_document.c.person_id,
+                      t_employee_search_document.c.document))
+    assert 'first1' in documents[1].lower()
+    assert documents[2] == 'stale'
+    inserted = scratch.query(Employee.person_id).filter_by(
+        email='user3@example.com').scalar()
+    assert 'user3@example.com' in documents[inserted]
@@ -0,0 +1,112 @@
+""" ID token signing keys and the login callback.
+"""
+import base64
+import json
+
+import pytest
+import requests
+
+import admin_app
+import id_tokens
+
+KEY = {
+    'kty': 'RSA',
+    'kid': 'one',
+    'use': 'sig',
+    'n': 'sXchDaQebHnPiGvyDOAT4saGEUetSyo9MKLOoWFsueri23bOdgWp4Dy1Wl'
+    'UzewbgBHod5pcM9H95GQRV3JDXboIRROSBigeC5yjU1hGzHHyXss8UDpre'
+    'cbAYxknTcQkhslANGRUZmdTOQ5qTRsLAt6BTYuyvVRdhS8exSZEy_c4gs_'
+    '7svlJJQ4H9_NxsiIoLwAEk7-Q3UXERGYw_75IDrGA84-lA_-Ct4eTlXHBI'
+    'Y2EaV7t7LjJaynVJCpkv4LKjTTAumiGUIuQhrNhZLuF_RJLqHpM2kgWFLU'
+    '7-VTdL1VbC2tejvcI2BlMkEpk1BzBZI0KQB0GaDWFLN-aEAw3vRw',
+    'e': 'AQAB',
+}
+
+
+class FlakyKeySet(id_tokens.KeySet):
+    """ KeySet whose JWKS fetch fails while `down` is set
+    """
+
+    def __init__(self, ttl=None):
+        super().__init__('https://auth0.invalid/.well-known/jwks.json', ttl)
+        self.down = False
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        if self.down:
+            raise requests.ConnectionError('JWKS unreachable')
+        return [KEY]
+
+
+def test_keys_kept_while_jwks_is_down():
+    keys = FlakyKeySet(ttl=0)
+    assert keys.get('one') is not None
+
+    keys.down = True
+    assert keys.get('one') is not None
+    assert keys.get('one') is not None
+    # retried no more than every JWKS_MIN_REFRESH seconds
+    assert keys.fetches == 2
+
+
+def test_no_keys_fetched_yet():
+    keys = FlakyKeySet()
+    keys.down = True
+
+    with pytest.raises(id_tokens.KeysUnavailable):
+        keys.get('one')
+
+
+def unverified_token(kid):
+    def part(value):
+        text = json.dumps(value).encode('utf-8')
+        return base64.urlsafe_b64encode(text).decode('ascii').rstrip('=')
+
+    return '.'.join([part(dict(alg='RS256', kid=kid)), part({}), 'c2ln'])
+
+
+class FakeAuth0():
+    exchanged = 0
+
+    def authorize_access_token(self):
+        FakeAuth0.exchanged += 1
+        return dict(id_token=unverified_token('one'))
+
+
+def callback(app, nonce):
+    client = app.test_client()
+    if nonce:
+        with client.session_transaction() as browser:
+            browser['nonce'] = nonce
+    return client.get('/callback?code=x&state=y')
+
+
+def test_login_fails_cleanly_without_keys(app, monkeypatch):
+    keys = FlakyKeySet()
+    keys.down = True
+    monkeypatch.setitem(app.extensions, 'auth0_keys', keys)
+    monkeypatch.setattr(admin_app, 'auth0', FakeAuth0)
+
+    response = callback(app, 'abc')
+
+    assert response.status_code == 503
+    assert b'Login unavailable' in response.data
+
+
+def test_login_refused_without_session_nonce(app, monkeypatch):
+    monkeypatch.setitem(app.extensions, 'auth0_keys', FlakyKeySet())
+    monkeypatch.setattr(admin_app, 'auth0', FakeAuth0)
+    monkeypatch.setattr(FakeAuth0, 'exchanged', 0)
+
+    response = callback(app, None)
+
+    assert response.status_code == 400
+    assert b'Access denied' in response.data
+    assert FakeAuth0.exchanged == 0
+
+
+def test_verify_needs_a_nonce():
+    with pytest.raises(id_tokens.InvalidIDToken):
+        id_tokens.verify(unverified_token('one'), FlakyKeySet(),
+                         'https://auth0.invalid/', 'client', None)
@@ -0,0 +1,42 @@
+""" Keyset pagination cursors.
+"""
+import re
+
+import pytest
+
+from keyset_pagination import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize('values', [
+    ['Acme', 1],
+    [1.5, None],
+    ['2018-01-01 00:00:00', 7],
+])
+def test_cursor_round_trip(values):
+    assert decode_cursor(encode_cursor(values)) == values
+
+
+@pytest.mark.parametrize('cursor', [
+    'W3t9LDFd',  # [{},1]
+    encode_cursor([[1], 1]),
+    encode_cursor(['Acme']),
+    encode_cursor(dict(a=1)),
+    'not base64!',
+    encode_cursor('Acme')[:-2],
+])
+def test_tampered_cursor_rejected(client, cursor):
+    assert decode_cursor(cursor) is None
+    for direction in ('after', 'before'):
+        response = client.get('/admin/client/?{0}={1}'.format(
+            direction, cursor))
+        assert response.status_code == 400
+
+
+def test_pager_cursor(client):
+    first = client.get('/admin/client/').get_data(as_text=True)
+    cursor = re.search(r'after=([\w-]+)', first).group(1)
+
+    assert decode_cursor(cursor) is not None
+    second = client.get('/admin/client/?page=1&after=' + cursor)
+    assert second.status_code == 200
+    assert second.get_data(as_text=True) != first
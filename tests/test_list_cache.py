@@ -0,0 +1,118 @@
+""" Cached list pages.
+"""
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from flask import session
+
+import list_cache
+from models import Product
+
+URL = '/admin/client/?flt0_0=1'
+
+
+def served(client, url=URL):
+    """ (hits, stores) added by getting `url`
+    """
+    before = list_cache.cache.snapshot()
+    response = client.get(url)
+    assert response.status_code == 200
+    after = list_cache.cache.snapshot()
+    return after['hits'] - before['hits'], after['stores'] - before['stores']
+
+
+@pytest.fixture
+def cold(client):
+    list_cache.cache.clear()
+    yield client
+    list_cache.cache.clear()
+
+
+@pytest.fixture
+def edited_elsewhere(engine):
+    """ Stamps a product as another process editing it would, and puts the
+        stamp back afterwards; call with the product id
+    """
+    table = Product.__table__
+    key = table.c.product_type_id
+    restore = []
+
+    def edit(product_id):
+        old = engine.execute(
+            table.select().where(key == product_id)).first().modified_datetime
+        restore.append((product_id, old))
+        engine.execute(table.update().where(key == product_id).values(
+            modified_datetime=datetime.now() + timedelta(days=1)))
+
+    yield edit
+    for product_id, old in restore:
+        engine.execute(table.update().where(key == product_id).values(
+            modified_datetime=old))
+
+
+def test_other_processes_edits_miss(cold, engine, edited_elsewhere):
+    assert served(cold) == (0, 1)
+    assert served(cold) == (1, 0)
+
+    product_id = engine.execute(
+        Product.__table__.select().limit(1)).first().product_type_id
+    edited_elsewhere(product_id)
+
+    assert served(cold) == (0, 1)
+    assert served(cold) == (1, 0)
+
+
+def test_repeat_request_is_a_hit(cold):
+    assert served(cold) == (0, 1)
+    # same arguments in another order, with an empty one
+    assert served(cold, '/admin/client/?search=&flt0_0=1') == (1, 0)
+
+
+def test_flashed_messages_bypass_cache(cold):
+    served(cold)
+    with cold.session_transaction() as browser:
+        browser['_flashes'] = [('message', 'Saved')]
+    bypasses = list_cache.cache.snapshot()['bypasses']
+
+    assert served(cold) == (0, 0)
+    assert list_cache.cache.snapshot()['bypasses'] == bypasses + 1
+
+
+def test_page_changing_session_not_stored(cold, views, monkeypatch):
+    view = views['ClientAdmin']
+    get_list = view.get_list
+
+    def touching_get_list(*args, **kwargs):
+        session['seen'] = True
+        return get_list(*args, **kwargs)
+
+    monkeypatch.setattr(view, 'get_list', touching_get_list)
+
+    assert served(cold) == (0, 0)
+    assert served(cold) == (0, 0)
+
+
+def test_least_recently_used_evicted():
+    page = 'x' * 100
+    size = sys.getsizeof('a') + sys.getsizeof(page)
+    cache = list_cache.PageCache(max_bytes=size * 4, ttl=60)
+    for key in 'abcd':
+        cache.put(key, page)
+    cache.get('a')
+
+    cache.put('e', page)
+
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in 'acde'] == [page] * 4
+    assert cache.snapshot()['evictions'] == 1
+    assert cache.bytes == size * 4
+
+
+def test_oversized_page_not_stored():
+    cache = list_cache.PageCache(max_bytes=400, ttl=60)
+
+    cache.put('a', 'x' * 200)
+
+    assert cache.get('a') is None
+    assert cache.snapshot()['oversized'] == 1
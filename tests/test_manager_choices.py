@@ -0,0 +1,71 @@
+""" The employee list's manager choices endpoint.
+"""
+import pytest
+
+from models import Employee
+
+URL = '/admin/employee/ajax/managers/'
+
+
+def test_choices_with_etag(client):
+    response = client.get(URL)
+
+    assert response.status_code == 200
+    assert response.headers['ETag']
+    assert 'no-cache' in response.headers['Cache-Control']
+    assert 'private' in response.headers['Cache-Control']
+    assert response.get_json()[0] == dict(value='__None', text='')
+
+
+def test_unchanged_choices_are_304(client):
+    etag = client.get(URL).headers['ETag']
+
+    response = client.get(URL, headers={'If-None-Match': etag})
+
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+@pytest.fixture
+def reassigned(client, engine):
+    """ Moves someone under a new manager, through the list's editable
+        manager column; puts everything back afterwards
+    """
+    table = Employee.__table__
+    person = table.c.person_id
+    managers = {
+        manager for manager, in engine.execute(
+            table.select().with_only_columns([table.c.manager_person_id]))
+        if manager is not None
+    }
+    person_id, manager_id, modified, modified_by = engine.execute(
+        table.select().with_only_columns([
+            person, table.c.manager_person_id, table.c.modified_datetime,
+            table.c.modified_by
+        ]).where(table.c.manager_person_id.isnot(None)).order_by(
+            person.desc()).limit(1)).first()
+    # nobody reports to them yet, and they are outside the mover's subtree
+    new_id = engine.execute(
+        table.select().with_only_columns([person]).where(
+            person.notin_(managers | {person_id})).order_by(person).limit(
+                1)).scalar()
+
+    def move(to):
+        response = client.post('/admin/employee/ajax/update/', data=dict(
+            list_form_pk=person_id, manager=to))
+        assert response.status_code == 200, response.data
+
+    yield lambda: move(new_id)
+    move(manager_id)
+    engine.execute(table.update().where(person == person_id).values(
+        modified_datetime=modified, modified_by=modified_by))
+
+
+def test_edit_changes_etag(client, reassigned):
+    etag = client.get(URL).headers['ETag']
+
+    reassigned()
+
+    response = client.get(URL, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
@@ -0,0 +1,21 @@
+""" Per-request SQL timing.
+"""
+import pytest
+from flask import g
+from sqlalchemy.exc import OperationalError
+
+import metrics
+
+
+def test_failed_statement_leaves_no_timing(app, engine):
+    with app.test_request_context('/'), engine.connect() as conn:
+        g.request_sql = metrics.RequestSQL()
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                conn.execute('SELECT * FROM no_such_table')
+        conn.execute('SELECT 1')
+
+        assert g.request_sql.queries == 1
+        assert g.request_sql.slowest[0][1] == 'SELECT 1'
+        # nothing kept on the pooled connection
+        assert not conn.info.get('metrics_started')
@@ -0,0 +1,63 @@
+""" Migrations bring a database created before them up to the models, once.
+"""
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+import migrations
+from benchmarks import datagen
+from models import (Client, t_lead_workload, t_person_closure,
+                    t_schema_migration, t_web_session)
+
+# created by migrations rather than with the original schema
+LATER_TABLES = [
+    t_person_closure, t_lead_workload, t_web_session, t_schema_migration
+]
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    """ Engine on a small seeded database without the migrated tables
+    """
+    engine = create_engine('sqlite:///{0}'.format(tmp_path / 'migrate.db'))
+    datagen.create_schema(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        datagen.generate(session, clients_count=20, employees_count=10,
+                         products_count=10, offices_count=1)
+    finally:
+        session.close()
+    for table in LATER_TABLES:
+        table.drop(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_migrate_applies_each_once(scratch):
+    assert migrations.migrate(scratch) == [
+        migration.name for migration in migrations.MIGRATIONS
+    ]
+    assert migrations.migrate(scratch) == []
+
+    tables = inspect(scratch).get_table_names()
+    assert all(table.name in tables for table in LATER_TABLES)
+    assert scratch.execute(t_person_closure.count()).scalar() > 0
+    assert sorted(migrations.applied(scratch)) == [
+        migration.name for migration in migrations.MIGRATIONS
+    ]
+
+
+def test_duplicate_client_codes_stop_migration(scratch):
+    table = Client.__table__
+    # as before the unique index
+    scratch.execute('DROP INDEX client_organization_code_key')
+    scratch.execute(table.update().values(
+        client_organization_code='AC2018-001'))
+
+    with pytest.raises(migrations.MigrationError) as raised:
+        migrations.migrate(scratch)
+
+    assert 'client_codes.py --revalidate' in str(raised.value)
+    # the migrations before it stay applied
+    assert '0008_person_prefix_indexes' in migrations.applied(scratch)
+    assert '0009_client_code_key' not in migrations.applied(scratch)
@@ -0,0 +1,23 @@
+""" Org chart closure table.
+"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import org_chart
+
+
+def test_missing_closure_checked_again(tmp_path, monkeypatch):
+    engine = create_engine('sqlite:///{0}'.format(tmp_path / 'org.db'))
+    session = Session(bind=engine)
+
+    assert not org_chart.is_installed(session)
+    org_chart.closure.create(engine)
+    assert not org_chart.is_installed(session)
+    monkeypatch.setattr(org_chart, 'INSTALLED_RECHECK', 0)
+    assert org_chart.is_installed(session)
+
+    # found once, it isn't checked again
+    org_chart.closure.drop(engine)
+    assert org_chart.is_installed(session)
+    session.close()
+    engine.dispose()
@@ -0,0 +1,84 @@
+""" List views stay within their query budgets once caches are warm, and
+    cache loads on a cold start are counted apart.
+"""
+import pytest
+from flask import session
+
+import filter_options
+import list_cache
+import org_chart
+import search
+import table_versions
+from query_budget import QueryBudgetExceeded, query_budget
+
+CLIENT_URLS = [
+    '/admin/client/',
+    '/admin/client/?flt0_0=1',
+    '/admin/client/?flt0_9=3',
+    '/admin/client/?flt0_13=1,2',
+    '/admin/client/?search=acme',
+]
+EMPLOYEE_URLS = [
+    '/admin/employee/',
+    '/admin/employee/?search=a',
+]
+
+
+def render(app, view, url):
+    """ Render the list page, bypassing the page cache; returns the
+        QueryCount
+    """
+    list_cache.cache.clear()
+    with app.test_request_context(url):
+        session['profile'] = dict(email='test@oao.co')
+        with query_budget(view.list_query_budget, url) as count:
+            page = view.index_view()
+    assert isinstance(page, str), page
+    return count
+
+
+def chill():
+    """ Empty the per-process caches a list page fills
+    """
+    filter_options.invalidate()
+    search._installed.clear()
+    org_chart._installed.clear()
+    table_versions.bump('person', 'client_organization')
+
+
+@pytest.mark.parametrize('name, url',
+                         [('ClientAdmin', url) for url in CLIENT_URLS] +
+                         [('EmployeeAdmin', url) for url in EMPLOYEE_URLS])
+def test_warm_list_within_budget(app, views, name, url):
+    view = views[name]
+    chill()
+    cold = render(app, view, url)
+    warm = render(app, view, url)
+
+    assert cold.cold_queries > 0
+    assert warm.cold_queries == 0
+    assert cold.queries == warm.queries <= view.list_query_budget
+
+
+def test_plain_lists_are_tight(app, views):
+    render(app, views['ClientAdmin'], '/admin/client/')
+    render(app, views['EmployeeAdmin'], '/admin/employee/')
+
+    # list cache versions, count and page
+    assert render(app, views['ClientAdmin'], '/admin/client/').queries == 3
+    # list cache versions and page, the count is cached
+    assert render(app, views['EmployeeAdmin'],
+                  '/admin/employee/').queries == 2
+
+
+@pytest.mark.parametrize('name, url', [('ClientAdmin', '/admin/client/'),
+                                       ('EmployeeAdmin', '/admin/employee/')])
+def test_lazy_loads_exceed_budget(app, views, monkeypatch, name, url):
+    view = views[name]
+    render(app, view, url)
+    # lazy loads of the rows' related objects, one query each
+    monkeypatch.setattr(view, 'column_eager_load', {})
+    monkeypatch.setattr(view, '_auto_joins', [])
+
+    with pytest.raises(QueryBudgetExceeded):
+        render(app, view, url)
@@ -0,0 +1,27 @@
+""" The hot queries have plans that don't scan whole tables; Postgres only,
+    as SQLite's plans don't say enough.
+"""
+import os
+
+import pytest
+
+from benchmarks.query_plans import explain, hot_queries
+
+pytestmark = pytest.mark.skipif(
+    not os.getenv('TEST_DATABASE_URL', '').startswith('postgres'),
+    reason='query plans are checked on Postgres (TEST_DATABASE_URL)')
+
+
+def test_hot_queries_use_indexes(engine, session):
+    scanned = {}
+    connection = engine.raw_connection()
+    try:
+        for name, query in hot_queries(session):
+            plan, scans = explain(connection, engine.dialect, query)
+            connection.rollback()
+            if scans:
+                scanned[name] = scans
+    finally:
+        connection.close()
+
+    assert scanned == {}
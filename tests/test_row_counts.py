@@ -0,0 +1,27 @@
+""" List counts.
+"""
+import re
+
+import list_cache
+from row_counts import freeze
+
+
+def test_freeze_nested_lists():
+    key = freeze([(13, 'Products', [1, 2]), (0, 'Active', '1')])
+
+    assert key == ((13, 'Products', (1, 2)), (0, 'Active', '1'))
+    assert hash(key)
+
+
+def test_cached_count_with_multi_value_filter(client, views, monkeypatch):
+    counts = []
+    for strategy in ('exact', 'cached', 'cached'):
+        list_cache.cache.clear()
+        monkeypatch.setattr(views['ClientAdmin'], 'count_strategy', strategy)
+        response = client.get('/admin/client/?flt0_13=1,2')
+        assert response.status_code == 200
+        counts.append(
+            re.search(r'List \((\d+)\)', response.get_data(as_text=True))
+            .group(1))
+
+    assert counts[0] == counts[1] == counts[2]
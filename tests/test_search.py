@@ -0,0 +1,23 @@
+""" Search documents.
+"""
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import search
+
+
+def test_missing_tables_checked_again(tmp_path, monkeypatch):
+    engine = create_engine('sqlite:///{0}'.format(tmp_path / 'search.db'))
+    session = Session(bind=engine)
+
+    assert not search.is_installed(session)
+    search.create_schema(engine)
+    assert not search.is_installed(session)
+    monkeypatch.setattr(search, 'INSTALLED_RECHECK', 0)
+    assert search.is_installed(session)
+
+    # found once, they aren't checked again
+    search.metadata.drop_all(engine)
+    assert search.is_installed(session)
+    session.close()
+    engine.dispose()
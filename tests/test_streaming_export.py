@@ -0,0 +1,65 @@
+""" CSV and NDJSON exports of the filtered and searched list.
+"""
+import csv
+import io
+import json
+import re
+
+import pytest
+
+import list_cache
+from models import Client, Employee
+
+
+def export(client, view, export_type, query_string):
+    response = client.get('/admin/{0}/export/{1}/?{2}'.format(
+        view, export_type, query_string))
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    if export_type == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def listed_count(client, view, query_string):
+    list_cache.cache.clear()
+    response = client.get('/admin/{0}/?{1}'.format(view, query_string))
+    return int(
+        re.search(r'List \((\d+)\)', response.get_data(as_text=True))
+        .group(1))
+
+
+def test_csv_export_of_filtered_clients(client, session):
+    rows = export(client, 'client', 'csv', 'flt0_0=1')
+
+    active = session.query(Client.client_organization_name).filter(
+        Client.active_client_flag.is_(True))
+    assert sorted(row['Client'] for row in rows) == sorted(
+        name for name, in active)
+    assert rows == sorted(rows, key=lambda row: row['Client'])
+
+
+@pytest.mark.parametrize('query_string',
+                         ['search=acme', 'search=acme&flt0_0=1'])
+def test_ndjson_matches_csv_and_list(client, views, monkeypatch,
+                                     query_string):
+    monkeypatch.setattr(views['ClientAdmin'], 'count_strategy', 'exact')
+    csv_rows = export(client, 'client', 'csv', query_string)
+    ndjson_rows = export(client, 'client', 'ndjson', query_string)
+
+    assert len(csv_rows) == listed_count(client, 'client', query_string) > 0
+    assert [row['client_organization_name'] for row in ndjson_rows] == [
+        row['Client'] for row in csv_rows
+    ]
+    assert [str(row['dfp_network_code']) for row in ndjson_rows] == [
+        row['DFP Network'] for row in csv_rows
+    ]
+
+
+def test_ndjson_export_of_searched_employees(client, session):
+    rows = export(client, 'employee', 'ndjson', 'search=user1')
+
+    emails = session.query(Employee.email).filter(
+        Employee.email.like('user1%'))
+    assert sorted(row['email'] for row in rows) == sorted(
+        email for email, in emails)
@@ -0,0 +1,95 @@
+""" Typeahead pickers on the admin forms.
+"""
+from html.parser import HTMLParser
+
+import pytest
+
+from models import Client, Employee
+
+
+class FormFields(HTMLParser):
+    """ Submitted values of the inputs, selects and textareas in a page
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.data = {}
+        self._textarea = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        name = attrs.get('name')
+        if tag == 'input' and name and attrs.get('type') != 'submit':
+            if attrs.get('type') != 'checkbox' or 'checked' in attrs:
+                self.data[name] = attrs.get('value') or ''
+        elif tag == 'textarea' and name:
+            self._textarea = name
+            self.data[name] = ''
+
+    def handle_data(self, data):
+        if self._textarea:
+            self.data[self._textarea] += data
+
+    def handle_endtag(self, tag):
+        if tag == 'textarea':
+            self._textarea = None
+
+
+def edit_form(client, url):
+    parser = FormFields()
+    parser.feed(client.get(url).get_data(as_text=True))
+    return parser.data
+
+
+@pytest.fixture
+def people(session):
+    """ (current lead id, current non-lead id, client id with a lead)
+    """
+    lead = session.query(Employee.person_id).filter(
+        Employee.account_manager_flag.is_(True),
+        Employee.current_employee_flag.is_(True)).order_by(
+            Employee.person_id).limit(1).scalar()
+    other = session.query(Employee.person_id).filter(
+        Employee.account_manager_flag.isnot(True),
+        Employee.current_employee_flag.is_(True)).order_by(
+            Employee.person_id).limit(1).scalar()
+    client_id = session.query(Client.client_organization_id).filter(
+        Client.account_manager_id.isnot(None)).order_by(
+            Client.client_organization_id).limit(1).scalar()
+    return lead, other, client_id
+
+
+def test_lookup_offers_current_leads_only(client, people):
+    lead, other, _ = people
+    response = client.get(
+        '/admin/client/ajax/lookup/?name=account_manager&query=')
+
+    ids = [key for key, _ in response.get_json()]
+    assert lead in ids and other not in ids
+
+
+def test_edit_rejects_non_lead(client, session, people):
+    lead, other, client_id = people
+    url = '/admin/client/edit/?id={0}'.format(client_id)
+    before = session.query(Client.account_manager_id).filter_by(
+        client_organization_id=client_id).scalar()
+
+    form = edit_form(client, url)
+    form['account_manager'] = str(other)
+    response = client.post(url, data=form)
+
+    assert response.status_code == 200
+    assert 'Not a valid choice' in response.get_data(as_text=True)
+    assert session.query(Client.account_manager_id).filter_by(
+        client_organization_id=client_id).scalar() == before
+
+
+def test_edit_accepts_lead(client, people):
+    lead, _, client_id = people
+    url = '/admin/client/edit/?id={0}'.format(client_id)
+
+    form = edit_form(client, url)
+    form['account_manager'] = str(lead)
+    response = client.post(url, data=form)
+
+    assert response.status_code == 302
@@ -0,0 +1,135 @@
+""" Account lead workload summaries.
+"""
+from collections import Counter
+
+import pytest
+from flask import session as browser
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+import bulk_actions
+import workload
+from models import Client, Employee, t_client_product_association
+
+USER = 'test@oao.co'
+
+
+@pytest.fixture
+def clients_view(app, views):
+    """ ClientAdmin, whose session is rolled back after the test
+    """
+    view = views['ClientAdmin']
+    with app.app_context():
+        yield view
+        view.session.rollback()
+
+
+def summaries(session):
+    """ (workload, product mix) rows as the tables hold them
+    """
+    totals = {
+        person_id: (primary, secondary)
+        for person_id, primary, secondary in session.execute(
+            select([
+                workload.workload.c.person_id,
+                workload.workload.c.primary_clients,
+                workload.workload.c.secondary_clients
+            ]))
+    }
+    mix = {(person_id, product_id): (primary, secondary)
+           for person_id, product_id, primary, secondary in session.execute(
+               select([
+                   workload.mix.c.person_id, workload.mix.c.product_type_id,
+                   workload.mix.c.primary_clients,
+                   workload.mix.c.secondary_clients
+               ]))}
+    return totals, mix
+
+
+def recomputed(session):
+    """ (workload, product mix) rows counted afresh from active clients
+    """
+    association = t_client_product_association
+    products = {}
+    for client_id, product_id in session.query(
+            association.c.client_organization_id,
+            association.c.product_type_id):
+        products.setdefault(client_id, []).append(product_id)
+    totals, mix = Counter(), Counter()
+    clients = session.query(
+        Client.client_organization_id, Client.account_manager_id,
+        Client.secondary_manager_id).filter(
+            Client.active_client_flag.is_(True))
+    for client_id, primary, secondary in clients:
+        for lead, role in ((primary, 0), (secondary, 1)):
+            if lead is None:
+                continue
+            totals[lead, role] += 1
+            for product_id in products.get(client_id, []):
+                mix[lead, product_id, role] += 1
+    return ({
+        lead: (totals[lead, 0], totals[lead, 1])
+        for lead in {lead for lead, _ in totals}
+    }, {
+        (lead, product_id): (mix[lead, product_id, 0],
+                             mix[lead, product_id, 1])
+        for lead, product_id in {key[:2] for key in mix}
+    })
+
+
+def leads(session, count):
+    return [
+        person_id for person_id, in session.query(Employee.person_id).filter(
+            Employee.account_manager_flag.is_(True)).order_by(
+                Employee.person_id).limit(count)
+    ]
+
+
+def test_client_edit_refreshes_both_leads(app, clients_view):
+    session = clients_view.session
+    assert summaries(session) == recomputed(session)
+    client = session.query(Client).filter(
+        Client.active_client_flag.is_(True),
+        Client.account_manager_id.isnot(None)).order_by(
+            Client.client_organization_id).first()
+    new = next(lead for lead in leads(session, 2)
+               if lead != client.account_manager_id)
+
+    client.account_manager = session.query(Employee).get(new)
+    with app.test_request_context():
+        browser['profile'] = dict(email=USER)
+        clients_view.on_model_change(None, client, False)
+
+    assert summaries(session) == recomputed(session)
+
+
+def test_reassignment_refreshes_old_and_new_leads(clients_view):
+    session = clients_view.session
+    old, new = leads(session, 2)
+
+    bulk_actions.reassign_lead(
+        session,
+        session.query(Client.client_organization_id).filter(
+            Client.secondary_manager_id == old), 'secondary', new, USER)
+
+    totals, mix = summaries(session)
+    assert old not in totals or totals[old][1] == 0
+    assert (totals, mix) == recomputed(session)
+
+
+def test_missing_tables_checked_again(tmp_path, monkeypatch):
+    engine = create_engine('sqlite:///{0}'.format(tmp_path / 'lead.db'))
+    session = Session(bind=engine)
+
+    assert not workload.is_installed(session)
+    workload.workload.create(engine)
+    workload.mix.create(engine)
+    assert not workload.is_installed(session)
+    monkeypatch.setattr(workload, 'INSTALLED_RECHECK', 0)
+    assert workload.is_installed(session)
+
+    # found once, they aren't checked again
+    workload.mix.drop(engine)
+    assert workload.is_installed(session)
+    session.close()
+    engine.dispose()
@@ -0,0 +1,155 @@
+""" Typeahead relationship pickers for the admin forms.
+
+    Flask-Admin's form_ajax_refs turn relationship fields into Select2
+    pickers that ask the view's ajax lookup endpoint for matches as the user
+    types, instead of rendering every row as an option. PrefixAjaxModelLoader
+    matches each word typed against the start of the loader's fields,
+    lower-cased, which the person prefix indexes serve on Postgres, applies
+    the loader's `where` criteria and returns at most TYPEAHEAD_LIMIT rows.
+    Submitted ids are checked against the same criteria, so a form can't
+    pick a row the picker wouldn't offer.
+
+    Results are cached per process for TYPEAHEAD_CACHE_TTL seconds, or
+    until this process changes the loader's table. migrations.py creates
+    the prefix indexes.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, abort, request
+from flask_admin import expose
+from flask_admin.helpers import is_form_submitted
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from flask_admin.model.ajax import DEFAULT_PAGE_SIZE
+from flask_admin.model.fields import AjaxSelectField, AjaxSelectMultipleField
+from sqlalchemy import func, or_
+
+import table_versions
+
+TYPEAHEAD_LIMIT = 20
+TYPEAHEAD_CACHE_TTL = int(os.getenv('TYPEAHEAD_CACHE_TTL', 30))
+TYPEAHEAD_CACHE_SIZE = 1000
+
+
+class ResultCache():
+    """ Least recently used cache of lookup results, each kept for `ttl`
+        seconds
+    """
+
+    def __init__(self, size=TYPEAHEAD_CACHE_SIZE, ttl=None):
+        self.size = size
+        self.ttl = TYPEAHEAD_CACHE_TTL if ttl is None else ttl
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None and cached[0] > now:
+                self._results.move_to_end(key)
+                return cached[1]
+        results = loader()
+        with self._lock:
+            self._results[key] = (now + self.ttl, results)
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+        return results
+
+
+cache = ResultCache()
+
+
+def prefix_pattern(word):
+    """ LIKE pattern matching values starting with `word`
+    """
+    for special in ('\\', '%', '_'):
+        word = word.replace(special, '\\' + special)
+    return word + '%'
+
+
+class PrefixAjaxModelLoader(QueryAjaxModelLoader):
+    """ QueryAjaxModelLoader matching on field prefixes, restricted to the
+        SQLAlchemy criteria in the `where` option
+    """
+
+    def __init__(self, name, session, model, **options):
+        super().__init__(name, session, model, **options)
+        self.where = options.get('where', [])
+        self.table = model.__table__.name
+
+    def get_one(self, pk):
+        """ The row with primary key `pk` if it meets `where`, else None
+        """
+        # prevent autoflush from occuring during populate_obj
+        with self.session.no_autoflush:
+            return self.session.query(self.model).filter(
+                getattr(self.model, self.pk) == pk,
+                *self.where).one_or_none()
+
+    def get_list(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        query = self.session.query(self.model).filter(*self.where)
+        for word in (term or '').lower().split():
+            pattern = prefix_pattern(word)
+            query = query.filter(
+                or_(*[
+                    func.lower(field).like(pattern, escape='\\')
+                    for field in self._cached_fields
+                ]))
+        if self.order_by is not None:
+            query = query.order_by(self.order_by)
+        return query.offset(offset or 0).limit(
+            min(limit, TYPEAHEAD_LIMIT)).all()
+
+    def lookup(self, term, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """ (id, label) pairs for get_list, from the cache if possible
+        """
+        key = (self.table, self.name, ' '.join((term or '').lower().split()),
+               offset, limit, table_versions.get(self.table))
+        return cache.get(
+            key, lambda: [
+                self.format(model)
+                for model in self.get_list(term, offset, limit)
+            ])
+
+
+class TypeaheadMixin():
+    """ Serve PrefixAjaxModelLoader lookups from their cache, and reject
+        picker ids their loader doesn't return
+    """
+
+    def validate_form(self, form):
+        valid = super().validate_form(form)
+        if not is_form_submitted():
+            return valid
+        for field in form:
+            # a nullable picker would otherwise quietly be cleared
+            if (isinstance(field, AjaxSelectField)
+                    and not isinstance(field, AjaxSelectMultipleField)
+                    and field.raw_data
+                    and field.raw_data[0] not in ('', '__None')
+                    and field.data is None):
+                field.errors.append(field.gettext('Not a valid choice'))
+                valid = False
+        return valid
+
+    @expose('/ajax/lookup/')
+    def ajax_lookup(self):
+        loader = self._form_ajax_refs.get(request.args.get('name'))
+        if loader is None:
+            abort(404)
+        if not isinstance(loader, PrefixAjaxModelLoader):
+            return super().ajax_lookup()
+        data = loader.lookup(
+            request.args.get('query', ''),
+            request.args.get('offset', 0, type=int),
+            request.args.get('limit', DEFAULT_PAGE_SIZE, type=int))
+        response = Response(json.dumps(data), mimetype='application/json')
+        response.cache_control.private = True
+        response.cache_control.max_age = TYPEAHEAD_CACHE_TTL
+        return response
+
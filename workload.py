@@ -0,0 +1,201 @@
+""" Account lead workload and product mix report.
+
+    How many active clients each account lead carries, as primary and as
+    secondary lead, in total and by product, kept in the lead_workload and
+    lead_product_mix summary tables. Each table is filled by one grouped
+    aggregate over the clients' lead assignments, so the report reads a row
+    per lead and a row per lead and product however many clients there are.
+
+    Leads' rows are refreshed from ClientAdmin's model hooks and the bulk
+    import. migrations.py creates and fills the tables; run
+    `python workload.py` to refresh every lead, e.g. nightly from cron to
+    pick up changes made outside the app.
+    Until the tables exist the report page says so.
+"""
+import time
+
+from sqlalchemy import and_, func, inspect, literal, select, union_all
+from sqlalchemy.orm import sessionmaker
+
+from models import (Client, Employee, Product, engine,
+                    t_client_product_association, t_lead_product_mix,
+                    t_lead_workload)
+
+client = Client.__table__
+person = Employee.__table__
+product = Product.__table__
+association = t_client_product_association
+workload = t_lead_workload
+mix = t_lead_product_mix
+
+INSTALLED_RECHECK = 30
+
+_installed = {}
+
+
+def is_installed(session):
+    """ Whether the summary tables exist; once they do that is remembered
+        per database, until then it is checked again after
+        INSTALLED_RECHECK seconds
+    """
+    bind = session.get_bind()
+    key = str(bind.engine.url)
+    installed, checked = _installed.get(key, (False, None))
+    if not installed and (checked is None or
+                          time.monotonic() - checked >= INSTALLED_RECHECK):
+        names = set(inspect(bind).get_table_names())
+        installed = workload.name in names and mix.name in names
+        _installed[key] = (installed, time.monotonic())
+    return installed
+
+
+def _roles(person_ids=None):
+    """ Select of (client_organization_id, person_id, primary_client,
+        secondary_client) with a row per active client and lead, for leads
+        in `person_ids` if given
+    """
+    selects = []
+    for lead, is_primary in ((client.c.account_manager_id, 1),
+                             (client.c.secondary_manager_id, 0)):
+        criteria = [client.c.active_client_flag.is_(True), lead.isnot(None)]
+        if person_ids is not None:
+            criteria.append(lead.in_(person_ids))
+        selects.append(
+            select([
+                client.c.client_organization_id,
+                lead.label('person_id'),
+                literal(is_primary).label('primary_client'),
+                literal(1 - is_primary).label('secondary_client')
+            ]).where(and_(*criteria)))
+    return union_all(*selects).alias('roles')
+
+
+def refresh(session, person_ids=None):
+    """ Recompute the summary rows of leads whose person_id is in
+        `person_ids`, a list or a query of ids, or of every lead if
+        `person_ids` is None. Runs in the caller's transaction.
+    """
+    if not is_installed(session):
+        return
+    roles = _roles(person_ids)
+    totals = select([
+        roles.c.person_id,
+        func.sum(roles.c.primary_client),
+        func.sum(roles.c.secondary_client),
+        func.now()
+    ]).group_by(roles.c.person_id)
+    by_product = select([
+        roles.c.person_id, association.c.product_type_id,
+        func.sum(roles.c.primary_client),
+        func.sum(roles.c.secondary_client)
+    ]).select_from(
+        roles.join(
+            association, association.c.client_organization_id ==
+            roles.c.client_organization_id)).group_by(
+                roles.c.person_id, association.c.product_type_id)
+
+    for table in (workload, mix):
+        delete = table.delete()
+        if person_ids is not None:
+            delete = delete.where(table.c.person_id.in_(person_ids))
+        session.execute(delete)
+    session.execute(workload.insert().from_select([
+        'person_id', 'primary_clients', 'secondary_clients',
+        'refreshed_datetime'
+    ], totals))
+    session.execute(mix.insert().from_select(
+        ['person_id', 'product_type_id', 'primary_clients',
+         'secondary_clients'], by_product))
+
+
+def client_leads(session, client_ids):
+    """ Query of the primary and secondary lead ids of clients in
+        `client_ids`
+    """
+    return session.query(Client.account_manager_id).filter(
+        Client.client_organization_id.in_(client_ids)).union(
+            session.query(Client.secondary_manager_id).filter(
+                Client.client_organization_id.in_(client_ids)))
+
+
+def changed_leads(client):
+    """ Ids of the leads `client` has, or had before its pending changes
+    """
+    state = inspect(client)
+    ids = set()
+    # forms set the relationships, which only reach the id columns on flush
+    for name in ('account_manager', 'secondary_manager'):
+        ids.update(lead.person_id for lead in state.attrs[name].history.sum()
+                   if lead is not None)
+    for name in ('account_manager_id', 'secondary_manager_id'):
+        ids.update(state.attrs[name].history.sum())
+    ids.discard(None)
+    return sorted(ids)
+
+
+def report(session):
+    """ A dict per lead, most active clients first, with their counts and
+        `products`, a list of (product name, primary, secondary) in the
+        same order; None if the summary tables don't exist
+    """
+    if not is_installed(session):
+        return None
+    total = workload.c.primary_clients + workload.c.secondary_clients
+    leads = session.execute(
+        select([
+            person.c.person_id, person.c.first_name, person.c.last_name,
+            person.c.email, person.c.current_employee_flag,
+            workload.c.primary_clients, workload.c.secondary_clients,
+            workload.c.refreshed_datetime
+        ]).select_from(
+            workload.join(person,
+                          person.c.person_id == workload.c.person_id)).
+        order_by(total.desc(), person.c.email))
+    leads = [dict(lead, products=[]) for lead in leads]
+
+    by_id = {lead['person_id']: lead for lead in leads}
+    rows = session.execute(
+        select([
+            mix.c.person_id, product.c.product_type_name,
+            mix.c.primary_clients, mix.c.secondary_clients
+        ]).select_from(
+            mix.join(product,
+                     product.c.product_type_id == mix.c.product_type_id)).
+        order_by((mix.c.primary_clients + mix.c.secondary_clients).desc(),
+                 product.c.product_type_name))
+    for person_id, name, primary, secondary in rows:
+        if person_id in by_id:
+            by_id[person_id]['products'].append((name, primary, secondary))
+    return leads
+
+
+def matrix(leads):
+    """ CSV rows of the report: a row per lead with their primary and
+        secondary counts and their active clients with each product
+    """
+    names = sorted({name for lead in leads for name, _, _ in lead['products']})
+    yield ['Lead', 'Email', 'Current Employee', 'Primary', 'Secondary'
+           ] + names
+    for lead in leads:
+        counts = {
+            name: primary + secondary
+            for name, primary, secondary in lead['products']
+        }
+        yield [
+            '{0} {1}'.format(lead['first_name'], lead['last_name']),
+            lead['email'], lead['current_employee_flag'],
+            lead['primary_clients'], lead['secondary_clients']
+        ] + [counts.get(name, 0) for name in names]
+
+
+def main():
+    session = sessionmaker(bind=engine)()
+    try:
+        refresh(session)
+        session.commit()
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()